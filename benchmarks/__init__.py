@@ -0,0 +1,34 @@
+"""
+Benchmarks of the service
+
+The benchmarks drop, delete and seed records, so they never read DATABASE_URI:
+they run against BENCH_DATABASE_URI (a temporary SQLite file by default),
+which use_database() sets as the DATABASE_URI of the service before it is
+imported. A database on another host is refused unless --allow-remote is given.
+"""
+import os
+import sys
+import tempfile
+from sqlalchemy.engine.url import make_url
+
+ALLOW_REMOTE = "--allow-remote"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+def is_local(uri):
+    """ Tells whether uri is a SQLite database or one on this host (or its unix socket) """
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" or not url.host or url.host in LOCAL_HOSTS \
+        or url.host.startswith("/")
+
+def use_database(name, argv=None):
+    """ Points the service at BENCH_DATABASE_URI, the temporary SQLite file name by default
+    Exits when it is not local and argv (sys.argv) does not hold --allow-remote
+    """
+    argv = sys.argv if argv is None else argv
+    uri = os.getenv("BENCH_DATABASE_URI") or "sqlite:///{}".format(
+        os.path.join(tempfile.gettempdir(), name))
+    if not is_local(uri) and ALLOW_REMOTE not in argv:
+        sys.exit("BENCH_DATABASE_URI is not a local database, the benchmarks would drop "
+                 "and rewrite its records: pass {} to run against it".format(ALLOW_REMOTE))
+    os.environ["DATABASE_URI"] = uri
+    return uri
@@ -0,0 +1,41 @@
+"""
+Benchmark of the inventory read encoding
+
+Compares the marshalled path (serialize, marshal with inventory_model and
+json.dumps) with the fast encoder over the same records.
+
+    python -m benchmarks.bench_encoder [rows] [repeat]
+"""
+import os
+import sys
+import json
+import timeit
+
+# The records are never saved: an in-memory database, whatever DATABASE_URI is
+os.environ["DATABASE_URI"] = "sqlite://"
+
+from flask_restplus import marshal   # pylint: disable=wrong-import-position
+from service import encoder          # pylint: disable=wrong-import-position
+from service.model import Inventory  # pylint: disable=wrong-import-position
+from service.routes import inventory_model  # pylint: disable=wrong-import-position
+
+def make_records(rows):
+    """ Builds unsaved Inventory records """
+    return [Inventory(product_id=i, condition="new", quantity=i % 500,
+                      restock_level=50, available=i % 2) for i in range(rows)]
+
+def marshalled(records):
+    """ The original flask_restplus path """
+    return json.dumps(marshal([record.serialize() for record in records], inventory_model))
+
+def main(rows=10000, repeat=5):
+    """ Runs both encoders and prints the best time of each """
+    records = make_records(rows)
+    assert json.loads(marshalled(records)) == json.loads(encoder.encode_records(records))
+    for name, func in (("marshal", marshalled), ("encoder", encoder.encode_records)):
+        best = min(timeit.repeat(lambda: func(records), number=1, repeat=repeat))
+        print("{:<8} {:>8} rows {:>9.1f} ms {:>10.0f} rows/s".format(
+            name, rows, best * 1000, rows / best))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,74 @@
+"""
+Benchmark of the read-only row path against ORM instances
+
+Loads the whole table once as ORM Inventory instances (the find_all path) and
+once as InventoryRow records (select_rows / fetch_rows), reporting the time
+and the memory held by the results of each.
+
+    python -m benchmarks.bench_read_path [rows] [--allow-remote]
+
+BENCH_DATABASE_URI defaults to a temporary SQLite file, whose inventory table is
+emptied and filled with the requested number of rows (1,000,000 by default)
+when it holds a different count.
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks import ALLOW_REMOTE, use_database
+
+use_database("bench_inventory.db")
+
+from service import app, routes          # pylint: disable=wrong-import-position
+from service.model import DB, Inventory  # pylint: disable=wrong-import-position
+
+def fill(rows):
+    """ Makes the table hold exactly rows records """
+    if Inventory.query.count() == rows:
+        return
+    table = Inventory.__table__
+    DB.session.execute(table.delete())
+    for start in range(0, rows, 100000):
+        DB.session.execute(table.insert(), [
+            {"product_id": i, "condition": "new", "quantity": i % 500,
+             "restock_level": 50, "available": i % 2}
+            for i in range(start, min(rows, start + 100000))])
+    DB.session.commit()
+
+def orm_read():
+    """ ORM instances, tracked by the session """
+    return Inventory.query.all()
+
+def row_read():
+    """ Read-only rows """
+    return Inventory.fetch_rows(Inventory.select_rows())
+
+def measure(func):
+    """ Returns the seconds taken and the MiB held by the result of func """
+    DB.session.remove()
+    start = time.perf_counter()
+    records = func()
+    seconds = time.perf_counter() - start
+    count = len(records)
+    del records
+    DB.session.remove()
+    # Memory is measured on a separate run, tracemalloc slows the allocations down
+    tracemalloc.start()
+    records = func()
+    held = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    del records
+    return count, seconds, held
+
+def main(rows=1000000):
+    """ Runs both read paths and prints their cost """
+    routes.init_db()
+    fill(rows)
+    for name, func in (("orm", orm_read), ("rows", row_read)):
+        count, seconds, held = measure(func)
+        print("{:<5} {:>9} rows {:>8.2f} s {:>9.1f} MiB {:>8.0f} bytes/row".format(
+            name, count, seconds, held, held * 2 ** 20 / max(count, 1)))
+
+if __name__ == "__main__":
+    with app.app_context():
+        main(*[int(arg) for arg in sys.argv[1:] if arg != ALLOW_REMOTE][:1])
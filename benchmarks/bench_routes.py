@@ -0,0 +1,233 @@
+"""
+Benchmark suite of the API endpoints
+
+Seeds the inventory table with each of the requested sizes and times every
+route of service/routes.py through the WSGI test client, reporting the
+throughput and the p50/p99 latency of each. The results are written as JSON
+and compared with a stored baseline: any route slower than the baseline by
+more than the tolerance is reported and the run exits with status 1.
+
+    python -m benchmarks.bench_routes [--sizes 10000,100000,1000000] [--requests 200]
+        [--output bench_routes.json] [--baseline benchmarks/baseline.json]
+        [--tolerance 0.5] [--save-baseline] [--allow-remote]
+
+The tables of BENCH_DATABASE_URI (a temporary SQLite file by default) are
+dropped and recreated for each size: point it at a local PostgreSQL to measure
+the production path, never at a database whose records matter. The baseline is only meaningful on
+the machine and database it was recorded on: record one with --save-baseline
+before comparing.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+from benchmarks import ALLOW_REMOTE, use_database
+
+use_database("bench_routes.db")
+
+# pylint: disable=wrong-import-position
+from service import app, routes, keys
+from service.model import DB, CACHE, Inventory, InventorySummary
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SEED_CHUNK = 50000
+BULK_SIZE = 100
+# Absolute slow downs below this many milliseconds are noise, not regressions
+MIN_DELTA_MS = 0.5
+
+def condition(pid):
+    """ The condition of the seeded record pid (one record per product) """
+    return keys.CONDITIONS[pid % len(keys.CONDITIONS)]
+
+def record(pid):
+    """ The seeded values of the record pid, a fifth of them below their restock level """
+    return {keys.KEY_PID: pid, keys.KEY_CND: condition(pid), keys.KEY_QTY: pid % 25,
+            keys.KEY_LVL: 5, keys.KEY_AVL: pid % 2}
+
+def seed(size):
+    """ Recreates the tables holding size records and their summary """
+    DB.session.remove()
+    DB.drop_all()
+    DB.create_all()
+    table = Inventory.__table__
+    for start in range(0, size, SEED_CHUNK):
+        DB.session.execute(table.insert(), [record(pid)
+                                            for pid in range(start, min(size, start + SEED_CHUNK))])
+        DB.session.commit()
+    InventorySummary.rebuild()
+    DB.session.execute("ANALYZE")
+    DB.session.commit()
+    DB.session.remove()
+    CACHE.clear()
+
+def item_url(pid, suffix=""):
+    """ The URL of the record pid """
+    return "/api/inventory/{}/condition/{}{}".format(pid, condition(pid), suffix)
+
+def scenarios(size, requests):
+    """ Returns (name, repeat, request builder) for every route
+    The export and the bulk routes (BULK_SIZE records each) run fewer requests.
+    A builder takes the request number and returns (method, url, json body, expected status).
+    The writes use their own keys: above size for the created records, and
+    rotating over the seeded records for the updates and the restocks
+    """
+    def pick(i):
+        return random.randrange(size)
+    created, bulk = size + 1000000, size + 2000000
+    few = max(3, requests // 10)
+
+    def bulk_keys(i):
+        return [{keys.KEY_PID: bulk + i * BULK_SIZE + j, keys.KEY_CND: "new"}
+                for j in range(BULK_SIZE)]
+    return [
+        ("index", None, lambda i: ("GET", "/", None, 200)),
+        ("list", None, lambda i: ("GET", "/api/inventory?limit=100", None, 200)),
+        ("list_filtered", None, lambda i: ("GET", "/api/inventory?condition=new&quantity_max=10"
+                                           "&available=1&limit=100", None, 200)),
+        ("low_stock", None, lambda i: ("GET", "/api/inventory/low-stock?limit=100", None, 200)),
+        ("summary", None, lambda i: ("GET", "/api/inventory/summary", None, 200)),
+        ("cache", None, lambda i: ("GET", "/api/inventory/cache", None, 200)),
+        ("pool", None, lambda i: ("GET", "/api/inventory/pool", None, 200)),
+        ("metrics", None, lambda i: ("GET", "/metrics", None, 200)),
+        ("events", None, lambda i: ("GET", "/api/inventory/events", None, 200)),
+        ("export", 3, lambda i: ("GET", "/api/inventory/export", None, 200)),
+        ("get", None, lambda i: ("GET", item_url(pick(i)), None, 200)),
+        ("create", None, lambda i: ("POST", "/api/inventory", dict(
+            record(created + i), condition="new"), 201)),
+        ("delete", None, lambda i: (
+            "DELETE", "/api/inventory/{}/condition/new".format(created + i), None, 204)),
+        ("update", None, lambda i: ("PUT", item_url(i % size),
+                                    {keys.KEY_QTY: (i % 40) + 1}, 200)),
+        ("restock", None, lambda i: ("PUT", item_url((i * 7) % size, "/restock"),
+                                     {keys.KEY_AMT: 1}, 200)),
+        ("activate", None, lambda i: ("PUT", item_url((i * 11) % size, "/activate"), None, 200)),
+        ("deactivate", None, lambda i: ("PUT", item_url((i * 13) % size, "/deactivate"),
+                                        None, 200)),
+        ("bulk_create", few, lambda i: ("POST", "/api/inventory/bulk", [
+            dict(record(key[keys.KEY_PID]), condition="new") for key in bulk_keys(i)], 201)),
+        ("bulk_restock", few, lambda i: ("PUT", "/api/inventory/restock", [
+            {keys.KEY_PID: pid, keys.KEY_CND: condition(pid), keys.KEY_AMT: 1}
+            for pid in range((i * BULK_SIZE) % size, (i * BULK_SIZE) % size + BULK_SIZE)
+            if pid < size], None)),
+        ("bulk_delete", few, lambda i: ("DELETE", "/api/inventory/bulk", bulk_keys(i), 200)),
+        # Last, as it removes seeded records
+        ("delete_filtered", None, lambda i: (
+            "DELETE", "/api/inventory?product_id={}".format(pick(i)), None, 200)),
+    ]
+
+def percentile(values, share):
+    """ The nearest-rank percentile of sorted values """
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+def run(client, build, repeat):
+    """ Times repeat requests, returns their statistics """
+    timings, errors = [], 0
+    started = time.perf_counter()
+    for i in range(repeat):
+        method, url, body, expected = build(i)
+        start = time.perf_counter()
+        resp = client.open(url, method=method, json=body)
+        resp.get_data()  # consume streamed bodies
+        timings.append(time.perf_counter() - start)
+        if resp.status_code >= 400 or (expected and resp.status_code != expected):
+            errors += 1
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {"requests": repeat, "errors": errors, "rps": round(repeat / elapsed, 1),
+            "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(timings, 0.99) * 1000, 3)}
+
+def compare(results, baseline, tolerance):
+    """ Returns the regressions of results against the baseline results """
+    regressions = []
+    for size, routes_ in results.items():
+        for name, stats in routes_.items():
+            old = baseline.get(size, {}).get(name)
+            if not old:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                if stats[key] > old[key] * (1 + tolerance) and \
+                        stats[key] - old[key] > MIN_DELTA_MS:
+                    regressions.append("{} rows {}: {} {} ms (baseline {} ms)".format(
+                        size, name, key, stats[key], old[key]))
+    return regressions
+
+def git_commit():
+    """ The commit being measured, when run from a checkout """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)\
+            .stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    """ Runs the suite, returns the exit status """
+    parser = argparse.ArgumentParser(description="Benchmark every route of the service")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated table sizes to seed")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--output", default="bench_routes.json", help="the results file")
+    parser.add_argument("--baseline", default=BASELINE, help="the baseline results file")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed p50/p99 slow down over the baseline (0.5 = 50%%)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument(ALLOW_REMOTE, action="store_true",
+                        help="run against a BENCH_DATABASE_URI on another host")
+    args = parser.parse_args(argv)
+    random.seed(0)
+    app.config[keys.KEY_SSE_SECONDS] = 0
+    routes.init_db()
+    client = app.test_client()
+    results = {}
+    with app.app_context():
+        dialect = DB.engine.dialect.name
+        for size in [int(size) for size in args.sizes.split(",")]:
+            print("Seeding {} rows...".format(size))
+            seed(size)
+            results[str(size)] = {}
+            for name, repeat, build in scenarios(size, args.requests):
+                stats = run(client, build, repeat or args.requests)
+                results[str(size)][name] = stats
+                print("{:>8} {:<16} {:>8.1f} req/s  p50 {:>9.3f} ms  p99 {:>9.3f} ms{}".format(
+                    size, name, stats["rps"], stats["p50_ms"], stats["p99_ms"],
+                    "  {} errors".format(stats["errors"]) if stats["errors"] else ""))
+    report = {"meta": {"date": datetime.utcnow().isoformat(), "commit": git_commit(),
+                       "dialect": dialect, "python": platform.python_version(),
+                       "machine": platform.machine(), "requests": args.requests},
+              "results": results}
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print("Results written to {}".format(args.output))
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+        print("Baseline saved to {}".format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with: run with --save-baseline first")
+        return 0
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    if baseline["meta"]["dialect"] != dialect:
+        print("The baseline was recorded on {}, not compared".format(baseline["meta"]["dialect"]))
+        return 0
+    if baseline["meta"]["requests"] != args.requests:
+        print("The baseline ran {} requests per route: the p99 are not comparable".format(
+            baseline["meta"]["requests"]))
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    errors = sum(stats["errors"] for routes_ in results.values() for stats in routes_.values())
+    return 1 if regressions or errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Benchmark of the service startup
+
+Starts fresh interpreters that import the service and serve a first request,
+reporting the median time of the import, of routes.warm_up() (run by the
+gunicorn workers before they take requests) and of the first request, with
+and without the warm up.
+
+    python -m benchmarks.bench_startup [runs] [--allow-remote]
+
+BENCH_DATABASE_URI defaults to a temporary SQLite file, whose schema is created
+once up front like "flask db-upgrade" does.
+"""
+import sys
+import json
+import statistics
+import subprocess
+
+from benchmarks import ALLOW_REMOTE, use_database
+
+use_database("bench_startup.db")
+
+CHILD = """
+import sys
+import json
+import time
+start = time.perf_counter()
+import service
+from service import routes
+imported = time.perf_counter()
+if sys.argv[1] == "warm":
+    routes.warm_up()
+warmed = time.perf_counter()
+resp = service.app.test_client().get("/api/inventory?limit=1")
+assert resp.status_code == 200, resp.status_code
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "warm_up": warmed - imported,
+                  "first_request": done - warmed}))
+"""
+
+def run(mode):
+    """ Returns the timings of one fresh process """
+    out = subprocess.run([sys.executable, "-c", CHILD, mode], check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+def main(runs=10):
+    """ Prints the median startup timings in milliseconds """
+    subprocess.run([sys.executable, "-c", "from service import routes; routes.init_db()"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for mode in ("cold", "warm"):
+        timings = [run(mode) for _ in range(runs)]
+        print("{:<5} import {:>7.1f} ms  warm_up {:>6.1f} ms  first request {:>6.1f} ms".format(
+            mode, *(statistics.median(timing[key] for timing in timings) * 1000
+                    for key in ("import", "warm_up", "first_request"))))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:] if arg != ALLOW_REMOTE][:1])
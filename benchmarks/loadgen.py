@@ -0,0 +1,361 @@
+"""
+Load generator
+
+Replays a mix of operations against the service from concurrent clients and
+reports the throughput, the error rate and the latency histogram of each
+operation, to reproduce the production traffic shapes offline.
+The errors are the failed requests and the 5xx responses; the 4xx (a restock
+above the maximum quantity, a concurrent update...) are counted apart.
+
+    python -m benchmarks.loadgen [workload.yaml|workload.json] [--url http://localhost:8080]
+        [--clients 16] [--duration 30] [--output loadgen.json] [--keep] [--allow-remote]
+
+Without --url the requests go through the WSGI test client of an in-process
+service on BENCH_DATABASE_URI (a temporary SQLite file by default, which
+serializes the writes: use a local PostgreSQL for meaningful write numbers).
+The workload (JSON, or YAML with PyYAML) describes the mix, DEFAULT_WORKLOAD
+when none is given:
+
+    clients: 16           # concurrent clients, each sending one request at a time
+    duration: 60          # seconds
+    think_ms: 0           # pause of a client between two picks
+    products: 10000       # records created from InventoryFactory before the run
+    hot_products: 20      # the first products, targeted by the "hot" share of the picks
+    operations:
+      storefront_get: {type: get, weight: 80}
+      restock_hot: {type: restock, weight: 5, burst: 20, hot: 0.9}
+      full_listing: {type: export, every: 10}
+
+Each client picks the operations by weight; an operation with "every" runs
+on its own client every so many seconds instead. "burst" sends that many
+requests back to back per pick and "hot" is the share of the records picked
+among the hot products. The operation types are the keys of BUILDERS.
+The seeded records, and the ones created by the run, are deleted at the end
+unless --keep is given.
+"""
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import threading
+import itertools
+from bisect import bisect_left
+from datetime import datetime
+
+from benchmarks import ALLOW_REMOTE, use_database
+
+use_database("loadgen.db")
+
+# pylint: disable=wrong-import-position
+from service import app, routes, keys
+from service.metrics import BUCKETS
+from tests.inventory_factory import InventoryFactory
+
+DEFAULT_WORKLOAD = {
+    "clients": 8,
+    "duration": 30,
+    "think_ms": 0,
+    "products": 10000,
+    "hot_products": 20,
+    "operations": {
+        "storefront_get": {"type": "get", "weight": 70},
+        "storefront_list": {"type": "list", "weight": 15, "limit": 20},
+        "low_stock": {"type": "low_stock", "weight": 5},
+        "restock_hot": {"type": "restock", "weight": 5, "burst": 10, "hot": 0.9},
+        "update": {"type": "update", "weight": 3},
+        "create": {"type": "create", "weight": 2},
+        "full_listing": {"type": "export", "every": 10}
+    }
+}
+# The seeded records start at this product_id, out of the way of the real ones
+FIRST_PRODUCT = 900000000
+REQUEST_TIMEOUT = 60
+
+######################################################################
+## Workload
+######################################################################
+class Load():
+    """ The records of a run: the seeded products, the hot ones and the created ones """
+
+    def __init__(self, products, hot_products, first_product=FIRST_PRODUCT):
+        self.records = [InventoryFactory.build(product_id=first_product + n).serialize()
+                        for n in range(products)]
+        self.hot = self.records[:max(1, min(hot_products, products))]
+        self.created = []
+        self._ids = itertools.count(first_product + products)
+
+    def pick(self, spec, rng):
+        """ Returns the (product_id, condition) of a seeded record """
+        records = self.hot if rng.random() < spec.get("hot", 0) else self.records
+        record = rng.choice(records)
+        return record[keys.KEY_PID], record[keys.KEY_CND]
+
+    def new_record(self):
+        """ Returns a record to create, kept to be deleted at the end """
+        record = InventoryFactory.build(product_id=next(self._ids)).serialize()
+        self.created.append(record)
+        return record
+
+    def all_keys(self):
+        """ The keys of all of the records of the run """
+        return [{keys.KEY_PID: record[keys.KEY_PID], keys.KEY_CND: record[keys.KEY_CND]}
+                for record in self.records + self.created]
+
+def item_url(pid, condition, suffix=""):
+    """ The URL of an Inventory """
+    return "/api/inventory/{}/condition/{}{}".format(pid, condition, suffix)
+
+# Each builder returns the (method, url, json body) of one request of its type
+BUILDERS = {
+    "get": lambda load, spec, rng: ("GET", item_url(*load.pick(spec, rng)), None),
+    "list": lambda load, spec, rng: ("GET", "/api/inventory?limit={}".format(
+        spec.get("limit", keys.PAGE_SIZE_DEFAULT)), None),
+    "low_stock": lambda load, spec, rng: ("GET", "/api/inventory/low-stock?limit={}".format(
+        spec.get("limit", keys.PAGE_SIZE_DEFAULT)), None),
+    "summary": lambda load, spec, rng: ("GET", "/api/inventory/summary", None),
+    "export": lambda load, spec, rng: ("GET", "/api/inventory/export", None),
+    "create": lambda load, spec, rng: ("POST", "/api/inventory", load.new_record()),
+    "update": lambda load, spec, rng: ("PUT", item_url(*load.pick(spec, rng)), {
+        keys.KEY_QTY: rng.randint(keys.QTY_LOW, keys.QTY_HIGH)}),
+    "restock": lambda load, spec, rng: ("PUT", item_url(*load.pick(spec, rng), "/restock"), {
+        keys.KEY_AMT: spec.get("amount", 1)}),
+    "activate": lambda load, spec, rng: ("PUT", item_url(*load.pick(spec, rng), "/activate"),
+                                         None),
+    "deactivate": lambda load, spec, rng: ("PUT", item_url(*load.pick(spec, rng), "/deactivate"),
+                                           None),
+}
+
+def read_workload(path):
+    """ Returns the workload of a JSON or YAML file, DEFAULT_WORKLOAD without one """
+    if not path:
+        return json.loads(json.dumps(DEFAULT_WORKLOAD))
+    with open(path) as source:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # pylint: disable=import-outside-toplevel
+            return yaml.safe_load(source)
+        return json.load(source)
+
+def check_workload(workload):
+    """ Returns the error of a workload, or None when it can be run """
+    operations = workload.get("operations")
+    if not operations:
+        return "the workload has no operations"
+    for name, spec in operations.items():
+        if spec.get("type", name) not in BUILDERS:
+            return "operation {}: unknown type {} (one of {})".format(
+                name, spec.get("type", name), ", ".join(sorted(BUILDERS)))
+        if not spec.get("weight") and not spec.get("every"):
+            return "operation {}: needs a weight or an every".format(name)
+    if not any(spec.get("weight") for spec in operations.values()):
+        return "the workload needs at least one operation with a weight"
+    return None
+
+######################################################################
+## Clients
+######################################################################
+class LocalClient():
+    """ Sends the requests to the in-process service """
+
+    def __init__(self):
+        self._client = app.test_client()
+
+    def send(self, method, url, body):
+        """ Returns the status of the response, once its body is read """
+        resp = self._client.open(url, method=method, json=body)
+        resp.get_data()
+        return resp.status_code
+
+class HttpClient():
+    """ Sends the requests to a running service, over a keep-alive connection """
+
+    def __init__(self, base_url):
+        import requests  # pylint: disable=import-outside-toplevel
+        self._base_url = base_url.rstrip("/")
+        self._session = requests.Session()
+
+    def send(self, method, url, body):
+        """ Returns the status of the response, once its body is read """
+        resp = self._session.request(method, self._base_url + url, json=body,
+                                     timeout=REQUEST_TIMEOUT)
+        return resp.status_code
+
+######################################################################
+## Statistics
+######################################################################
+class LoadStats():
+    """ Thread-safe latencies and statuses of the requests, per operation """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._statuses = {}
+
+    def record(self, name, seconds, status):
+        """ Records a request of the operation name (status None when it failed to be sent) """
+        with self._lock:
+            self._timings.setdefault(name, []).append(seconds)
+            statuses = self._statuses.setdefault(name, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def report(self, elapsed):
+        """ Returns the statistics of every operation over elapsed seconds """
+        with self._lock:
+            timings = {name: sorted(values) for name, values in self._timings.items()}
+            statuses = {name: dict(values) for name, values in self._statuses.items()}
+        report = {}
+        for name, values in sorted(timings.items()):
+            errors = sum(count for status, count in statuses[name].items()
+                         if status is None or status >= 500)
+            rejected = sum(count for status, count in statuses[name].items()
+                           if status and 400 <= status < 500)
+            histogram = [0] * (len(BUCKETS) + 1)
+            for seconds in values:
+                histogram[bisect_left(BUCKETS, seconds)] += 1
+            report[name] = {
+                "requests": len(values), "errors": errors,
+                "error_rate": round(errors / len(values), 4), "rejected": rejected,
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": percentile_ms(values, 0.50), "p90_ms": percentile_ms(values, 0.90),
+                "p99_ms": percentile_ms(values, 0.99), "max_ms": round(values[-1] * 1000, 3),
+                "statuses": {str(status or "failed"): count
+                             for status, count in sorted(statuses[name].items(),
+                                                         key=lambda item: item[0] or 0)},
+                # Requests per latency bucket, keyed by the upper bound in seconds
+                "histogram": {str(bound): count
+                              for bound, count in zip(BUCKETS + ("+Inf",), histogram) if count}
+            }
+        return report
+
+def percentile_ms(values, share):
+    """ The nearest-rank percentile of sorted seconds, in milliseconds """
+    return round(values[max(0, math.ceil(share * len(values)) - 1)] * 1000, 3)
+
+######################################################################
+## Runner
+######################################################################
+def timed(client, stats, name, request):
+    """ Sends a request and records its latency and status """
+    method, url, body = request
+    start = time.perf_counter()
+    try:
+        status = client.send(method, url, body)
+    except Exception:  # pylint: disable=broad-except
+        status = None
+    stats.record(name, time.perf_counter() - start, status)
+
+def run_client(client, load, workload, stats, deadline, seed):
+    """ Sends the weighted operations until the deadline """
+    rng = random.Random(seed)
+    weighted = [(name, spec) for name, spec in workload["operations"].items()
+                if spec.get("weight")]
+    weights = [spec["weight"] for _, spec in weighted]
+    think = workload.get("think_ms", 0) / 1000.0
+    while time.perf_counter() < deadline:
+        name, spec = rng.choices(weighted, weights)[0]
+        build = BUILDERS[spec.get("type", name)]
+        for _ in range(spec.get("burst", 1)):
+            timed(client, stats, name, build(load, spec, rng))
+        if think:
+            time.sleep(think)
+
+def run_periodic(client, load, name, spec, stats, deadline, seed):
+    """ Sends the operation every spec["every"] seconds until the deadline """
+    rng = random.Random(seed)
+    build = BUILDERS[spec.get("type", name)]
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        for _ in range(spec.get("burst", 1)):
+            timed(client, stats, name, build(load, spec, rng))
+        time.sleep(max(0.0, min(spec["every"] - (time.perf_counter() - started),
+                                deadline - time.perf_counter())))
+
+def chunks(records, size=keys.BULK_CHUNK_SIZE):
+    """ Splits records in lists of at most size """
+    return [records[start:start + size] for start in range(0, len(records), size)]
+
+def seed(client, load):
+    """ Creates the records of the load with the bulk endpoint """
+    for chunk in chunks(load.records):
+        status = client.send("POST", "/api/inventory/bulk", chunk)
+        if status not in (201, 207):
+            raise RuntimeError("Seeding failed with status {}".format(status))
+
+def cleanup(client, load):
+    """ Deletes the records of the load """
+    for chunk in chunks(load.all_keys()):
+        client.send("DELETE", "/api/inventory/bulk", chunk)
+
+def print_report(report, elapsed):
+    """ Prints a line and the latency histogram of each operation """
+    total = sum(stats["requests"] for stats in report.values())
+    print("{} requests in {:.1f} s ({:.1f} req/s)".format(total, elapsed, total / elapsed))
+    for name, stats in report.items():
+        print("{:<18} {:>8.1f} req/s  errors {:>6.2%}  4xx {:>6}  p50 {:>8.2f} ms  p90 {:>8.2f} ms  "
+              "p99 {:>8.2f} ms  max {:>8.2f} ms".format(
+                  name, stats["rps"], stats["error_rate"], stats["rejected"], stats["p50_ms"], stats["p90_ms"],
+                  stats["p99_ms"], stats["max_ms"]))
+        print("{:<18} {}".format("", "  ".join(
+            "<={}s {}".format(bound, count) for bound, count in stats["histogram"].items())))
+
+def main(argv=None):
+    """ Runs a workload, returns the exit status """
+    parser = argparse.ArgumentParser(description="Drive the service with a mix of operations")
+    parser.add_argument("workload", nargs="?", help="the workload file (JSON or YAML)")
+    parser.add_argument("--url", help="the base URL of a running service (in-process otherwise)")
+    parser.add_argument("--clients", type=int, help="concurrent clients (overrides the workload)")
+    parser.add_argument("--duration", type=float, help="seconds (overrides the workload)")
+    parser.add_argument("--output", default="loadgen.json", help="the results file")
+    parser.add_argument("--keep", action="store_true", help="keep the records of the run")
+    parser.add_argument(ALLOW_REMOTE, action="store_true",
+                        help="run in process against a BENCH_DATABASE_URI on another host")
+    args = parser.parse_args(argv)
+    workload = read_workload(args.workload)
+    for name in ("clients", "duration"):
+        if getattr(args, name):
+            workload[name] = getattr(args, name)
+    error = check_workload(workload)
+    if error:
+        parser.error(error)
+
+    if args.url:
+        new_client = lambda: HttpClient(args.url)
+    else:
+        routes.init_db()
+        new_client = LocalClient
+    load = Load(workload.get("products", 1000), workload.get("hot_products", 10))
+    print("Seeding {} records...".format(len(load.records)))
+    seed(new_client(), load)
+
+    stats = LoadStats()
+    clients = workload.get("clients", 1)
+    deadline = time.perf_counter() + workload.get("duration", 30)
+    threads = [threading.Thread(target=run_client, args=(
+        new_client(), load, workload, stats, deadline, number)) for number in range(clients)]
+    threads.extend(threading.Thread(target=run_periodic, args=(
+        new_client(), load, name, spec, stats, deadline, clients + number))
+                   for number, (name, spec) in enumerate(workload["operations"].items())
+                   if spec.get("every"))
+    print("Running {} clients for {} s...".format(clients, workload.get("duration", 30)))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    report = stats.report(elapsed)
+    print_report(report, elapsed)
+    if not args.keep:
+        cleanup(new_client(), load)
+
+    with open(args.output, "w") as out:
+        json.dump({"meta": {"date": datetime.utcnow().isoformat(), "url": args.url,
+                            "python": platform.python_version(), "elapsed": round(elapsed, 3)},
+                   "workload": workload, "results": report}, out, indent=2, sort_keys=True)
+    print("Results written to {}".format(args.output))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import os
 import logging
 from service import keys
+from service.pool import TimedQueuePool
 
 # Get configuration from environment
 DATABASE_URI = os.getenv(
@@ -12,6 +13,65 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool: connections kept open per worker, extra connections opened under
+# load, seconds to wait for one before failing (503), seconds before a connection is
+# replaced, and a liveness check on checkout. The statement timeout (milliseconds,
+# 0 disables it) cancels any query running longer on the server
+DB_POOL_SIZE = int(os.getenv(keys.KEY_POOL_SIZE, keys.POOL_SIZE_DEFAULT))
+DB_MAX_OVERFLOW = int(os.getenv(keys.KEY_POOL_OVERFLOW, keys.POOL_OVERFLOW_DEFAULT))
+DB_POOL_TIMEOUT = float(os.getenv(keys.KEY_POOL_TIMEOUT, keys.POOL_TIMEOUT_DEFAULT))
+DB_POOL_RECYCLE = int(os.getenv(keys.KEY_POOL_RECYCLE, keys.POOL_RECYCLE_DEFAULT))
+DB_POOL_PRE_PING = os.getenv(keys.KEY_POOL_PRE_PING, "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv(keys.KEY_STATEMENT_TIMEOUT,
+                                        keys.STATEMENT_TIMEOUT_DEFAULT))
+
+SQLALCHEMY_ENGINE_OPTIONS = {"pool_pre_ping": DB_POOL_PRE_PING}
+if DATABASE_URI.startswith("postgres"):
+    # Send executemany() batches as multi-row VALUES pages (psycopg2 execute_values)
+    SQLALCHEMY_ENGINE_OPTIONS["executemany_mode"] = "values"
+    # SQLite keeps its own single-connection pools, the sizes only apply to PostgreSQL
+    SQLALCHEMY_ENGINE_OPTIONS.update(
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={"options": "-c statement_timeout={}".format(DB_STATEMENT_TIMEOUT_MS)})
+
+# The processes serving the app and the threads of each, which the defaults of the
+# per-process settings below depend on. gunicorn.conf.py passes its own to the workers;
+# without it (flask run, the CLI commands, the tests) a single process runs the app
+WEB_CONCURRENCY = int(os.getenv(keys.KEY_WORKERS, "1"))
+GUNICORN_THREADS = int(os.getenv(keys.KEY_THREADS, keys.THREADS_DEFAULT))
+
+# Reject the list queries whose plan scans the table or sorts the matching records
+# (X-Query-Index: none) instead of only reporting them
+QUERY_REQUIRE_INDEX = os.getenv(keys.KEY_QUERY_REQUIRE_INDEX, "false").lower() == "true"
+
+# Read-through cache of the single-item lookups (size 0 disables it). A worker does not
+# see the writes of the others, so unless RECORD_CACHE_SIZE is set it is only on with a
+# single worker
+RECORD_CACHE_SIZE = int(os.getenv(keys.KEY_CACHE_SIZE, keys.CACHE_SIZE_DEFAULT
+                                  if WEB_CONCURRENCY == 1 else 0))
+RECORD_CACHE_TTL = float(os.getenv(keys.KEY_CACHE_TTL, keys.CACHE_TTL_DEFAULT))
+
+# Change feed: events buffered (and kept in the inventory_events table) for the clients
+# to resume from, how often a worker reads the events of the others, and how long an
+# event stream stays open (clients reconnect with their Last-Event-ID)
+EVENTS_BUFFER_SIZE = int(os.getenv(keys.KEY_EVENTS_SIZE, keys.EVENTS_SIZE_DEFAULT))
+EVENTS_POLL_SECONDS = float(os.getenv(keys.KEY_EVENTS_POLL, keys.EVENTS_POLL_DEFAULT))
+SSE_STREAM_SECONDS = float(os.getenv(keys.KEY_SSE_SECONDS, keys.SSE_SECONDS_DEFAULT))
+SSE_KEEPALIVE_SECONDS = float(os.getenv(keys.KEY_SSE_KEEPALIVE, keys.SSE_KEEPALIVE_DEFAULT))
+# Event streams open at once in a worker, each holds one of its threads while it is
+# open: unless SSE_MAX_STREAMS is set, half of GUNICORN_THREADS, so the other requests
+# still get served
+SSE_MAX_STREAMS = int(os.getenv(keys.KEY_SSE_MAX_STREAMS, max(1, GUNICORN_THREADS // 2)))
+
+# Request log: share of the successful requests logged (failed ones and the ones
+# slower than LOG_SLOW_MS milliseconds are always logged)
+LOG_SAMPLE_RATE = float(os.getenv(keys.KEY_LOG_SAMPLE_RATE, keys.LOG_SAMPLE_RATE_DEFAULT))
+LOG_SLOW_MS = float(os.getenv(keys.KEY_LOG_SLOW_MS, keys.LOG_SLOW_MS_DEFAULT))
+
 # Secret for session management
 SECRET_KEY = os.getenv(keys.KET_SECRET, "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
@@ -24,16 +24,13 @@ def step_impl(context):
     """ Delete all Inventories and load new ones """
     headers = {'Content-Type': 'application/json'}
 
-    # list all of the inventories and delete them one by one
-    context.resp = requests.get(context.base_url + '/api/inventory')
-    if context.resp.status_code == 200:
-        for pet in context.resp.json():
-            url = "{}/api/inventory/{}/condition/{}"\
-                .format(context.base_url, str(pet["product_id"]), str(pet["condition"]))
-            context.resp = requests.delete(url)
-            expect(context.resp.status_code).to_equal(204)
-        resp = requests.get(context.base_url + '/api/inventory')
-        expect(resp.status_code).to_equal(200)
+    # delete all of the inventories with a single request
+    context.resp = requests.delete(context.base_url + '/api/inventory',
+                                   params={"condition": "new,used,open box"})
+    expect(context.resp.status_code).to_equal(200)
+    resp = requests.get(context.base_url + '/api/inventory')
+    expect(resp.status_code).to_equal(200)
+    expect(len(resp.json())).to_equal(0)
 
     # load the database with new pets
     create_url = context.base_url + '/api/inventory'
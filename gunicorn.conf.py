@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration (loaded through the Procfile)
+
+Each worker serves several requests at once with its threads. Every request
+pushes its own app context and gets its own SQLAlchemy session, removed when
+the request ends. Keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above the threads
+of a worker.
+The workers and threads are passed to the app (raw_env): config.py derives
+the defaults of the per-process settings (the record cache, the event
+streams) from them.
+"""
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))  # keys.THREADS_DEFAULT
+raw_env = ["WEB_CONCURRENCY={}".format(workers), "GUNICORN_THREADS={}".format(threads)]
+
+def post_worker_init(worker):
+    """ Connects to the DB once the app is loaded, before the first request """
+    from service import routes
+    try:
+        seconds = routes.warm_up()
+        worker.log.info("Database connection ready in {:.0f} ms".format(seconds * 1000))
+    except Exception as err:  # pylint: disable=broad-except
+        # The requests report the database errors, the worker keeps running
+        worker.log.warning("Database warm up failed: {}".format(err))
@@ -6,9 +6,14 @@ This module also sets up the logging to be used with gunicorn
 """
 import os
 import sys
+import time
 import logging
 from flask import Flask
 
+# Start of the initialization logged below. It leaves out the imports above (Flask
+# mostly), benchmarks/bench_startup.py measures the whole import of the package
+STARTED = time.perf_counter()
+
 # Create Flask application
 app = Flask(__name__)
 
@@ -17,7 +22,7 @@ app.config['LOGGING_LEVEL'] = logging.INFO
 app.config['API_KEY'] = os.getenv('API_KEY')
 
 # Import the service After the Flask app is created
-from service import routes, keys
+from service import routes, keys, logs
 
 # Set up logging for production
 print("Setting up logging for {}...".format(__name__))
@@ -27,18 +32,21 @@ if __name__ != "__main__":
     if GUNICORN_LOGGER:
         app.logger.handlers = GUNICORN_LOGGER.handlers
         app.logger.setLevel(GUNICORN_LOGGER.level)
+    # Write the records of the app and the model from a background thread
+    logs.PIPELINE.start(app.logger, logging.getLogger("flask.app"))
     app.logger.info("Logging established")
 
 app.logger.info(70 * "*")
 app.logger.info("  I N V E N T O R Y   S T O R E   S E R V I C E  ".center(70, "*"))
 app.logger.info(70 * "*")
 
-# make our sqlalchemy tables
-routes.init_db()
-
-app.logger.info("Service inititalized!")
+# Bind the model, the database is first used by a request (or routes.warm_up()).
+# The tables are created and migrated by "flask db-upgrade" (see the Procfile)
+routes.init_app()
 
 # If an API Key was not provided, autogenerate one
 if not app.config[keys.KEY_API]:
     app.config[keys.KEY_API] = routes.generate_apikey()
-    app.logger.info('Missing API Key! Autogenerated: {}'.format(app.config[keys.KEY_API]))
+    app.logger.info('Missing API Key! Autogenerated: %s', app.config[keys.KEY_API])
+
+app.logger.info("Service initialized in %.0f ms!", (time.perf_counter() - STARTED) * 1000)
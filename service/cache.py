@@ -0,0 +1,95 @@
+"""
+Record cache
+
+An in-process LRU cache with a time-to-live, used to serve the single-item
+lookups of the hot records without a round trip to the database.
+Writers invalidate the keys they change once their transaction is committed.
+Other processes (gunicorn workers) can not see those invalidations, so the
+time-to-live bounds how stale a cached record can be across workers.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+class RecordCache():
+    """ A thread-safe LRU cache whose entries expire after ttl seconds """
+
+    def __init__(self, max_size=0, ttl=0):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_size, ttl):
+        """ Resizes the cache (0 disables it) and sets the time-to-live in seconds """
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._evict()
+
+    def generation(self):
+        """ Returns a token to pass to put() after reading the value to cache """
+        return self._generation
+
+    def get(self, key):
+        """ Returns the cached value for the key, or None on a miss """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        """ Caches the value for the key
+        When the generation token is given, the value is dropped if anything was
+        invalidated since the token was taken, as it may have been read before a write
+        """
+        with self._lock:
+            if self.max_size <= 0:
+                return
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, *keys):
+        """ Removes the keys from the cache """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """ Removes every entry from the cache """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """ Returns the size and hit / miss counters of the cache """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": float(self.hits) / lookups if lookups else 0.0
+            }
+
+    def _evict(self):
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,51 @@
+"""
+Fast JSON encoding of Inventory records
+
+The marshalled responses serialize() every record into a dictionary, walk it
+again field by field to marshal it with inventory_model, then encode it. Read
+paths go straight from the record values to JSON bytes instead, with the same
+fields in the same order as inventory_model.
+"""
+import json
+from operator import attrgetter, itemgetter
+from service import keys
+
+# The inventory_model fields, in the order they are documented
+FIELDS = keys.RECORD_FIELDS
+
+_TEMPLATE = '{{"{}":%s,"{}":%s,"{}":%s,"{}":%s,"{}":%s}}'.format(*FIELDS)
+_attributes = attrgetter(*FIELDS)
+_items = itemgetter(*FIELDS)
+_string = json.encoder.encode_basestring_ascii
+
+def _integer(value):
+    return "null" if value is None else "%d" % int(value)
+
+def _text(value):
+    return "null" if value is None else _string(value)
+
+def _encode(values):
+    pid, cnd, qty, lvl, avl = values
+    return _TEMPLATE % (_integer(pid), _text(cnd), _integer(qty), _integer(lvl), _integer(avl))
+
+def as_dict(record):
+    """ Returns the inventory_model fields of a record as a dictionary """
+    return dict(zip(FIELDS, _attributes(record)))
+
+def encode_record(record):
+    """ Encodes a record (an Inventory or any object with its attributes) as JSON bytes """
+    return _encode(_attributes(record)).encode("ascii")
+
+def encode_dict(data):
+    """ Encodes a serialized Inventory dictionary as JSON bytes """
+    return _encode(_items(data)).encode("ascii")
+
+def encode_records(records):
+    """ Encodes a list of records as a JSON array """
+    return ("[" + ",".join([_encode(_attributes(record)) for record in records]) + "]")\
+        .encode("ascii")
+
+def encode_lines(records):
+    """ Yields the records as newline-delimited JSON """
+    for record in records:
+        yield (_encode(_attributes(record)) + "\n").encode("ascii")
@@ -0,0 +1,251 @@
+"""
+Change feed
+
+A feed of the inventory changes shared by every worker and instance, streamed
+to the clients as Server-Sent Events (GET /api/inventory/events).
+The routes publish an event once their write is committed: it is inserted
+into the inventory_events table (EventStore), whose ids come from a sequence
+of the database, so the id of an event means the same on every process.
+Each process keeps the last events in a ring buffer (EventBus), read from the
+table at most every EVENTS_POLL_SECONDS by one of the streams waiting for
+them, so the streams do not multiply the queries. Publishing wakes up the
+streams of the same process at once.
+A client reconnecting with its Last-Event-ID, to any worker, resumes right
+after the last event it saw. When those events were dropped from the buffer
+(or pruned from the table) it gets a "reset" event instead, telling it to
+reload the collection.
+Without an EventStore (the unit tests) the feed only lives in the process.
+"""
+import json
+import time
+import threading
+from collections import deque
+from flask_sqlalchemy import sqlalchemy
+from service import keys
+from service.model import DB
+
+EVENTS_TABLE = sqlalchemy.Table(
+    "inventory_events", DB.metadata,
+    sqlalchemy.Column("id", sqlalchemy.BigInteger().with_variant(sqlalchemy.Integer, "sqlite"),
+                      primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String(20), nullable=False),
+    sqlalchemy.Column("data", sqlalchemy.Text, nullable=False)
+)
+
+class Event():
+    """ A published change, encoded as a Server-Sent Event on first use """
+    __slots__ = ("seq", "id", "name", "data", "_message")
+
+    def __init__(self, seq, name, data):
+        self.seq = seq
+        self.id = str(seq)
+        self.name = name
+        self.data = data
+        self._message = None
+
+    def message(self):
+        """ Returns the event in the text/event-stream format """
+        if self._message is None:
+            self._message = "id: {}\nevent: {}\ndata: {}\n\n".format(
+                self.id, self.name, json.dumps(self.data, separators=(",", ":")))
+        return self._message
+
+class EventStore():
+    """ The events of every process, in the inventory_events table
+    Keeps the last retain events, the older ones are pruned every PRUNE_EVERY appends
+    """
+    PRUNE_EVERY = 100
+    # Serializes the publishers on Postgres, so the ids are committed in order and a
+    # reader never skips an id committed after a greater one
+    LOCK_ID = 4915286
+
+    def __init__(self, app, retain):
+        self.app = app
+        self.retain = retain
+        self._appends = 0
+
+    def append(self, name, items):
+        """ Inserts the events and commits them, in the session of the request """
+        table = EVENTS_TABLE
+        conn = DB.session.connection()
+        if conn.dialect.name == "postgresql":
+            conn.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(:id)"), id=self.LOCK_ID)
+        conn.execute(table.insert(), [{"name": name, "data": json.dumps(data)}
+                                      for data in items])
+        self._appends += 1
+        if self._appends % self.PRUNE_EVERY == 0:
+            newest = sqlalchemy.select([sqlalchemy.func.max(table.c.id)]).as_scalar()
+            conn.execute(table.delete().where(table.c.id <= newest - self.retain))
+        DB.session.commit()
+
+    def after(self, seq, limit):
+        """ Returns the last limit events after the id seq, in order
+        Runs on its own connection: the streams read outside of any request
+        """
+        table = EVENTS_TABLE
+        query = sqlalchemy.select([table.c.id, table.c.name, table.c.data])\
+            .where(table.c.id > seq).order_by(table.c.id.desc()).limit(limit)
+        with DB.get_engine(self.app).connect() as conn:
+            rows = conn.execute(query).fetchall()
+        return [Event(row.id, row.name, json.loads(row.data)) for row in reversed(rows)]
+
+class EventBus():
+    """ Buffers the last max_size events and wakes up the streams waiting for them
+    With a store, the events of every process are read from it every poll_seconds
+    """
+
+    def __init__(self, max_size=1000, store=None, poll_seconds=1.0):
+        self._changed = threading.Condition()
+        self._refreshing = threading.Lock()
+        self._events = deque(maxlen=max_size)
+        self._seq = 0
+        # The events up to this id are no longer buffered
+        self._floor = 0
+        self._store = store
+        self._poll = poll_seconds
+        self._polled = None
+        self.published = 0
+        self.streams = 0
+
+    def configure(self, max_size, store=None, poll_seconds=None):
+        """ Resizes the buffer of events that clients can resume from, and sets the
+        store of the events of every process and how often it is read
+        """
+        with self._changed:
+            dropped = len(self._events) - max_size
+            if dropped > 0:
+                self._floor = max(self._floor, self._events[dropped - 1].seq)
+            self._events = deque(self._events, maxlen=max_size)
+            if store is not None:
+                self._store = store
+            if poll_seconds is not None:
+                self._poll = poll_seconds
+
+    def clear(self):
+        """ Forgets the buffered events, to read the store from scratch (when its table
+        was recreated)
+        """
+        with self._changed:
+            self._events.clear()
+            self._seq = self._floor = 0
+            self._polled = None
+
+    def last_id(self):
+        """ Returns the id of the latest event, to resume from it """
+        return str(self._seq)
+
+    def publish(self, name, data):
+        """ Publishes an event without waiting for any of the streams """
+        self.publish_many(name, [data])
+
+    def publish_many(self, name, items):
+        """ Publishes one event per item with a single wake-up of the streams """
+        if not items:
+            return
+        if self._store:
+            self._store.append(name, items)
+            self.published += len(items)
+            self.refresh(force=True)
+            return
+        with self._changed:
+            self._append([Event(self._seq + index, name, data)
+                          for index, data in enumerate(items, 1)])
+            self.published += len(items)
+            self._changed.notify_all()
+
+    def refresh(self, force=False):
+        """ Reads the events published since the last refresh by any process
+        At most once every poll_seconds unless forced, by one thread at a time: the
+        others keep waiting for the events it reads
+        """
+        if not self._store:
+            return
+        now = time.monotonic()
+        if not force and self._polled is not None and now - self._polled < self._poll:
+            return
+        if not self._refreshing.acquire(blocking=force):
+            return
+        try:
+            first = self._polled is None
+            self._polled = now
+            limit = self._events.maxlen
+            events = self._store.after(self._seq, limit)
+            with self._changed:
+                if events and (first or len(events) == limit):
+                    # The events before these ones are not read
+                    self._floor = max(self._floor, events[0].seq - 1)
+                events = [event for event in events if event.seq > self._seq]
+                if events:
+                    self._append(events)
+                    self._changed.notify_all()
+        finally:
+            self._refreshing.release()
+
+    def _append(self, events):
+        """ Buffers the events, in order, with the lock held """
+        for event in events:
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0].seq
+            self._events.append(event)
+            self._seq = event.seq
+
+    def parse(self, event_id):
+        """ Returns the sequence number of an event id the feed can resume from, or None """
+        try:
+            seq = int(event_id)
+        except (TypeError, ValueError):
+            return None
+        if seq > self._seq:
+            # Published by another process since the last refresh
+            self.refresh(force=True)
+        if not self._floor <= seq <= self._seq:
+            return None
+        return seq
+
+    def since(self, seq, timeout=0):
+        """ Returns the events after the sequence number seq
+        Waits up to timeout seconds for one when there is none yet.
+        Returns None when some of those events are no longer buffered
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.refresh()
+            with self._changed:
+                remaining = deadline - time.monotonic()
+                if self._seq > seq or remaining <= 0:
+                    if seq < self._floor:
+                        return None
+                    events = []
+                    for event in reversed(self._events):
+                        if event.seq <= seq:
+                            break
+                        events.append(event)
+                    return events[::-1]
+                # Woken up by a publish of this process, or in time for the next refresh
+                self._changed.wait(min(remaining, self._poll) if self._store else remaining)
+
+    def open_stream(self, max_streams):
+        """ Counts a new stream, unless max_streams are already open
+        Returns: the function to call when the stream ends (calling it again does
+        nothing), or None when the stream is refused
+        """
+        with self._changed:
+            if self.streams >= max_streams:
+                return None
+            self.streams += 1
+        closed = []
+
+        def close():
+            with self._changed:
+                if not closed:
+                    closed.append(True)
+                    self.streams -= 1
+        return close
+
+    def reset_event(self):
+        """ Returns an event telling the client to reload, it resumes from the latest """
+        return Event(self._seq, keys.EVENT_RESET, {})
+
+# The change feed of the service, bound to its EventStore and sized from the app
+# config in routes.init_app()
+EVENTS = EventBus()
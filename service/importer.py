@@ -0,0 +1,147 @@
+"""
+CSV importer
+
+Streams a CSV file of Inventory records into the database, run by
+"flask inventory-import". The header names the columns (keys.RECORD_FIELDS,
+in any order). The rows are read, validated (RecordValidator.validate_batch)
+and loaded (Inventory.bulk_load) one chunk at a time, each in its own
+transaction, so the memory used does not grow with the file.
+After each chunk the position in the file is saved to a checkpoint file: an
+import that failed resumes after the last committed chunk when it is run
+again. A chunk loaded twice (a crash between its commit and its checkpoint)
+is harmless, as bulk_load() skips the existing keys.
+"""
+import os
+import csv
+import json
+import time
+import logging
+from flask_sqlalchemy import sqlalchemy
+from service import keys
+from service.model import DB, VALIDATOR, Inventory
+
+LOGGER = logging.getLogger("flask.app")
+
+# The invalid rows reported one by one, the others are only counted
+MAX_REPORTED = 100
+
+class Checkpoint():
+    """ The progress of the import of a file, saved next to it """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, source):
+        """ Returns the saved progress of source, or None when it was not started
+        (or changed since)
+        """
+        try:
+            with open(self.path) as data:
+                state = json.load(data)
+        except (OSError, ValueError):
+            return None
+        if state.get("file") != os.path.abspath(source) or \
+                state.get("size") != os.path.getsize(source):
+            LOGGER.warning("Ignoring checkpoint %s of another file", self.path)
+            return None
+        return state
+
+    def save(self, state):
+        """ Replaces the saved progress, atomically """
+        temp = self.path + ".tmp"
+        with open(temp, "w") as data:
+            json.dump(state, data)
+        os.replace(temp, self.path)
+
+    def remove(self):
+        """ Removes the saved progress (the import is complete) """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class CsvImporter():
+    """ Imports a CSV file in chunks of chunk_size rows, resuming from its checkpoint """
+
+    def __init__(self, path, chunk_size=keys.IMPORT_CHUNK_SIZE, checkpoint=None):
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1, not {}".format(chunk_size))
+        self.path = path
+        self.chunk_size = chunk_size
+        self.checkpoint = Checkpoint(checkpoint or path + ".checkpoint")
+
+    def run(self, restart=False, progress=None):
+        """ Imports the file, calling progress(state) after each chunk
+        Returns: the final state, with the lines read and the rows loaded, skipped
+        (existing keys) and invalid
+        """
+        state = None if restart else self.checkpoint.load(self.path)
+        if state:
+            LOGGER.info("Resuming the import of %s at line %s", self.path, state["line"])
+        else:
+            state = {"file": os.path.abspath(self.path), "size": os.path.getsize(self.path),
+                     "offset": 0, "line": 1, "loaded": 0, "skipped": 0, "invalid": 0}
+        start = time.perf_counter()
+        with open(self.path, "rb") as source:
+            header = source.readline()
+            fields = [name.strip() for name in next(csv.reader([header.decode("utf-8-sig")]))]
+            missing = [name for name in keys.RECORD_FIELDS if name not in fields]
+            if missing:
+                raise ValueError("The header of {} misses {}".format(self.path, missing))
+            if state["offset"]:
+                source.seek(state["offset"])
+            else:
+                state["offset"] = len(header)
+            lines = LineReader(source, state)
+            reader = csv.DictReader(lines, fieldnames=fields)
+            while True:
+                numbers, chunk = [], []
+                for record in reader:
+                    numbers.append(state["line"])
+                    chunk.append(record)
+                    if len(chunk) == self.chunk_size:
+                        break
+                if not chunk:
+                    break
+                self._load(chunk, numbers, state)
+                state["offset"] = lines.offset
+                self.checkpoint.save(state)
+                if progress:
+                    progress(dict(state, seconds=time.perf_counter() - start))
+        self.checkpoint.remove()
+        return dict(state, seconds=time.perf_counter() - start)
+
+    @staticmethod
+    def _load(chunk, numbers, state):
+        """ Validates and loads a chunk in one transaction """
+        rows, errors = VALIDATOR.validate_batch(chunk)
+        for index, message in sorted(errors.items()):
+            if state["invalid"] < MAX_REPORTED:
+                LOGGER.warning("Line %s: %s", numbers[index], message)
+            state["invalid"] += 1
+        try:
+            loaded, skipped = Inventory.bulk_load([row for _, row in rows])
+        except sqlalchemy.exc.SQLAlchemyError:
+            DB.session.rollback()
+            raise
+        state["loaded"] += loaded
+        state["skipped"] += skipped
+
+class LineReader():
+    """ Iterates over the decoded lines of a binary file, keeping the byte offset of
+    the end of the last line read (offset) and counting the lines in state["line"]
+    """
+
+    def __init__(self, source, state):
+        self.source = source
+        self.state = state
+        self.offset = state["offset"]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.source.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        self.state["line"] += 1
+        return line.decode("utf-8")
@@ -0,0 +1,91 @@
+"""
+Logging pipeline
+
+The request threads only put the log records on a queue: a background thread
+formats them and writes them to the real handlers (gunicorn's), so a slow
+stream or a busy terminal never delays a response.
+Each request is summed up by one structured line (see request_line), written
+for every failed or slow request and for a sample (LOG_SAMPLE_RATE) of the
+others. The handlers log their details at DEBUG level.
+"""
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+class Fields(dict):
+    """ Structured log fields, serialized as JSON only when the record is written """
+    __slots__ = ()
+
+    def __str__(self):
+        return json.dumps(self, separators=(",", ":"), default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """ A QueueHandler leaving the formatting of the records to the listener thread
+    The arguments of the records must not change once logged (strings, numbers, Fields)
+    """
+
+    def prepare(self, record):
+        return record
+
+class LogPipeline():
+    """ Moves the handlers of loggers behind a queue drained by a background thread """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._listener = None
+
+    def start(self, logger, *others):
+        """ Routes logger (and the others, with the same handlers) through the queue """
+        if self._listener or not logger.handlers:
+            return
+        handlers = list(logger.handlers)
+        self._listener = QueueListener(self._queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+        for target in (logger,) + others:
+            target.handlers = [DeferredQueueHandler(self._queue)]
+            target.propagate = False
+            target.setLevel(logger.level)
+
+    def stop(self):
+        """ Writes the queued records and stops the background thread """
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+class RequestLog():
+    """ Writes one structured line per request, sampling the successful ones """
+
+    def __init__(self, logger, sample_rate=1.0, slow_seconds=1.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    def configure(self, sample_rate, slow_seconds):
+        """ Sets the share of the fast successful requests logged, and when one is slow """
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    def sampled(self, status, seconds):
+        """ Returns the rate the request is logged at, or 0 when it is skipped """
+        if status >= 400 or seconds >= self.slow_seconds:
+            return 1.0
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return self.sample_rate
+        return 0
+
+    def log(self, status, seconds, **fields):
+        """ Writes the line of a request when it is sampled """
+        rate = self.sampled(status, seconds)
+        if rate and self.logger.isEnabledFor(logging.INFO):
+            fields.update(status=status, ms=round(seconds * 1000, 2), sample=rate)
+            self.logger.info("request %s", Fields(fields))
+
+# The pipeline of the service loggers, started in service/__init__.py
+PIPELINE = LogPipeline()
+
+# The request lines, written through the handlers of the app logger ("service")
+REQUEST_LOG = RequestLog(logging.getLogger("service.requests"))
@@ -0,0 +1,166 @@
+"""
+Metrics
+
+In-process request and database metrics, exposed in the Prometheus text
+format by GET /metrics.
+The routes time every request (by method, route template and status) and
+count the requests in flight; the engine events time every statement sent
+to the database (by operation). Recording an observation costs a bisect and
+a short lock, so the instrumentation stays on in production.
+Like the other statistics, the metrics are per process: Prometheus scrapes
+each worker, or the sums are taken over the instances.
+"""
+import time
+import threading
+from bisect import bisect_left
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the latency buckets, +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape(value):
+    """ Escapes a label value of the text format """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=""):
+    """ Returns the {name="value",...} part of a sample """
+    pairs = ['{}="{}"'.format(name, escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram():
+    """ Thread-safe latency histograms, one per combination of label values """
+
+    def __init__(self, name, description, labels, buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, values, seconds):
+        """ Records a duration for the label values (a tuple) """
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                # The counts of each bucket followed by the sum of the observations
+                series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        """ Returns the histograms in the text format, with cumulative buckets """
+        with self._lock:
+            series = sorted((values, list(counts)) for values, counts in self._series.items())
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} histogram".format(self.name)]
+        for values, counts in series:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, format_labels(self.labels, values, 'le="{}"'.format(bound)), total))
+            labels = format_labels(self.labels, values)
+            lines.append("{}_sum{} {}".format(self.name, labels, repr(counts[-1])))
+            lines.append("{}_count{} {}".format(self.name, labels, total))
+        return lines
+
+class Counter():
+    """ Thread-safe counters, one per combination of label values
+    kind "gauge" renders values that go up and down (inc() with -1)
+    """
+
+    def __init__(self, name, description, labels=(), kind="counter"):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, values=(), amount=1):
+        """ Adds amount to the series of the label values (a tuple) """
+        with self._lock:
+            self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        """ Returns the series in the text format """
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} {}".format(self.name, self.kind)]
+        lines.extend("{}{} {}".format(self.name, format_labels(self.labels, values), value)
+                     for values, value in series)
+        return lines
+
+def sample(name, description, kind, value):
+    """ Returns a single unlabelled sample computed at scrape time """
+    return ["# HELP {} {}".format(name, description), "# TYPE {} {}".format(name, kind),
+            "{} {}".format(name, value)]
+
+class Metrics():
+    """ The metrics of the service """
+
+    def __init__(self):
+        self.requests = Histogram("inventory_http_request_duration_seconds",
+                                  "Time to handle a request, until its response is returned",
+                                  ("method", "route", "status"))
+        self.in_flight = Counter("inventory_http_requests_in_flight",
+                                 "Requests being handled", ("method", "route"), kind="gauge")
+        self.queries = Histogram("inventory_db_query_duration_seconds",
+                                 "Time to execute a statement on the database", ("operation",))
+        self.query_errors = Counter("inventory_db_query_errors_total",
+                                    "Statements that failed on the database", ("operation",))
+
+    def attach(self, engine):
+        """ Times the statements of the engine (only once per engine) """
+        for name, listener in (("before_cursor_execute", self._before_execute),
+                               ("after_cursor_execute", self._after_execute),
+                               ("handle_error", self._on_error)):
+            if not event.contains(engine, name, listener):
+                event.listen(engine, name, listener)
+
+    def request_started(self, method, route):
+        """ Counts a request in flight, returns its start time """
+        self.in_flight.inc((method, route))
+        return time.perf_counter()
+
+    def request_finished(self, method, route, status, start):
+        """ Records the latency of a request started at start, returns it in seconds """
+        seconds = time.perf_counter() - start
+        self.requests.observe((method, route, str(status)), seconds)
+        self.in_flight.inc((method, route), -1)
+        return seconds
+
+    def render(self, *extra):
+        """ Returns all of the metrics in the text format, with the extra lines """
+        lines = []
+        for metric in (self.requests, self.in_flight, self.queries, self.query_errors):
+            lines.extend(metric.render())
+        for more in extra:
+            lines.extend(more)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def operation(statement):
+        """ Returns the kind of a statement: select, insert, update, delete, with... """
+        words = statement[:16].split(None, 1)
+        return words[0].lower() if words else "other"
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries.observe((self.operation(statement),),
+                             time.perf_counter() - context.metrics_start)
+
+    def _on_error(self, exception_context):
+        statement = exception_context.statement
+        self.query_errors.inc((self.operation(statement) if statement else "other",))
+
+# The metrics of the service, attached to the engine by model.PooledSQLAlchemy
+METRICS = Metrics()
@@ -0,0 +1,200 @@
+"""
+Schema migrations for the Inventory service
+
+DB.create_all() only creates missing tables, so changes to existing tables
+(new indexes, new columns) are applied here. Every migration has a version and
+is recorded in the schema_version table once applied, so existing production
+tables are upgraded in place without a drop / recreate.
+Migrations must be idempotent: on a fresh database create_all() has already
+built the latest schema and the migrations only get recorded.
+"""
+import logging
+from datetime import datetime
+from flask_sqlalchemy import sqlalchemy
+from service.pool import disable_statement_timeout
+
+LOGGER = logging.getLogger("flask.app")
+
+METADATA = sqlalchemy.MetaData()
+SCHEMA_VERSION = sqlalchemy.Table(
+    "schema_version", METADATA,
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("description", sqlalchemy.String(200)),
+    sqlalchemy.Column("applied_at", sqlalchemy.DateTime)
+)
+
+################################################################################
+# HELPERS
+################################################################################
+def is_concurrent(conn):
+    """ Whether conn builds indexes without blocking the writes (see concurrent()) """
+    return conn.dialect.name == "postgresql" and \
+        conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+
+def create_index(conn, name, table, columns, where=None):
+    """ Creates an index unless it already exists
+    In a concurrent() migration on Postgres the index is built CONCURRENTLY, after
+    dropping the invalid index a failed concurrent build leaves behind
+    """
+    concurrently = is_concurrent(conn)
+    if concurrently and conn.execute(sqlalchemy.text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"), name=name).first():
+        drop_index(conn, name)
+    ddl = "CREATE INDEX {}IF NOT EXISTS {} ON {} ({})".format(
+        "CONCURRENTLY " if concurrently else "", name, table, ", ".join(columns))
+    if where:
+        ddl = "{} WHERE {}".format(ddl, where)
+    conn.execute(ddl)
+
+def drop_index(conn, name):
+    """ Drops an index if it exists """
+    conn.execute("DROP INDEX {}IF EXISTS {}".format(
+        "CONCURRENTLY " if is_concurrent(conn) else "", name))
+
+def add_column(conn, table, column, ddl):
+    """ Adds a column unless it already exists
+    Args: ddl (String): the column type and constraints, e.g. "INTEGER NOT NULL DEFAULT 1"
+    """
+    columns = [col["name"] for col in sqlalchemy.inspect(conn).get_columns(table)]
+    if column not in columns:
+        conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, ddl))
+
+def concurrent(migrate):
+    """ Marks a migration that only builds indexes: on Postgres it runs outside of any
+    transaction, on an autocommit connection, so CREATE INDEX CONCURRENTLY can build
+    them without blocking the writes to the table (see run_concurrently())
+    """
+    migrate.concurrent = True
+    return migrate
+
+################################################################################
+# MIGRATIONS
+################################################################################
+@concurrent
+def secondary_indexes(conn):
+    """ Indexes the columns the list endpoint filters on """
+    create_index(conn, "ix_inventory_condition", "inventory", ["condition"])
+    create_index(conn, "ix_inventory_quantity", "inventory", ["quantity"])
+    create_index(conn, "ix_inventory_available_quantity", "inventory",
+                 ["available", "quantity"])
+
+def row_version(conn):
+    """ Adds the version of each record, incremented by every write """
+    add_column(conn, "inventory", "version", "INTEGER NOT NULL DEFAULT 1")
+
+@concurrent
+def low_stock_index(conn):
+    """ Indexes the records to restock: a partial index, only they are in it """
+    create_index(conn, "ix_inventory_low_stock", "inventory", ["product_id", "condition"],
+                 where="quantity <= restock_level")
+
+def inventory_summary(conn):
+    """ Builds the totals by condition and availability, maintained by the writes
+    On Postgres the inventory table is locked against writes (SHARE mode) while they
+    are summed, like InventorySummary.rebuild(), so no write is lost or counted twice
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute("LOCK TABLE inventory IN SHARE MODE")
+    conn.execute("CREATE TABLE IF NOT EXISTS inventory_summary ("
+                 "condition VARCHAR(100) NOT NULL, available INTEGER NOT NULL, "
+                 "records BIGINT NOT NULL, quantity BIGINT NOT NULL, "
+                 "PRIMARY KEY (condition, available))")
+    conn.execute("DELETE FROM inventory_summary")
+    conn.execute("INSERT INTO inventory_summary (condition, available, records, quantity) "
+                 "SELECT condition, available, count(*), coalesce(sum(quantity), 0) "
+                 "FROM inventory WHERE condition IS NOT NULL AND available IS NOT NULL "
+                 "GROUP BY condition, available")
+
+@concurrent
+def pagination_indexes(conn):
+    """ Ends the filter indexes with the pagination key (product_id), so a filtered page
+    is read in order instead of sorting every matching record
+    """
+    create_index(conn, "ix_inventory_condition_product", "inventory",
+                 ["condition", "product_id"])
+    create_index(conn, "ix_inventory_available_quantity_product", "inventory",
+                 ["available", "quantity", "product_id"])
+    # Prefixes of the new indexes
+    drop_index(conn, "ix_inventory_condition")
+    drop_index(conn, "ix_inventory_available_quantity")
+
+@concurrent
+def low_stock_condition_index(conn):
+    """ Indexes the records to restock by condition, so the low stock pages of a
+    condition are read in order without reading the other conditions
+    """
+    create_index(conn, "ix_inventory_low_stock_condition", "inventory",
+                 ["condition", "product_id"], where="quantity <= restock_level")
+
+def inventory_events(conn):
+    """ Creates the change feed shared by the workers, ids from a sequence of the DB """
+    key = "BIGSERIAL" if conn.dialect.name == "postgresql" else "INTEGER"
+    conn.execute("CREATE TABLE IF NOT EXISTS inventory_events ("
+                 "id {} NOT NULL PRIMARY KEY, name VARCHAR(20) NOT NULL, "
+                 "data TEXT NOT NULL)".format(key))
+
+# (version, description, migration) in the order they must be applied
+MIGRATIONS = [
+    (1, "Secondary indexes on condition, quantity and (available, quantity)",
+     secondary_indexes),
+    (2, "Row version column on inventory", row_version),
+    (3, "Partial index on the records with quantity <= restock_level", low_stock_index),
+    (4, "Inventory totals by condition and availability", inventory_summary),
+    (5, "Indexes on (condition, product_id) and (available, quantity, product_id)",
+     pagination_indexes),
+    (6, "Partial index on (condition, product_id) of the records with "
+        "quantity <= restock_level", low_stock_condition_index),
+    (7, "Change feed events shared by the workers", inventory_events),
+]
+
+################################################################################
+# RUNNER
+################################################################################
+def current_version(engine):
+    """ Returns the latest applied migration version (0 if none) """
+    SCHEMA_VERSION.create(engine, checkfirst=True)
+    query = sqlalchemy.select([sqlalchemy.func.max(SCHEMA_VERSION.c.version)])
+    return engine.execute(query).scalar() or 0
+
+def run_concurrently(engine, migrate):
+    """ Runs a concurrent() migration on an autocommit Postgres connection
+    CREATE INDEX CONCURRENTLY can not run in a transaction, nor while this process
+    holds one open: the version is only recorded once the indexes are built.
+    A failed build is retried on the next upgrade (the migrations are idempotent)
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute("SET statement_timeout = 0")
+        try:
+            migrate(conn)
+        finally:
+            conn.execute("RESET statement_timeout")
+
+def upgrade(engine, target=None):
+    """ Applies the pending migrations up to target (default: all of them)
+    Each migration runs in its own transaction together with its schema_version row,
+    so a failed migration is rolled back and retried on the next upgrade. When several
+    workers upgrade at once the version row makes all but one of them skip it.
+    On Postgres the concurrent() migrations run before their transaction instead.
+    """
+    version = current_version(engine)
+    for number, description, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        try:
+            if getattr(migrate, "concurrent", False) and engine.dialect.name == "postgresql":
+                LOGGER.info("Applying migration %s concurrently: %s", number, description)
+                run_concurrently(engine, migrate)
+                migrate = None
+            with engine.begin() as conn:
+                conn.execute(SCHEMA_VERSION.insert().values(
+                    version=number, description=description, applied_at=datetime.utcnow()))
+                if migrate:
+                    LOGGER.info("Applying migration %s: %s", number, description)
+                    disable_statement_timeout(conn)
+                    migrate(conn)
+        except sqlalchemy.exc.IntegrityError:
+            LOGGER.info("Migration %s was applied by another process", number)
+        version = number
+    return version
@@ -2,13 +2,44 @@
 Models for Inventory
 All of the models are stored in this module
 """
+import io
+import re
+import csv
+import json
+import base64
 import logging
+import hashlib
+import binascii
+from collections import namedtuple
 from flask_sqlalchemy import SQLAlchemy, sqlalchemy
-from service import keys
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
+from service import keys, migrations
+from service.cache import RecordCache
+from service.pool import POOL_STATS, disable_statement_timeout
+from service.metrics import METRICS
 LOGGER = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-DB = SQLAlchemy()
+class PooledSQLAlchemy(SQLAlchemy):
+    """ Reports the pool and the statements of each engine to POOL_STATS and METRICS,
+    when the engine is first used
+    """
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        POOL_STATS.attach(engine)
+        METRICS.attach(engine)
+        return engine
+
+# Create the SQLAlchemy object to be initialized later in init_app()
+DB = PooledSQLAlchemy()
+
+# Cache of the read-only InventoryRow records by (product_id, condition), sized in init_db()
+CACHE = RecordCache()
+
+# Cache of the QueryPlan of Inventory.explain(), refreshed every PLAN_CACHE_TTL seconds
+# as the statistics of the table change
+PLANS = RecordCache(keys.PLAN_CACHE_SIZE, keys.PLAN_CACHE_TTL)
 
 class DataValidationError(Exception):
     """ Used for an data validation errors when deserializing """
@@ -16,6 +47,185 @@ class DataValidationError(Exception):
 class DBError(Exception):
     """ Used for an DB connectivity errors """
 
+class VersionConflictError(Exception):
+    """ Used when a record was changed by another write since it was read """
+
+# The records to restock, and the partial indexes holding only them: in the pagination
+# order, and by condition then in the pagination order
+LOW_STOCK = "quantity <= restock_level"
+LOW_STOCK_INDEX = "ix_inventory_low_stock"
+LOW_STOCK_CONDITION_INDEX = "ix_inventory_low_stock_condition"
+
+# The columns of the read-only rows, in the order they are selected
+ROW_FIELDS = keys.RECORD_FIELDS + (keys.KEY_VERSION,)
+
+# The plan of a query, from the EXPLAIN of the database (see Inventory.explain()): the
+# index read (None for a scan of the table), whether it is searched on a condition
+# rather than read whole, and whether the rows read are then sorted
+QueryPlan = namedtuple("QueryPlan", ["index", "search", "sort"])
+
+# A table access of SQLite's EXPLAIN QUERY PLAN, e.g.
+# "SEARCH inventory USING INDEX ix_inventory_condition_product (condition=?)"
+SQLITE_ACCESS = re.compile(r"^(SEARCH|SCAN)(?: TABLE)? (\w+)"
+                           r"(?: USING (?:COVERING )?INDEX (\w+)| USING (PRIMARY KEY))?")
+
+def sqlite_plan(details, table, pkey):
+    """ Returns the QueryPlan of the detail lines of an EXPLAIN QUERY PLAN """
+    index, search, sort = None, False, False
+    for detail in details:
+        if detail.startswith("USE TEMP B-TREE FOR"):
+            sort = True
+        match = SQLITE_ACCESS.match(detail)
+        if match and match.group(2) == table:
+            index = match.group(3) or match.group(4)
+            if index and (index == "PRIMARY KEY" or index.startswith("sqlite_autoindex_")):
+                index = pkey
+            search = match.group(1) == "SEARCH"
+    return QueryPlan(index, search, sort)
+
+class Explain(sqlalchemy.sql.expression.Executable, sqlalchemy.sql.expression.ClauseElement):
+    """ The EXPLAIN of a statement, run like the statement itself (see Inventory.explain()) """
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    """ EXPLAIN (FORMAT JSON) on Postgres, EXPLAIN QUERY PLAN on SQLite """
+    prefix = "EXPLAIN (FORMAT JSON) " if compiler.dialect.name == "postgresql" else \
+        "EXPLAIN QUERY PLAN "
+    return prefix + compiler.process(element.stmt, **kw)
+
+def postgres_plan(node):
+    """ Returns the QueryPlan of the root node of an EXPLAIN (FORMAT JSON) """
+    index, search, sort = None, False, False
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] in ("Sort", "Incremental Sort"):
+            sort = True
+        if "Index Name" in node and index is None:
+            index, search = node["Index Name"], "Index Cond" in node
+        nodes.extend(node.get("Plans", []))
+    return QueryPlan(index, search, sort)
+
+class InventoryRow(namedtuple("InventoryRow", ROW_FIELDS)):
+    """
+    A read-only Inventory record: its columns without any session or change
+    tracking state. Returned by the read-only queries of Inventory (select_rows)
+    """
+    __slots__ = ()
+
+    def serialize(self):
+        """ Serializes an Inventory row into a dictionary """
+        return dict(zip(keys.RECORD_FIELDS, self))
+
+    def etag(self):
+        """ Returns the strong entity tag of the record
+        Any write changes the version, and a deleted and re-created record has
+        different values, so the tag changes along with the record
+        """
+        return hashlib.sha1(repr(tuple(self)).encode("utf-8")).hexdigest()
+
+def coerce_int(value):
+    """ Returns value as an int when it is one or a string of digits, None otherwise """
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, str) and value.isdigit():
+        try:
+            return int(value)
+        except ValueError:  # digits that are not decimal, like superscripts
+            return None
+    return None
+
+class RecordValidator():
+    """
+    Coerces and validates Inventory records in a single pass
+    The integers may be strings of digits; the allowed values and the bounds
+    (keys.CONDITIONS, keys.QTY_LOW...) are looked up once, when it is created.
+    deserialize() and validate_data() of Inventory, and the bulk paths (one
+    call for all of the records), go through it
+    """
+    LABELS = ("Product ID", "Condition", "Quantity", "Restock Level", "Available")
+
+    def __init__(self):
+        self.conditions = frozenset(keys.CONDITIONS)
+        self.availability = frozenset((keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE))
+        self.quantity_range = (keys.QTY_LOW, keys.QTY_HIGH)
+        self.restock_range = (keys.QTY_LOW, keys.RESTOCK_LVL)
+
+    @staticmethod
+    def extract(data):
+        """ Returns the raw (product_id, condition, quantity, restock_level, available)
+        of a record dictionary
+        Raises: DataValidationError if it is not a dictionary or misses a field
+        """
+        try:
+            pid, qty, lvl = data[keys.KEY_PID], data[keys.KEY_QTY], data[keys.KEY_LVL]
+            return pid, data[keys.KEY_CND], qty, lvl, data[keys.KEY_AVL]
+        except KeyError as error:
+            raise DataValidationError("Invalid Inventory record: missing " + error.args[0])
+        except TypeError:
+            raise DataValidationError("Invalid Inventory record: body contained bad or no data")
+
+    def coerce(self, pid, cnd, qty, lvl, avl):
+        """ Returns the row of the coerced values (None when invalid) and the labels
+        of the invalid fields
+        """
+        # Inlined: called for every record of the bulk paths. The ints (JSON numbers)
+        # are taken as they are, the other values go through coerce_int()
+        errors = []
+        if type(pid) is not int:  # pylint: disable=unidiomatic-typecheck
+            pid = coerce_int(pid)
+        if pid is None or pid < 0:
+            errors.append(self.LABELS[0])
+        if not isinstance(cnd, str) or cnd not in self.conditions:
+            errors.append(self.LABELS[1])
+        if type(qty) is not int:  # pylint: disable=unidiomatic-typecheck
+            qty = coerce_int(qty)
+        if qty is None or not self.quantity_range[0] <= qty <= self.quantity_range[1]:
+            errors.append(self.LABELS[2])
+        if type(lvl) is not int:  # pylint: disable=unidiomatic-typecheck
+            lvl = coerce_int(lvl)
+        if lvl is None or not self.restock_range[0] <= lvl <= self.restock_range[1]:
+            errors.append(self.LABELS[3])
+        if type(avl) is not int:  # pylint: disable=unidiomatic-typecheck
+            avl = coerce_int(avl)
+        if avl not in self.availability:
+            errors.append(self.LABELS[4])
+        return {keys.KEY_PID: pid, keys.KEY_CND: cnd, keys.KEY_QTY: qty, keys.KEY_LVL: lvl,
+                keys.KEY_AVL: avl}, errors
+
+    def validate(self, data):
+        """ Returns the row of the coerced values of a record dictionary
+        Raises: DataValidationError if the record is malformed or invalid
+        """
+        row, errors = self.coerce(*self.extract(data))
+        if errors:
+            raise DataValidationError("Error in data: {}".format(errors))
+        return row
+
+    def validate_batch(self, records):
+        """ Validates many record dictionaries
+        Returns: the (index, row) of the valid records and the {index: message} of the others
+        """
+        rows, errors = [], {}
+        extract, coerce = self.extract, self.coerce
+        for index, data in enumerate(records):
+            try:
+                row, invalid = coerce(*extract(data))
+            except DataValidationError as err:
+                errors[index] = str(err)
+                continue
+            if invalid:
+                errors[index] = "Error in data: {}".format(invalid)
+            else:
+                rows.append((index, row))
+        return rows, errors
+
+# Validates the records of all of the Inventory paths
+VALIDATOR = RecordValidator()
+
 ################################################################################
 class Inventory(DB.Model):
     """
@@ -24,11 +234,32 @@ class Inventory(DB.Model):
     app = None
 
     # Table Schema
+    __table_args__ = (
+        # Ending in product_id, the filtered pages are read in the pagination order
+        DB.Index("ix_inventory_condition_product", "condition", "product_id"),
+        DB.Index("ix_inventory_quantity", "quantity"),
+        DB.Index("ix_inventory_available_quantity_product", "available", "quantity",
+                 "product_id"),
+        # Partial: hold only the records to restock, in the pagination order
+        DB.Index(LOW_STOCK_INDEX, "product_id", "condition",
+                 postgresql_where=sqlalchemy.text(LOW_STOCK),
+                 sqlite_where=sqlalchemy.text(LOW_STOCK)),
+        DB.Index(LOW_STOCK_CONDITION_INDEX, "condition", "product_id",
+                 postgresql_where=sqlalchemy.text(LOW_STOCK),
+                 sqlite_where=sqlalchemy.text(LOW_STOCK)),
+    )
+    # The old values of the summarized columns are loaded when they are set, so
+    # update() can move the record out of its old totals (see loaded())
     product_id = DB.Column(DB.Integer, primary_key=True)
-    condition = DB.Column(DB.String(100), primary_key=True)
-    quantity = DB.Column(DB.Integer)
+    condition = DB.column_property(DB.Column(DB.String(100), primary_key=True),
+                                   active_history=True)
+    quantity = DB.column_property(DB.Column(DB.Integer), active_history=True)
     restock_level = DB.Column(DB.Integer)
-    available = DB.Column(DB.Integer)
+    available = DB.column_property(DB.Column(DB.Integer), active_history=True)
+    # Incremented by every write of the record. The ORM compares it in the WHERE
+    # clause of its UPDATEs, see update(); restock() increments it in SQL
+    version = DB.Column(DB.Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
 
     def __repr__(self):
         return "<<product_id %d>" % (self.product_id)
@@ -45,32 +276,50 @@ class Inventory(DB.Model):
             keys.KEY_AVL: self.available
         }
 
+    def row(self):
+        """ Returns the current values of the record as a read-only InventoryRow """
+        return InventoryRow._make(getattr(self, name) for name in ROW_FIELDS)
+
     # Args: data (dict): A dictionary containing the resource data
     def deserialize(self, data):
-        """ Deserializes an Inventory record from a dictionary """
-        try:
-            self.product_id = data[keys.KEY_PID]
-            self.quantity = data[keys.KEY_QTY]
-            self.restock_level = data[keys.KEY_LVL]
-            self.condition = data[keys.KEY_CND]
-            self.available = data[keys.KEY_AVL]
-            return self
-        except KeyError as error:
-            raise DataValidationError("Invalid Inventory record: missing " + error.args[0])
-        except TypeError as error:
-            raise DataValidationError("Invalid Inventory record: body contained bad or no data")
+        """ Deserializes an Inventory record from a dictionary
+        The values are coerced (strings of digits to integers) in the same pass that
+        validates them; the invalid ones are kept as they were sent, and reported by
+        validate_data() without validating the record again
+        """
+        sent = VALIDATOR.extract(data)
+        row, errors = VALIDATOR.coerce(*sent)
+        values = tuple(sent[index] if row[name] is None else row[name]
+                       for index, name in enumerate(keys.RECORD_FIELDS))
+        (self.product_id, self.condition, self.quantity, self.restock_level,
+         self.available) = values
+        self._validated = (values, errors)
+        return self
+
+    @classmethod
+    def init_app(cls, app):
+        """ Binds the model to the app without connecting to the database
+        The engine is created on first use, the schema is managed by init_db()
+        """
+        LOGGER.info("Initializing the model")
+        cls.app = app
+        CACHE.configure(app.config.get(keys.KEY_CACHE_SIZE, keys.CACHE_SIZE_DEFAULT),
+                        app.config.get(keys.KEY_CACHE_TTL, keys.CACHE_TTL_DEFAULT))
+
+        # This is where we initialize SQLAlchemy from the Flask app
+        DB.init_app(app)
 
     @classmethod
     def init_db(cls, app):
-        """ Initializes the database session """
+        """ Initializes the database session and brings the schema up to date """
         try:
             LOGGER.info("Initializing database")
-            cls.app = app
-
-            # This is where we initialize SQLAlchemy from the Flask app
-            DB.init_app(app)
-            app.app_context().push()
-            DB.create_all()  # make our sqlalchemy tables
+            cls.init_app(app)
+            # The context only lives for the setup: each request (or CLI command) pushes
+            # its own, whose scoped session is removed when the request ends
+            with app.app_context():
+                DB.create_all()  # make our sqlalchemy tables
+                migrations.upgrade(DB.engine)  # bring existing tables up to date
         except sqlalchemy.exc.ArgumentError as err:
             raise DBError("Invalid DB connection: {}".format(err))
         except sqlalchemy.exc.OperationalError as err:
@@ -83,113 +332,377 @@ class Inventory(DB.Model):
         """
         VALIDATING DATA FORMATS
         """
-        args = []
-
-        res_pid = self.validate_data_product_id()
-        if not res_pid:
-            args.append("Product ID")
-
-        res_cnd = self.validate_data_condition()
-        if not res_cnd:
-            args.append("Condition")
-
-        res_qty = self.validate_data_quantity()
-        if not res_qty:
-            args.append("Quantity")
-
-        res_lvl = self.validate_data_restock_level()
-        if not res_lvl:
-            args.append("Restock Level")
-
-        res_avl = self.validate_data_available()
-        if not res_avl:
-            args.append("Available")
-
-        if not (res_pid and res_cnd and res_qty and res_lvl and res_avl):
-            msg = "Error in data: {}".format(args)
-            raise DataValidationError(msg)
+        errors = self.invalid_fields()
+        if errors:
+            raise DataValidationError("Error in data: {}".format(errors))
         return True
 
+    def invalid_fields(self):
+        """ Returns the labels of the fields with invalid values (see RecordValidator)
+        The result is kept until one of the values changes
+        """
+        values = (self.product_id, self.condition, self.quantity, self.restock_level,
+                  self.available)
+        validated = getattr(self, "_validated", None)
+        if validated is None or validated[0] != values:
+            validated = self._validated = (values, VALIDATOR.coerce(*values)[1])
+        return validated[1]
+
     def validate_data_product_id(self):
         """
         Validating Product ID format
         """
-        pid = self.product_id
-        if isinstance(pid, str):
-            return pid.isdigit() and int(pid) >= 0
-        return isinstance(pid, int) and pid >= 0
+        return RecordValidator.LABELS[0] not in self.invalid_fields()
 
     def validate_data_condition(self):
         """
         validating Condition format
         """
-        cnd = self.condition
-        return isinstance(cnd, str) and cnd in keys.CONDITIONS
+        return RecordValidator.LABELS[1] not in self.invalid_fields()
 
     def validate_data_quantity(self):
         """
         Validating Quantity format
         """
-        qty = self.quantity
-        if isinstance(qty, str):
-            return qty.isdigit() and (keys.QTY_LOW <= int(qty) <= keys.QTY_HIGH)
-        return isinstance(qty, int) and (keys.QTY_LOW <= qty <= keys.QTY_HIGH)
+        return RecordValidator.LABELS[2] not in self.invalid_fields()
 
     def validate_data_restock_level(self):
         """
         Validating Restock level format
         """
-        lvl = self.restock_level
-        if isinstance(lvl, str):
-            return lvl.isdigit() and (keys.QTY_LOW <= int(lvl) <= keys.RESTOCK_LVL)
-        return isinstance(lvl, int) and (keys.QTY_LOW <= lvl <= keys.RESTOCK_LVL)
+        return RecordValidator.LABELS[3] not in self.invalid_fields()
 
     def validate_data_available(self):
         """
         Validating Available format
         """
-        avl = self.available
-        if isinstance(avl, str):
-            return avl.isdigit() and int(avl) in [keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE]
-        return isinstance(avl, int) and avl in [keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE]
+        return RecordValidator.LABELS[4] not in self.invalid_fields()
 
     ######################################################################
     def create(self):
         """
         Creates an Inventory record to the database
         """
-        LOGGER.info("Creating {}".format(self.product_id))
+        LOGGER.debug("Creating %s", self.product_id)
         DB.session.add(self)
+        DB.session.flush()
+        deltas = {}
+        InventorySummary.add(deltas, self.condition, self.available, 1, self.quantity)
+        InventorySummary.apply(deltas)
         DB.session.commit()
+        CACHE.invalidate((self.product_id, self.condition))
+
+    @classmethod
+    def bulk_create(cls, records):
+        """
+        Creates many Inventory records in a single transaction
+        All of the records are validated first, the existing keys are looked up with
+        set-based queries and the new records are inserted with executemany() (sent as
+        multi-row VALUES pages on Postgres, see SQLALCHEMY_ENGINE_OPTIONS).
+        Args: records (list): the dictionaries of the records to create
+        Returns: a result per record with its status (created, invalid or conflict)
+        """
+        LOGGER.debug("Creating %s records in bulk", len(records))
+        results = [{keys.KEY_INDEX: index, keys.KEY_STATUS: keys.STATUS_CREATED,
+                    keys.KEY_MESSAGE: None} for index in range(len(records))]
+        valid, errors = VALIDATOR.validate_batch(records)
+        for index, message in errors.items():
+            results[index].update({keys.KEY_STATUS: keys.STATUS_INVALID, keys.KEY_MESSAGE: message})
+        rows = {}
+        for index, row in valid:
+            result = results[index]
+            result.update({keys.KEY_PID: row[keys.KEY_PID], keys.KEY_CND: row[keys.KEY_CND]})
+            key = (row[keys.KEY_PID], row[keys.KEY_CND])
+            if key in rows:
+                result.update({keys.KEY_STATUS: keys.STATUS_CONFLICT,
+                               keys.KEY_MESSAGE: "Duplicate of record {}".format(rows[key][0])})
+                continue
+            rows[key] = (index, row)
+
+        for key in cls.find_existing_keys(rows.keys()):
+            index, _ = rows.pop(key)
+            results[index].update({keys.KEY_STATUS: keys.STATUS_CONFLICT,
+                                   keys.KEY_MESSAGE: "Inventory with {} already exists".format(key)})
+
+        values = [row for _, row in rows.values()]
+        deltas = {}
+        for row in values:
+            InventorySummary.add(deltas, row[keys.KEY_CND], row[keys.KEY_AVL], 1,
+                                 row[keys.KEY_QTY])
+        try:
+            if values:
+                DB.session.execute(cls.__table__.insert(), values)
+            InventorySummary.apply(deltas)
+            DB.session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            # Some of the keys were created concurrently since they were looked up
+            DB.session.rollback()
+            for index, _ in rows.values():
+                results[index].update({keys.KEY_STATUS: keys.STATUS_CONFLICT,
+                                       keys.KEY_MESSAGE: "Conflicting concurrent insert, retry"})
+        return results
+
+    @classmethod
+    def bulk_load(cls, rows):
+        """
+        Loads validated rows (see RecordValidator) and commits them with their summary
+        The rows whose key already exists, or repeats an earlier row, are skipped, so
+        loading the same rows again is harmless. The new rows are sent with COPY on
+        Postgres and with executemany() elsewhere. Used by the CSV importer (importer.py)
+        Returns: the number of rows loaded and the number skipped
+        """
+        LOGGER.debug("Loading %s rows", len(rows))
+        new = {}
+        for row in rows:
+            new.setdefault((row[keys.KEY_PID], row[keys.KEY_CND]), row)
+        for key in cls.find_existing_keys(new.keys()):
+            del new[key]
+        values = list(new.values())
+        deltas = {}
+        for row in values:
+            InventorySummary.add(deltas, row[keys.KEY_CND], row[keys.KEY_AVL], 1,
+                                 row[keys.KEY_QTY])
+        conn = DB.session.connection()
+        disable_statement_timeout(conn)
+        if values and conn.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([row[name] for name in keys.RECORD_FIELDS]
+                                         for row in values)
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            try:
+                cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+                    cls.__table__.name, ", ".join(keys.RECORD_FIELDS)), buffer)
+            finally:
+                cursor.close()
+        elif values:
+            conn.execute(cls.__table__.insert(), values)
+        InventorySummary.apply(deltas)
+        DB.session.commit()
+        CACHE.invalidate(*new.keys())
+        return len(values), len(rows) - len(values)
 
     ######################################################################
     def update(self):
         """
         Updates an Inventory record to the database
+        The UPDATE is a compare-and-swap on the version the record was read at
+        (... WHERE version = :v), so a write made since then is never overwritten
+        Raises: VersionConflictError if the record was changed since it was read
         """
-        LOGGER.info("Updating {}".format(self.product_id))
+        LOGGER.debug("Updating %s", self.product_id)
+        # The key may be changed by the update, so drop the one it was loaded with too
+        stale = [tuple(sqlalchemy.inspect(self).identity or ()),
+                 (self.product_id, self.condition)]
+        # Move the record from its totals as read to its totals as written
+        deltas = {}
+        InventorySummary.add(deltas, self.loaded(keys.KEY_CND), self.loaded(keys.KEY_AVL),
+                             -1, -int(self.loaded(keys.KEY_QTY) or 0))
+        InventorySummary.add(deltas, self.condition, self.available, 1, self.quantity)
+        try:
+            DB.session.flush()
+            InventorySummary.apply(deltas)
+            DB.session.commit()
+        except sqlalchemy.orm.exc.StaleDataError:
+            DB.session.rollback()
+            raise VersionConflictError("Inventory {} was changed by another request"
+                                       .format(stale[0]))
+        finally:
+            CACHE.invalidate(*stale)
+
+    def loaded(self, name):
+        """ Returns the value of an attribute as it was read from the database """
+        history = sqlalchemy.inspect(self).attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(self, name)
+
+    @classmethod
+    def restock(cls, pid, condition, amount):
+        """
+        Adds amount to the quantity of an Inventory record in a single UPDATE
+        The increment is done by the database (quantity = quantity + amount), so
+        concurrent restocks of the same record never lose updates.
+        Returns: the restocked record as a dictionary, or None if it does not exist
+        Raises: DataValidationError if the quantity would go above keys.QTY_HIGH
+        """
+        LOGGER.debug("Restocking (%s, %s) by %s", pid, condition, amount)
+        table = cls.__table__
+        key = sqlalchemy.and_(table.c.product_id == pid, table.c.condition == condition)
+        stmt = table.update()\
+            .where(key)\
+            .where(table.c.quantity + amount <= keys.QTY_HIGH)\
+            .values(quantity=table.c.quantity + amount, version=table.c.version + 1)
+        conn = DB.session.connection()
+        if conn.dialect.implicit_returning:
+            row = conn.execute(stmt.returning(*table.c)).first()
+        elif conn.execute(stmt).rowcount:
+            row = conn.execute(table.select().where(key)).first()
+        else:
+            row = None
+        if row is None:
+            # Nothing was updated: tell a missing record from an exceeded bound
+            exists = conn.execute(sqlalchemy.select([table.c.quantity]).where(key)).first()
+            DB.session.rollback()
+            if exists is None:
+                return None
+            raise DataValidationError("Error in data: ['Quantity'] would exceed {}"
+                                      .format(keys.QTY_HIGH))
+        deltas = {}
+        InventorySummary.add(deltas, row.condition, row.available, 0, amount)
+        InventorySummary.apply(deltas)
+        DB.session.commit()
+        CACHE.invalidate((pid, condition))
+        return dict(row)
+
+    @classmethod
+    def bulk_restock(cls, items):
+        """
+        Adds amounts to the quantities of many Inventory records in one transaction
+        The records are locked and read with set-based queries, every item is checked
+        in order against keys.QTY_HIGH and the increments are applied with a single
+        executemany() UPDATE (quantity = quantity + amount).
+        Args: items (list): the (product_id, condition, amount) to apply
+        Returns: a result per item with its status (restocked, invalid or not found)
+        """
+        LOGGER.debug("Restocking %s records in bulk", len(items))
+        table = cls.__table__
+        pairs = sorted({(pid, cnd) for pid, cnd, _ in items})
+        key = sqlalchemy.tuple_(table.c.product_id, table.c.condition)
+        quantities = {}
+        availability = {}
+        for start in range(0, len(pairs), keys.BULK_CHUNK_SIZE):
+            chunk = pairs[start:start + keys.BULK_CHUNK_SIZE]
+            query = sqlalchemy.select([table.c.product_id, table.c.condition,
+                                       table.c.quantity, table.c.available])\
+                .where(key.in_(chunk)).with_for_update()
+            for pid, cnd, qty, avl in DB.session.execute(query):
+                quantities[(pid, cnd)] = qty
+                availability[(pid, cnd)] = avl
+
+        results = []
+        increments = {}
+        for index, (pid, cnd, amount) in enumerate(items):
+            result = {keys.KEY_INDEX: index, keys.KEY_PID: pid, keys.KEY_CND: cnd,
+                      keys.KEY_STATUS: keys.STATUS_RESTOCKED, keys.KEY_MESSAGE: None}
+            results.append(result)
+            if (pid, cnd) not in quantities:
+                result.update({keys.KEY_STATUS: keys.STATUS_NOT_FOUND,
+                               keys.KEY_MESSAGE: "Inventory with ({}, {})".format(pid, cnd)})
+            elif quantities[(pid, cnd)] + amount > keys.QTY_HIGH:
+                result.update({keys.KEY_STATUS: keys.STATUS_INVALID,
+                               keys.KEY_MESSAGE: "Error in data: ['Quantity'] would exceed {}"
+                               .format(keys.QTY_HIGH)})
+            else:
+                quantities[(pid, cnd)] += amount
+                increments[(pid, cnd)] = increments.get((pid, cnd), 0) + amount
+            result[keys.KEY_QTY] = quantities.get((pid, cnd))
+
+        if increments:
+            stmt = table.update()\
+                .where(table.c.product_id == sqlalchemy.bindparam("b_pid"))\
+                .where(table.c.condition == sqlalchemy.bindparam("b_cnd"))\
+                .values(quantity=table.c.quantity + sqlalchemy.bindparam("b_amount"),
+                        version=table.c.version + 1)
+            DB.session.execute(stmt, [{"b_pid": pid, "b_cnd": cnd, "b_amount": amount}
+                                      for (pid, cnd), amount in increments.items()])
+        deltas = {}
+        for (pid, cnd), amount in increments.items():
+            InventorySummary.add(deltas, cnd, availability[(pid, cnd)], 0, amount)
+        InventorySummary.apply(deltas)
         DB.session.commit()
+        CACHE.invalidate(*increments.keys())
+        return results
 
     ######################################################################
     def delete(self):
-        """ Removes an Inventory record from the data store """
-        LOGGER.info("Deleting {}".format(self.product_id))
-        DB.session.delete(self)
+        """ Removes an Inventory record from the data store
+        The record is deleted by its key, whether or not it changed since it was read
+        """
+        LOGGER.debug("Deleting %s", self.product_id)
+        pid, condition = sqlalchemy.inspect(self).identity
+        Inventory.delete_where(Inventory.product_id == pid, Inventory.condition == condition)
+        if self in DB.session:
+            DB.session.expunge(self)
         DB.session.commit()
+        CACHE.invalidate((pid, condition))
+
+    @classmethod
+    def delete_where(cls, *criteria):
+        """ Deletes the Inventory records matching all of the criteria, and takes them
+        off the InventorySummary totals, in the current transaction
+        Returns: the number of records deleted
+        """
+        table = cls.__table__
+        where = sqlalchemy.and_(*criteria)
+        conn = DB.session.connection()
+        if conn.dialect.implicit_returning:
+            # Totals of the rows the DELETE actually removed (RETURNING)
+            rows = table.delete().where(where)\
+                .returning(table.c.condition, table.c.available, table.c.quantity)\
+                .cte("removed")
+        else:
+            rows = table.select().where(where).alias("removed")
+        totals = sqlalchemy.select([rows.c.condition, rows.c.available,
+                                    sqlalchemy.func.count(), sqlalchemy.func.sum(rows.c.quantity)])\
+            .group_by(rows.c.condition, rows.c.available)
+        groups = conn.execute(totals).fetchall()
+        if not conn.dialect.implicit_returning:
+            conn.execute(table.delete().where(where))
+        deltas = {}
+        for cnd, avl, count, quantity in groups:
+            InventorySummary.add(deltas, cnd, avl, -count, -int(quantity or 0))
+        InventorySummary.apply(deltas)
+        return sum(count for _, _, count, _ in groups)
+
+    @classmethod
+    def delete_by_filter(cls, query):
+        """ Removes the Inventory records matching an InventoryFilter
+        Returns: the number of records removed
+        """
+        LOGGER.debug("Deleting records matching %s", query)
+        deleted = cls.delete_where(*query.criteria)
+        DB.session.commit()
+        CACHE.clear()
+        return deleted
+
+    @classmethod
+    def delete_by_keys(cls, pairs):
+        """ Removes the Inventory records with the given (product_id, condition) keys
+        Returns: the number of records removed
+        """
+        LOGGER.debug("Deleting %s records in bulk", len(pairs))
+        pairs = sorted(set(pairs))
+        key = sqlalchemy.tuple_(cls.product_id, cls.condition)
+        deleted = 0
+        for start in range(0, len(pairs), keys.BULK_CHUNK_SIZE):
+            chunk = pairs[start:start + keys.BULK_CHUNK_SIZE]
+            deleted += cls.delete_where(key.in_(chunk))
+        DB.session.commit()
+        CACHE.invalidate(*pairs)
+        return deleted
 
     ######################################################################
     @classmethod
     def find_all(cls):
         """ Returns all of the Inventory records in the database """
-        LOGGER.info("Processing GET all Inventory records")
+        LOGGER.debug("Processing GET all Inventory records")
         return cls.query.all()
 
+    @classmethod
+    def stream_all(cls, batch_size=keys.EXPORT_BATCH_SIZE):
+        """ Yields all of the Inventory records in the database, ordered by key
+        The records are read through a server-side cursor, batch_size rows at a time,
+        so the whole table is never held in memory
+        Args: batch_size (Integer): the number of records fetched per round trip
+        """
+        LOGGER.debug("Processing EXPORT of all Inventory records")
+        return cls.query.order_by(cls.product_id, cls.condition).yield_per(batch_size)
+
     @classmethod
     def find_by_product_id(cls, product_id):
         """ Returns the Inventory record with the given product_id
         Args: product_id (Integer): the product_id of the Inventory records you want to match
         """
-        LOGGER.info("Processing GET query for {}...".format(product_id))
+        LOGGER.debug("Processing GET query for %s...", product_id)
         return cls.query.filter(cls.product_id == product_id)
 
     @classmethod
@@ -197,7 +710,7 @@ class Inventory(DB.Model):
         """ Returns the Inventory record with the given condition
         Args: condition (String): the condition of the Inventory records you want to match
         """
-        LOGGER.info("Processing GET query for {}...".format(condition))
+        LOGGER.debug("Processing GET query for %s...", condition)
         return cls.query.filter(cls.condition == condition)
 
     @classmethod
@@ -205,7 +718,7 @@ class Inventory(DB.Model):
         """ Returns the Inventory record with the given availability
         Args: available (Integer): the availability of the Inventory records you want to match
         """
-        LOGGER.info("Processing GET query for {}...".format(available))
+        LOGGER.debug("Processing GET query for %s...", available)
         return cls.query.filter(cls.available == available)
 
     @classmethod
@@ -213,11 +726,343 @@ class Inventory(DB.Model):
         """ Returns the Inventory record with quantity >= the given quantity
         Args: quantity (Integer): the Inventory records with the minimum quantity
         """
-        LOGGER.info("Processing GET query for {}...".format(quantity))
+        LOGGER.debug("Processing GET query for %s...", quantity)
         return cls.query.filter(cls.quantity >= quantity)
 
+    @classmethod
+    def find_below_restock_level(cls, condition=None):
+        """ Returns the read-only rows of the Inventory records to restock
+        (quantity <= restock_level), served by the partial index LOW_STOCK_INDEX, or
+        LOW_STOCK_CONDITION_INDEX for a condition
+        Args: condition (String or list): only the records with the condition(s)
+        Returns: a select_rows() statement, to run with fetch_rows() or paginate()
+        """
+        LOGGER.debug("Processing GET query for low stock %s...", condition or "")
+        # Same predicate as the index, so the planner can match it
+        criteria = [sqlalchemy.text(LOW_STOCK)]
+        if condition:
+            criteria.extend(InventoryFilter(condition=condition).criteria)
+        return cls.select_rows(*criteria)
+
+    @classmethod
+    def find_existing_keys(cls, pairs):
+        """ Returns which of the given (product_id, condition) keys exist in the database
+        Args: pairs (iterable): the (product_id, condition) keys to look up
+        """
+        pairs = set(pairs)
+        pids = sorted({pid for pid, _ in pairs})
+        found = set()
+        for start in range(0, len(pids), keys.BULK_CHUNK_SIZE):
+            chunk = pids[start:start + keys.BULK_CHUNK_SIZE]
+            query = DB.session.query(cls.product_id, cls.condition)
+            found.update(tuple(key) for key in query.filter(cls.product_id.in_(chunk)))
+        return found & pairs
+
     @classmethod
     def find_by_product_id_condition(cls, pid, condition):
         """ Finds an Inventory record by its product_id and condition """
-        LOGGER.info("Processing GET for product_id {} and condition {}".format(pid, condition))
+        LOGGER.debug("Processing GET for product_id %s and condition %s", pid, condition)
         return cls.query.get((pid, condition))
+
+    @classmethod
+    def find_cached(cls, pid, condition):
+        """ Returns the InventoryRow with the key, or None if not found
+        The record is read through the in-process record cache
+        """
+        key = (pid, condition)
+        row = CACHE.get(key)
+        if row is None:
+            generation = CACHE.generation()
+            row = cls.find_row(pid, condition)
+            if row is None:
+                return None
+            CACHE.put(key, row, generation)
+        return row
+
+    ######################################################################
+    # READ-ONLY ROWS
+    @classmethod
+    def select_rows(cls, *criteria):
+        """ Returns a SELECT of the Inventory columns matching all of the criteria
+        The statement bypasses the ORM: run it with fetch_rows() or paginate()
+        """
+        table = cls.__table__
+        stmt = sqlalchemy.select([table.c[name] for name in ROW_FIELDS])
+        for criterion in criteria:
+            stmt = stmt.where(criterion)
+        return stmt
+
+    @classmethod
+    def fetch_rows(cls, stmt):
+        """ Runs a select_rows() statement and returns its records as InventoryRow
+        The rows are never added to the session, so reading them costs neither
+        identity map entries nor change tracking
+        """
+        return list(map(InventoryRow._make, DB.session.execute(stmt).fetchall()))
+
+    @classmethod
+    def find_row(cls, pid, condition):
+        """ Returns the InventoryRow with the product_id and condition, or None """
+        LOGGER.debug("Processing GET for product_id %s and condition %s", pid, condition)
+        rows = cls.fetch_rows(cls.select_rows(cls.product_id == pid, cls.condition == condition))
+        return rows[0] if rows else None
+
+    @classmethod
+    def page_etag(cls, rows, next_cursor=None):
+        """ Returns the strong entity tag of a page of InventoryRow records
+        Only the rows of the page are hashed, never the rest of the table
+        """
+        page = repr(([tuple(row) for row in rows], next_cursor is not None))
+        return hashlib.sha1(page.encode("utf-8")).hexdigest()
+
+    ######################################################################
+    # PAGINATION
+    @classmethod
+    def encode_cursor(cls, pid, condition):
+        """ Encodes the key of the last record of a page into an opaque cursor """
+        raw = json.dumps([pid, condition]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """ Decodes an opaque cursor back into the (product_id, condition) key """
+        try:
+            pid, condition = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except (ValueError, TypeError, binascii.Error, UnicodeError):
+            raise DataValidationError("Invalid cursor: {}".format(cursor))
+        if not isinstance(pid, int) or not isinstance(condition, str):
+            raise DataValidationError("Invalid cursor: {}".format(cursor))
+        return pid, condition
+
+    @classmethod
+    def paginate(cls, query, limit, cursor=None):
+        """ Returns a page of the query results and the cursor of the next page
+        The page seeks on the primary key (product_id, condition), so its cost does not
+        depend on how deep into the table the cursor points.
+        Args: query (Query): the Inventory query to page through, or a select_rows()
+                             statement to get the page as InventoryRow records
+              limit (Integer): the maximum number of records in the page
+              cursor (String): the cursor returned along with the previous page
+        """
+        rows = isinstance(query, sqlalchemy.sql.Select)
+        query = cls.page_query(query, limit, cursor)
+        records = cls.fetch_rows(query) if rows else query.all()
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_cursor = cls.encode_cursor(records[-1].product_id, records[-1].condition)
+        return records, next_cursor
+
+    @classmethod
+    def page_query(cls, query, limit, cursor=None):
+        """ Returns the query of a page of paginate(): the records after the cursor in
+        the pagination order, and one more to find out whether there is a next page
+        Raises: DataValidationError if the cursor is invalid
+        """
+        rows = isinstance(query, sqlalchemy.sql.Select)
+        if cursor:
+            pid, condition = cls.decode_cursor(cursor)
+            key = sqlalchemy.tuple_(cls.product_id, cls.condition)
+            # The product_id bound is implied by the row value comparison, but unlike it
+            # can start the range scan of the indexes ending in product_id
+            seek = sqlalchemy.and_(cls.product_id >= pid,
+                                   key > sqlalchemy.tuple_(pid, condition))
+            query = query.where(seek) if rows else query.filter(seek)
+        return query.order_by(cls.product_id, cls.condition).limit(max(limit, 0) + 1)
+
+    @classmethod
+    def explain(cls, stmt, values=()):
+        """ Returns the QueryPlan the database picks for a select_rows() statement
+        The plans are cached (PLANS) by SQL statement and by the values it depends on,
+        given by the caller (like the conditions filtered on): the lists of product ids
+        are expanding parameters, so the length of a list does not change the SQL, and
+        the page cursors are left out
+        """
+        conn = DB.session.connection()
+        if conn.dialect.name not in ("postgresql", "sqlite"):
+            return QueryPlan(None, False, False)
+        explain = Explain(stmt)
+        key = (conn.dialect.name, str(explain.compile(dialect=conn.dialect)), values)
+        plan = PLANS.get(key)
+        if plan is not None:
+            return plan
+        # The statement is only planned, never run
+        if conn.dialect.name == "postgresql":
+            plan = postgres_plan(conn.execute(explain).scalar()[0]["Plan"])
+        else:
+            table = cls.__table__
+            pkey = table.primary_key.name or "{}_pkey".format(table.name)
+            plan = sqlite_plan([row[-1] for row in conn.execute(explain)], table.name, pkey)
+        PLANS.put(key, plan)
+        return plan
+
+
+################################################################################
+class InventorySummary(DB.Model):
+    """
+    Totals of the Inventory records (count and summed quantity) by condition and
+    availability. Every write of Inventory adds its deltas in its own transaction,
+    so reading the totals never scans the inventory table; rebuild() recomputes
+    them from scratch
+    """
+    __tablename__ = "inventory_summary"
+
+    condition = DB.Column(DB.String(100), primary_key=True)
+    available = DB.Column(DB.Integer, primary_key=True)
+    records = DB.Column(DB.BigInteger, nullable=False, default=0)
+    quantity = DB.Column(DB.BigInteger, nullable=False, default=0)
+
+    def serialize(self):
+        """ Serializes the totals into a dictionary """
+        return {
+            keys.KEY_CND: self.condition,
+            keys.KEY_AVL: self.available,
+            keys.KEY_RECORDS: self.records,
+            keys.KEY_QTY: self.quantity
+        }
+
+    @staticmethod
+    def add(deltas, condition, available, records, quantity):
+        """ Adds a change of records and quantity to the deltas of its totals
+        Args: deltas (dict): the (records, quantity) deltas by (condition, available)
+        """
+        if condition is None or available is None:
+            return  # not summarized, see rebuild()
+        key = (condition, int(available))
+        old_records, old_quantity = deltas.get(key, (0, 0))
+        deltas[key] = (old_records + records, old_quantity + int(quantity or 0))
+
+    @classmethod
+    def apply(cls, deltas):
+        """ Applies the deltas to the totals in the current transaction
+        Called last by the writes, once their inventory rows are locked. The totals are
+        updated in key order, so concurrent writers queue up instead of deadlocking.
+        On Postgres each total is upserted (INSERT ... ON CONFLICT DO UPDATE), so two
+        writers adding the first record of a condition and availability both count
+        it; elsewhere the total is updated, then inserted when missing (SQLite runs
+        one writer at a time). A total left without records is deleted, so the totals
+        always match rebuild()
+        """
+        table = cls.__table__
+        conn = DB.session.connection()
+        for (cnd, avl), (records, quantity) in sorted(deltas.items()):
+            if not records and not quantity:
+                continue
+            if conn.dialect.name == "postgresql":
+                stmt = postgresql.insert(table).values(condition=cnd, available=avl,
+                                                       records=records, quantity=quantity)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=[table.c.condition, table.c.available],
+                    set_={"records": table.c.records + stmt.excluded.records,
+                          "quantity": table.c.quantity + stmt.excluded.quantity}))
+            else:
+                stmt = table.update()\
+                    .where(table.c.condition == cnd).where(table.c.available == avl)\
+                    .values(records=table.c.records + records,
+                            quantity=table.c.quantity + quantity)
+                if not conn.execute(stmt).rowcount:
+                    # The first record with this condition and availability
+                    conn.execute(table.insert().values(condition=cnd, available=avl,
+                                                       records=records, quantity=quantity))
+            if records < 0:
+                # The last record left the group: drop it, like rebuild() would
+                conn.execute(table.delete().where(table.c.condition == cnd)
+                             .where(table.c.available == avl).where(table.c.records == 0))
+
+    @classmethod
+    def totals(cls):
+        """ Returns the totals, ordered by condition and availability """
+        return cls.query.order_by(cls.condition, cls.available).all()
+
+    @classmethod
+    def rebuild(cls):
+        """ Recomputes all of the totals from the inventory table
+        On Postgres the inventory table is locked against writes (SHARE mode) until the
+        new totals are committed, so no write is lost or counted twice
+        Returns: the number of totals rows
+        """
+        LOGGER.info("Rebuilding the inventory summary")
+        table = cls.__table__
+        inventory = Inventory.__table__
+        conn = DB.session.connection()
+        disable_statement_timeout(conn)
+        if conn.dialect.name == "postgresql":
+            conn.execute("LOCK TABLE {} IN SHARE MODE".format(inventory.name))
+        conn.execute(table.delete())
+        quantity = sqlalchemy.func.coalesce(sqlalchemy.func.sum(inventory.c.quantity), 0)
+        query = sqlalchemy.select([inventory.c.condition, inventory.c.available,
+                                   sqlalchemy.func.count(), quantity])\
+            .where(inventory.c.condition.isnot(None))\
+            .where(inventory.c.available.isnot(None))\
+            .group_by(inventory.c.condition, inventory.c.available)
+        rows = conn.execute(table.insert().from_select(
+            [table.c.condition, table.c.available, table.c.records, table.c.quantity], query))
+        DB.session.commit()
+        return rows.rowcount
+
+################################################################################
+class InventoryFilter():
+    """
+    Composes any combination of the list filters into a single Inventory query
+    product_id and condition accept a value or a list of values (IN), and
+    quantity / quantity_max bound the quantity from below / above
+    """
+
+    def __init__(self, product_id=None, condition=None, quantity=None,
+                 quantity_max=None, available=None):
+        self.criteria = []
+        self.columns = set()
+        # The values the plan may depend on, see Inventory.explain()
+        self.values = []
+        if product_id is not None:
+            self._match(Inventory.product_id, product_id)
+        if condition is not None:
+            self._match(Inventory.condition, condition)
+        if quantity is not None:
+            self._add(Inventory.quantity, Inventory.quantity >= quantity, quantity)
+        if quantity_max is not None:
+            self._add(Inventory.quantity, Inventory.quantity <= quantity_max, quantity_max)
+        if available is not None:
+            self._match(Inventory.available, available)
+
+    def __repr__(self):
+        return "<InventoryFilter {}>".format(sorted(self.columns))
+
+    def _add(self, column, criterion, value):
+        self.columns.add(column.name)
+        self.criteria.append(criterion)
+        if column is not Inventory.product_id:
+            self.values.append((column.name, value))
+
+    def _match(self, column, values):
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        values = list(values)
+        if len(values) == 1:
+            self._add(column, column == values[0], values[0])
+        else:
+            # One SQL statement for the lists of any length
+            self._add(column, column.in_(sqlalchemy.bindparam(None, values, expanding=True)),
+                      tuple(values))
+
+    def query(self):
+        """ Returns the Inventory query matching all of the filters """
+        LOGGER.debug("Processing GET query for %s...", sorted(self.columns))
+        return Inventory.query.filter(*self.criteria)
+
+    def select(self):
+        """ Returns the read-only select_rows() statement matching all of the filters """
+        LOGGER.debug("Processing GET rows for %s...", sorted(self.columns))
+        return Inventory.select_rows(*self.criteria)
+
+    def index(self, stmt):
+        """ Returns the name of the index serving a page of the filters, or None
+        Read from the plan of the database (Inventory.explain()) for the page statement
+        stmt: the page is served when it is read in order from an index searched on the
+        filters, or from the primary key without any filter. A scan of the table or of
+        a whole index with filters, and a sort of the matching rows, are not served.
+        """
+        plan = Inventory.explain(stmt, tuple(self.values))
+        if plan.index and not plan.sort and (plan.search or not self.criteria):
+            return plan.index
+        return None
@@ -0,0 +1,114 @@
+"""
+Connection pool
+
+Counters of the database connection pool, kept up to date by the SQLAlchemy
+pool events and reported by GET /api/inventory/pool (and /metrics).
+The PostgreSQL engine uses TimedQueuePool (see config.py), a QueuePool that
+also records how long each checkout waited for a connection: a growing wait
+means the pool (DB_POOL_SIZE + DB_MAX_OVERFLOW) is too small for the load.
+The counters are per process, like the pool itself.
+"""
+import time
+import threading
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+class PoolStats():
+    """ Thread-safe counters of the connections and checkouts of a pool """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Clears all of the counters """
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.waits = 0
+            self.wait_seconds = 0.0
+            self.wait_seconds_max = 0.0
+
+    def attach(self, engine):
+        """ Listens to the pool events of the engine (only once per engine) """
+        for name, listener in (("connect", self._on_connect),
+                               ("checkout", self._on_checkout),
+                               ("checkin", self._on_checkin),
+                               ("invalidate", self._on_invalidate)):
+            if not event.contains(engine, name, listener):
+                event.listen(engine, name, listener)
+
+    def record_wait(self, seconds, timed_out=False):
+        """ Records the time a checkout waited for a connection """
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self, pool):
+        """ Returns the live state of the pool and the counters since the start """
+        with self._lock:
+            checked_out = self.checkouts - self.checkins
+            stats = {
+                "pool": type(pool).__name__,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds / self.waits, 6) if self.waits else 0.0
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                         checked_in=pool.checkedin(), overflow=max(pool.overflow(), 0))
+        else:
+            stats.update(size=None, checked_out=checked_out, checked_in=None, overflow=0)
+        return stats
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+class TimedQueuePool(QueuePool):
+    """ A QueuePool recording the time spent getting each connection in POOL_STATS
+    The time includes opening a new connection when the pool grows
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            POOL_STATS.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        POOL_STATS.record_wait(time.perf_counter() - start)
+        return connection
+
+def disable_statement_timeout(conn):
+    """ Lifts DB_STATEMENT_TIMEOUT for the current transaction (maintenance commands) """
+    if conn.dialect.name == "postgresql":
+        conn.execute("SET LOCAL statement_timeout = 0")
+
+# The counters of the service pool, attached to each engine when PooledSQLAlchemy
+# (service/model.py) creates it
+POOL_STATS = PoolStats()
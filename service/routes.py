@@ -4,36 +4,74 @@ Inventory Service
 Paths:
 ------
 GET /inventory
-    - Returns a list of all inventories in the inventory
+    - Returns a page of the inventories in the inventory (with an ETag, see If-None-Match)
+    - ?product_id=<int,...>&condition=<string,...>&quantity=<int>&quantity_max=<int>&available=<int>
+      filters the collection (filters can be combined)
+    - ?limit=<int>&cursor=<string> pages through the collection (see the "Link" header)
+GET /inventory/low-stock
+    - Returns a page of the inventories to restock (quantity <= restock_level)
+    - ?condition=<string,...>&limit=<int>&cursor=<string>
+GET /inventory/export
+    - Streams all of the inventories as newline-delimited JSON
+GET /inventory/events
+    - Streams the inventory changes as Server-Sent Events (resumes after Last-Event-ID)
+GET /metrics
+    - Returns the request, database and cache metrics of the worker (Prometheus text format)
+GET /inventory/pool
+    - Returns the database connection pool statistics of the worker
+GET /inventory/summary
+    - Returns the number of inventories and their total quantity by condition and availability
+GET /inventory/cache
+    - Returns the size and hit / miss counters of the record cache
 GET /inventory/<int:product_id>/condition/<string:condition>
-    - Returns the inventory record with the given product_id and condition
+    - Returns the inventory record with the given product_id and condition (with an ETag)
 
 POST /inventory
     - Given the data body this creates an inventory record in the DB
+POST /inventory/bulk
+    - Given a list of records (body) this creates them in one transaction
 
 PUT /inventory/<int:product_id>/condition/<string:condition>
     - Updates the inventory record with the given product_id and condition
+      (only while it still matches the If-Match ETag, when one is sent)
 PUT /inventory/<int:product_id>/condition/<string:condition>/activate
     - Given the product_id and condition this updates available = 1
 PUT /inventory/<int:product_id>/condition/<string:condition>/deactivate
     - Given the product_id and condition this updates available = 0
 PUT /inventory/<int:product_id>/condition/<string:condition>/restock
     - Given the product_id, condition and amount (body) this updates quantity += amount
+PUT /inventory/restock
+    - Given a list of product_id, condition and amount (body) this restocks them all
 
 DELETE /inventory/<int:product_id>/condition/<string:condition>
     - Given the product_id and condition this updates available = 0
+DELETE /inventory?<filters>
+    - Deletes all of the inventories matching the filters (same as GET /inventory)
+DELETE /inventory/bulk
+    - Given a list of product_id and condition keys (body) this deletes them
 """
 
 import re
+import time
 import uuid
+import hashlib
 import logging
 from functools import wraps
-from flask import request, render_template
+import click
+from flask import request, render_template, Response, stream_with_context, g
+from werkzeug.http import quote_etag
 from flask_api import status
-from flask_restplus import Api, Resource, fields, reqparse
+from flask_restplus import Api, Resource, fields, reqparse, marshal
+from flask_sqlalchemy import sqlalchemy
 
-from service import keys
-from service.model import Inventory, DataValidationError
+from service import keys, migrations, encoder
+from service.events import EVENTS, EventStore
+from service.pool import POOL_STATS
+from service.metrics import METRICS, sample
+from service.logs import REQUEST_LOG
+from service.importer import CsvImporter
+from service.model import DB, CACHE, Inventory, InventoryFilter, \
+    InventorySummary, DataValidationError, VersionConflictError
 from . import app
 
 authorizations = {
@@ -80,16 +118,126 @@ restock_model = api.model('Restock', {
             .format(keys.KEY_AMT)),
 })
 
+bulk_result_model = api.model('BulkResult', {
+    keys.KEY_INDEX: fields.Integer(readOnly=True,
+            description='The position of the record in the posted list'),
+    keys.KEY_PID: fields.Integer(readOnly=True,
+            description='The unique id assigned to a Product'),
+    keys.KEY_CND: fields.String(readOnly=True,
+            description='Condition of the product'),
+    keys.KEY_STATUS: fields.String(readOnly=True,
+            description='Outcome for the record\nNote: {} in ["{}", "{}", "{}"]'
+            .format(keys.KEY_STATUS, keys.STATUS_CREATED, keys.STATUS_INVALID,
+            keys.STATUS_CONFLICT)),
+    keys.KEY_MESSAGE: fields.String(readOnly=True,
+            description='Why the record was not created')
+})
+
+key_model = api.model('InventoryKey', {
+    keys.KEY_PID: fields.Integer(required=True,
+            description='The unique id assigned to a Product'),
+    keys.KEY_CND: fields.String(required=True,
+            description='Condition of the product'),
+})
+
+delete_result_model = api.model('DeleteResult', {
+    keys.KEY_DELETED: fields.Integer(readOnly=True,
+            description='The number of Inventories deleted'),
+})
+
+restock_item_model = api.clone('RestockItem', key_model, restock_model)
+
+restock_result_model = api.model('RestockResult', {
+    keys.KEY_INDEX: fields.Integer(readOnly=True,
+            description='The position of the item in the posted list'),
+    keys.KEY_PID: fields.Integer(readOnly=True,
+            description='The unique id assigned to a Product'),
+    keys.KEY_CND: fields.String(readOnly=True,
+            description='Condition of the product'),
+    keys.KEY_QTY: fields.Integer(readOnly=True,
+            description='The Quantity after the item was applied'),
+    keys.KEY_STATUS: fields.String(readOnly=True,
+            description='Outcome for the item\nNote: {} in ["{}", "{}", "{}"]'
+            .format(keys.KEY_STATUS, keys.STATUS_RESTOCKED, keys.STATUS_INVALID,
+            keys.STATUS_NOT_FOUND)),
+    keys.KEY_MESSAGE: fields.String(readOnly=True,
+            description='Why the item was not applied')
+})
+
+cache_stats_model = api.model('CacheStats', {
+    'size': fields.Integer(readOnly=True, description='The number of cached records'),
+    'max_size': fields.Integer(readOnly=True, description='The maximum number of cached records'),
+    'ttl': fields.Float(readOnly=True, description='Seconds a record stays cached'),
+    'hits': fields.Integer(readOnly=True, description='Lookups served from the cache'),
+    'misses': fields.Integer(readOnly=True, description='Lookups served from the DB'),
+    'evictions': fields.Integer(readOnly=True, description='Records evicted to make room'),
+    'hit_ratio': fields.Float(readOnly=True, description='hits / (hits + misses)'),
+})
+
+pool_stats_model = api.model('PoolStats', {
+    'pool': fields.String(readOnly=True, description='The pool implementation'),
+    'size': fields.Integer(readOnly=True, description='The connections kept open (DB_POOL_SIZE)'),
+    'checked_out': fields.Integer(readOnly=True, description='The connections in use'),
+    'checked_in': fields.Integer(readOnly=True, description='The idle connections'),
+    'overflow': fields.Integer(readOnly=True, description='The connections opened beyond size'),
+    'connects': fields.Integer(readOnly=True, description='Connections opened to the DB'),
+    'checkouts': fields.Integer(readOnly=True, description='Connections taken from the pool'),
+    'invalidations': fields.Integer(readOnly=True, description='Connections discarded as broken'),
+    'timeouts': fields.Integer(readOnly=True, description='Checkouts failed after DB_POOL_TIMEOUT'),
+    'waits': fields.Integer(readOnly=True, description='Checkouts timed'),
+    'wait_seconds_total': fields.Float(readOnly=True, description='Seconds spent getting connections'),
+    'wait_seconds_max': fields.Float(readOnly=True, description='The longest wait for a connection'),
+    'wait_seconds_avg': fields.Float(readOnly=True, description='wait_seconds_total / waits'),
+})
+
+summary_model = api.model('InventorySummary', {
+    keys.KEY_CND: fields.String(readOnly=True, description='The condition of the Inventories'),
+    keys.KEY_AVL: fields.Integer(readOnly=True, description='The availability of the Inventories'),
+    keys.KEY_RECORDS: fields.Integer(readOnly=True, description='The number of Inventories'),
+    keys.KEY_QTY: fields.Integer(readOnly=True, description='The total quantity of the Inventories'),
+})
+
+# Documents the field mask header of the responses that are not marshalled
+FIELDS_MASK = {'in': 'header', 'type': 'string', 'format': 'mask',
+               'description': 'An optional fields mask'}
+IF_NONE_MATCH = {'in': 'header', 'type': 'string',
+                 'description': 'The ETag of a cached copy, answered with 304 while it is current'}
+IF_MATCH = {'in': 'header', 'type': 'string',
+            'description': 'The ETag the change is based on, answered with 412 once outdated'}
+LAST_EVENT_ID = {'in': 'header', 'type': 'string',
+                 'description': 'The id of the last event received, to resume after it'}
+
+events_args = reqparse.RequestParser()
+events_args.add_argument(keys.KEY_LAST_EVENT_ID, type=str, required=False,
+                    help='The id of the last event received (when no "Last-Event-ID" is sent)')
+
 # query string arguments
-inventory_args = reqparse.RequestParser()
-inventory_args.add_argument(keys.KEY_PID, type=int,
-                    required=False, help='List Inventory by Product ID')
-inventory_args.add_argument(keys.KEY_CND, type=str,
-                    required=False, help='List Inventory by Condition')
-inventory_args.add_argument(keys.KEY_QTY, type=int,
-                    required=False, help='List Inventory by (>=) Quantity')
-inventory_args.add_argument(keys.KEY_AVL, type=int,
-                    required=False, help='List Inventory by Availability')
+filter_args = reqparse.RequestParser()
+filter_args.add_argument(keys.KEY_PID, type=int, action='split',
+                    required=False, help='Filter Inventory by Product ID(s)')
+filter_args.add_argument(keys.KEY_CND, type=str, action='split',
+                    required=False, help='Filter Inventory by Condition(s)')
+filter_args.add_argument(keys.KEY_QTY, type=int,
+                    required=False, help='Filter Inventory by (>=) Quantity')
+filter_args.add_argument(keys.KEY_QTY_MAX, type=int,
+                    required=False, help='Filter Inventory by (<=) Quantity')
+filter_args.add_argument(keys.KEY_AVL, type=int,
+                    required=False, help='Filter Inventory by Availability')
+
+def add_paging_args(parser):
+    """ Adds the pagination arguments to a parser """
+    parser.add_argument(keys.KEY_LIMIT, type=int, default=keys.PAGE_SIZE_DEFAULT,
+                        required=False, help='Maximum number of Inventories per page')
+    parser.add_argument(keys.KEY_CURSOR, type=str,
+                        required=False, help='Cursor of the page to return (from the "Link" header)')
+    return parser
+
+inventory_args = add_paging_args(filter_args.copy())
+
+low_stock_args = reqparse.RequestParser()
+low_stock_args.add_argument(keys.KEY_CND, type=str, action='split',
+                    required=False, help='Filter Inventory by Condition(s)')
+add_paging_args(low_stock_args)
 
 
 ####################################################################################################
@@ -114,13 +262,266 @@ def generate_apikey():
     """ Helper function used when testing API keys """
     return uuid.uuid4().hex
 
+####################################################################################################
+#  M E T R I C S
+####################################################################################################
+def request_route():
+    """ Returns the route template of the request, keeping the label values bounded """
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def start_timer():
+    """ Counts the request in flight and starts timing it """
+    g.metrics_route = request_route()
+    g.metrics_start = METRICS.request_started(request.method, g.metrics_route)
+
+@app.after_request
+def record_status(response):
+    """ Keeps the status of the response for the latency histogram """
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def stop_timer(error=None):
+    """ Records the latency of the request and logs it, even when it failed """
+    if "metrics_start" in g:
+        status_code = g.get("metrics_status", status.HTTP_500_INTERNAL_SERVER_ERROR)
+        seconds = METRICS.request_finished(request.method, g.metrics_route, status_code,
+                                           g.metrics_start)
+        REQUEST_LOG.log(status_code, seconds, method=request.method, path=request.path,
+                        route=g.metrics_route, remote=request.remote_addr,
+                        error=type(error).__name__ if error else None)
+
+@app.route("/metrics")
+def metrics():
+    """ The metrics of this worker in the Prometheus text format """
+    pool = POOL_STATS.stats(DB.engine.pool)
+    cache = CACHE.stats()
+    text = METRICS.render(
+        sample("inventory_db_pool_checked_out", "Connections in use", "gauge",
+               pool["checked_out"]),
+        sample("inventory_db_pool_overflow", "Connections opened beyond the pool size", "gauge",
+               pool["overflow"]),
+        sample("inventory_db_pool_wait_seconds_total", "Time spent getting connections",
+               "counter", pool["wait_seconds_total"]),
+        sample("inventory_db_pool_timeouts_total", "Checkouts failed after DB_POOL_TIMEOUT",
+               "counter", pool["timeouts"]),
+        sample("inventory_cache_hits_total", "Lookups served from the record cache", "counter",
+               cache["hits"]),
+        sample("inventory_cache_misses_total", "Lookups served from the DB", "counter",
+               cache["misses"]),
+        sample("inventory_events_published_total", "Changes published to the event feed",
+               "counter", EVENTS.published),
+        sample("inventory_event_streams", "Event streams open", "gauge", EVENTS.streams))
+    return Response(text, mimetype=keys.KEY_CONTENT_TYPE_METRICS)
+
+####################################################################################################
+#  E R R O R   H A N D L E R S
+####################################################################################################
+@api.errorhandler(sqlalchemy.exc.TimeoutError)
+def pool_timeout(error):
+    """ No DB connection was free within DB_POOL_TIMEOUT: let the client retry """
+    app.logger.warning("Connection pool exhausted: %s", error)
+    return {'message': 'The service is overloaded, retry later'}, \
+        status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': '1'}
+
 ####################################################################################################
 #  U T I L I T Y   F U N C T I O N S
 ####################################################################################################
-@app.before_first_request
+def init_app():
+    """ Initialize the model without touching the database (run on import) """
+    Inventory.init_app(app)
+    configure_events()
+    REQUEST_LOG.configure(app.config.get(keys.KEY_LOG_SAMPLE_RATE, keys.LOG_SAMPLE_RATE_DEFAULT),
+                          app.config.get(keys.KEY_LOG_SLOW_MS, keys.LOG_SLOW_MS_DEFAULT) / 1000)
+
 def init_db(dbname=keys.KEY_DB_NAME):
-    """ Initlaize the model """
+    """ Initlaize the model and bring the schema up to date """
     Inventory.init_db(app)
+    configure_events()
+
+def configure_events():
+    """ Sizes the change feed and binds it to the events table shared by the workers """
+    size = app.config.get(keys.KEY_EVENTS_SIZE, keys.EVENTS_SIZE_DEFAULT)
+    EVENTS.configure(size, EventStore(app, size),
+                     app.config.get(keys.KEY_EVENTS_POLL, keys.EVENTS_POLL_DEFAULT))
+
+def warm_up():
+    """ Configures the ORM mappers and opens the first pooled connection before
+    the worker takes requests, both would otherwise delay its first request
+    Returns: the seconds it took
+    """
+    start = time.perf_counter()
+    sqlalchemy.orm.configure_mappers()
+    with app.app_context():
+        with DB.engine.connect() as conn:
+            conn.execute(sqlalchemy.select([sqlalchemy.literal(1)]))
+    return time.perf_counter() - start
+
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """ Creates the tables and applies the pending schema migrations """
+    DB.create_all()
+    version = migrations.upgrade(DB.engine)
+    app.logger.info("Database schema is at version %s", version)
+
+@app.cli.command("summary-rebuild")
+def summary_rebuild():
+    """ Recomputes the inventory summary from the inventory table """
+    totals = InventorySummary.rebuild()
+    app.logger.info("Inventory summary rebuilt: %s totals", totals)
+
+@app.cli.command("inventory-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", type=click.IntRange(min=1), default=keys.IMPORT_CHUNK_SIZE,
+              show_default=True, help="Rows validated and committed together")
+@click.option("--checkpoint", help="The progress file [default: PATH.checkpoint]")
+@click.option("--restart", is_flag=True, help="Ignore the progress of a previous run")
+def inventory_import(path, chunk_size, checkpoint, restart):
+    """ Imports the Inventory records of a CSV file, resuming a failed import """
+    def progress(state):
+        rows = state["loaded"] + state["skipped"] + state["invalid"]
+        click.echo("{}: line {}, {} loaded, {} skipped, {} invalid ({:.0f} rows/s)".format(
+            path, state["line"], state["loaded"], state["skipped"], state["invalid"],
+            rows / max(state["seconds"], 1e-9)))
+    importer = CsvImporter(path, chunk_size, checkpoint)
+    try:
+        state = importer.run(restart, progress)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    except sqlalchemy.exc.SQLAlchemyError as err:
+        app.logger.error("Import of %s failed: %s", path, err)
+        raise click.ClickException("The import of {} stopped: run it again to resume after "
+                                   "its last committed chunk".format(path))
+    click.echo("Imported {} in {:.1f} s: {} loaded, {} skipped, {} invalid".format(
+        path, state["seconds"], state["loaded"], state["skipped"], state["invalid"]))
+
+def json_response(body, code, headers=None):
+    """ Wraps already encoded JSON bytes in a response, bypassing marshalling """
+    return Response(body, status=code, headers=headers,
+                    mimetype=keys.KEY_CONTENT_TYPE_JSON)
+
+def not_modified(etag, headers):
+    """ Conditional GET: adds the ETag of the representation to the headers
+    Returns a 304 response when If-None-Match already holds it, None otherwise.
+    A fields mask changes the body, so it is part of the tag.
+    """
+    mask = request.headers.get(keys.KEY_MASK_HEADER)
+    if mask:
+        etag = hashlib.sha1("{}:{}".format(etag, mask).encode("utf-8")).hexdigest()
+    headers[keys.KEY_ETAG_HEADER] = quote_etag(etag)
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+def check_limit(params):
+    """ Returns the page size of the parsed paging parameters, aborting when invalid """
+    limit = params[keys.KEY_LIMIT]
+    if not 0 < limit <= keys.PAGE_SIZE_MAX:
+        api.abort(status.HTTP_400_BAD_REQUEST,
+            "Invalid data: {} must be between 1 and {}".format(keys.KEY_LIMIT,
+            keys.PAGE_SIZE_MAX))
+    return limit
+
+def page_statement(stmt, params):
+    """ Returns the statement of the page of stmt the parsed paging parameters ask for
+    (see Inventory.page_query()), aborting when they are invalid
+    """
+    limit = check_limit(params)
+    try:
+        return Inventory.page_query(stmt, limit, params[keys.KEY_CURSOR])
+    except DataValidationError as err:
+        return api.abort(status.HTTP_400_BAD_REQUEST, err)
+
+def page_response(resource, stmt, params, headers):
+    """ Returns a page of the rows of a select_rows() statement
+    The URL of the next page of the resource is sent in the "Link" header, and the
+    ETag of the page makes the response conditional (see not_modified)
+    """
+    limit = check_limit(params)
+    try:
+        inventories, next_cursor = Inventory.paginate(stmt, limit, params[keys.KEY_CURSOR])
+    except DataValidationError as err:
+        api.abort(status.HTTP_400_BAD_REQUEST, err)
+    if next_cursor:
+        args = request.args.to_dict()
+        args.update({keys.KEY_LIMIT: limit, keys.KEY_CURSOR: next_cursor})
+        headers['Link'] = '<{}>; rel="next"'.format(
+            api.url_for(resource, _external=True, **args))
+
+    response = not_modified(Inventory.page_etag(inventories, next_cursor), headers)
+    if response:
+        return response
+    app.logger.debug("Returning %s inventories", len(inventories))
+    mask = request.headers.get(keys.KEY_MASK_HEADER)
+    if mask:
+        results = [encoder.as_dict(inv) for inv in inventories]
+        return marshal(results, inventory_model, mask=mask), status.HTTP_200_OK, headers
+    return json_response(encoder.encode_records(inventories), status.HTTP_200_OK, headers)
+
+def record_event(data):
+    """ Returns the Inventory fields of a record, as published in the change feed """
+    return {key: data[key] for key in keys.RECORD_FIELDS}
+
+def event_stream(last_id, seconds, keepalive, close=None):
+    """ Yields the events published after last_id in the text/event-stream format
+    The stream ends after seconds, sending a comment every keepalive seconds without
+    events, and then calls close(). A client that can not resume after last_id gets
+    a "reset" event instead
+    """
+    try:
+        yield from stream_events(last_id, seconds, keepalive)
+    finally:
+        if close:
+            close()
+
+def stream_events(last_id, seconds, keepalive):
+    """ The events of event_stream() """
+    yield "retry: {}\n\n".format(keys.SSE_RETRY_MS)
+    seq = EVENTS.parse(last_id)
+    if seq is None:
+        # A new client starts from the latest event, without dispatching anything
+        reset = EVENTS.reset_event()
+        seq = reset.seq
+        yield reset.message() if last_id else "id: {}\n\n".format(reset.id)
+    deadline = time.monotonic() + seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        events = EVENTS.since(seq, min(keepalive, max(remaining, 0)))
+        if events is None:
+            reset = EVENTS.reset_event()
+            events = [reset]
+        if events:
+            seq = events[-1].seq
+            yield "".join(event.message() for event in events)
+        elif remaining > 0:
+            yield ": keepalive\n\n"
+        if remaining <= 0:
+            return
+
+def check_amount(json):
+    """ Returns why a restock body is invalid, or None if it is valid """
+    if not isinstance(json, dict) or keys.KEY_AMT not in json:
+        return "Invalid data: Amount missing"
+    # Checking for amount > 0
+    amount = json[keys.KEY_AMT]
+    if not re.search(r"^\-?\d+$", str(amount)):
+        return "Invalid data: Amount must be an integer"
+    if int(amount) <= 0:
+        return "Invalid data: Amount <= 0"
+    return None
+
+def build_filter(params):
+    """ Builds the InventoryFilter for the parsed filter_args """
+    if params[keys.KEY_AVL] not in [None, keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE]:
+        api.abort(status.HTTP_400_BAD_REQUEST,
+            "Invalid data: {} must be {} or {}".format(keys.KEY_AVL,
+            keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE))
+    return InventoryFilter(product_id=params[keys.KEY_PID],
+                           condition=params[keys.KEY_CND],
+                           quantity=params[keys.KEY_QTY],
+                           quantity_max=params[keys.KEY_QTY_MAX],
+                           available=params[keys.KEY_AVL])
 
 ####################################################################################################
 # INDEX
@@ -128,7 +529,7 @@ def init_db(dbname=keys.KEY_DB_NAME):
 @app.route("/")
 def index():
     """ Root URL response """
-    app.logger.info("Request for Root URL")
+    app.logger.debug("Request for Root URL")
     return app.send_static_file('index.html')
     # return render_template('index.html')
 
@@ -140,50 +541,64 @@ class InventoryBase(Resource):
     """
     GET     /inventory - Return all Inventories
     CREATE  /inventory - Create a new Inventory
+    DELETE  /inventory - Delete the Inventories matching the filters
     """
     #------------------------------------------------------------------
     # LIST ALL INVENTORIES
     #------------------------------------------------------------------
     @api.doc('list_inventories')
     @api.expect(inventory_args, validate=True)
-    @api.marshal_list_with(inventory_model)
+    @api.response(status.HTTP_400_BAD_REQUEST, 'The filter or paging parameters were not valid')
+    @api.response(status.HTTP_200_OK, 'Success', [inventory_model])
+    @api.response(status.HTTP_304_NOT_MODIFIED, 'The page matches the If-None-Match ETag')
+    @api.doc(params={keys.KEY_MASK_HEADER: FIELDS_MASK,
+                     keys.KEY_IF_NONE_MATCH_HEADER: IF_NONE_MATCH})
     def get(self):
-        """ Returns a collection of the inventory records """
-        msg = "A GET request for ALL inventories."
-        inventories = []
+        """
+        Returns a collection of the inventory records
+        Any combination of the filters is applied in a single query. The index serving
+        the page in order, from the plan of the database, is reported in the
+        "X-Query-Index" header ("none" for a scan or a sort of the matching records).
+        The collection is returned a page at a time; the URL of the next page is sent
+        in the "Link" header. The "ETag" of the page only changes when its records do
+        """
+        app.logger.debug("A GET request for ALL inventories.")
         params = inventory_args.parse_args()
-        if params[keys.KEY_PID]:
-            pid = params[keys.KEY_PID]
-            query = 'Filtering by category: {}'.format(params[keys.KEY_PID])
-            app.logger.info(query)
-            msg = "{} {}".format(msg, query)
-            inventories = Inventory.find_by_product_id(pid)
-        elif params[keys.KEY_CND]:
-            cnd = params[keys.KEY_CND]
-            query = 'Filtering by category: {}'.format(params[keys.KEY_CND])
-            app.logger.info(query)
-            msg = "{} {}".format(msg, query)
-            inventories = Inventory.find_by_condition(cnd)
-        elif params[keys.KEY_QTY] and params[keys.KEY_QTY] >= 0:
-            qty = params[keys.KEY_QTY]
-            query = 'Filtering by category: {}'.format(params[keys.KEY_QTY])
-            app.logger.info(query)
-            msg = "{} {}".format(msg, query)
-            inventories = Inventory.find_by_quantity(qty)
-        elif params[keys.KEY_AVL] in [keys.AVAILABLE_TRUE, keys.AVAILABLE_FALSE]:
-            avl = params[keys.KEY_AVL]
-            query = 'Filtering by category: {}'.format(params[keys.KEY_AVL])
-            app.logger.info(query)
-            msg = "{} {}".format(msg, query)
-            inventories = Inventory.find_by_available(avl)
-        else:
-            inventories = Inventory.find_all()
-        app.logger.info(msg)
-
-
-        results = [inv.serialize() for inv in inventories]
-        app.logger.info("Returning {} inventories".format(len(results)))
-        return results, status.HTTP_200_OK
+        query = build_filter(params)
+        stmt = query.select()
+        index = query.index(page_statement(stmt, params))
+        if not index:
+            msg = "No index serves the filters {} in order".format(sorted(query.columns))
+            if app.config.get(keys.KEY_QUERY_REQUIRE_INDEX):
+                api.abort(status.HTTP_400_BAD_REQUEST, msg)
+            app.logger.debug(msg)
+        headers = {keys.KEY_QUERY_INDEX_HEADER: index or "none"}
+        return page_response(InventoryBase, stmt, params, headers)
+
+    #------------------------------------------------------------------
+    # DELETE ALL INVENTORIES MATCHING THE FILTERS
+    #------------------------------------------------------------------
+    @api.doc('delete_inventories', security='apikey')
+    @api.expect(filter_args, validate=True)
+    @api.response(status.HTTP_400_BAD_REQUEST, 'No filter or an invalid filter was given')
+    @api.marshal_with(delete_result_model)
+    # @token_required
+    def delete(self):
+        """
+        Deletes the inventory records matching the filters
+        The filters are the same as for listing the collection and at least one must be
+        given. The records are removed with a single DELETE statement.
+        """
+        app.logger.debug("Request to delete inventories by filter")
+        query = build_filter(filter_args.parse_args())
+        if not query.criteria:
+            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid request: at least one filter needed")
+        deleted = Inventory.delete_by_filter(query)
+        app.logger.debug("%s inventories deleted.", deleted)
+        if deleted:
+            EVENTS.publish(keys.EVENT_DELETE_MANY,
+                           dict(request.args.to_dict(), **{keys.KEY_DELETED: deleted}))
+        return {keys.KEY_DELETED: deleted}, status.HTTP_200_OK
 
     #------------------------------------------------------------------
     # ADD A NEW INVENTORY
@@ -200,7 +615,7 @@ class InventoryBase(Resource):
         This endpoint will create a Inventory based the data in the body that is posted
         """
         try:
-            app.logger.info("Request to create an Inventory record")
+            app.logger.debug("Request to create an Inventory record")
             inventory = Inventory()
             inventory.deserialize(api.payload)
             inventory.validate_data()
@@ -212,12 +627,316 @@ class InventoryBase(Resource):
             inventory.create()
             location_url = api.url_for(InventoryResource, product_id=inventory.product_id,
                 condition=inventory.condition, _external=True)
-            app.logger.info("Inventory ({}, {}) created."\
-                            .format(inventory.product_id, inventory.condition))
+            app.logger.debug("Inventory (%s, %s) created.",
+                             inventory.product_id, inventory.condition)
+            EVENTS.publish(keys.EVENT_CREATE, inventory.serialize())
             return inventory.serialize(), status.HTTP_201_CREATED, {'Location': location_url}
         except DataValidationError as err:
             api.abort(status.HTTP_400_BAD_REQUEST, err)
 
+####################################################################################################
+#  PATH: /inventory/bulk
+####################################################################################################
+@api.route('/inventory/bulk')
+class InventoryBulk(Resource):
+    """
+    CREATE  /inventory/bulk - Create many Inventories
+    DELETE  /inventory/bulk - Delete many Inventories
+    """
+    #------------------------------------------------------------------
+    # ADD MANY NEW INVENTORIES
+    #------------------------------------------------------------------
+    @api.doc('create_inventories', security='apikey')
+    @api.expect([inventory_model])
+    @api.response(status.HTTP_400_BAD_REQUEST, 'The posted data was not a list of Inventories')
+    @api.response(status.HTTP_201_CREATED, 'All of the Inventories were created',
+                  [bulk_result_model])
+    @api.response(status.HTTP_207_MULTI_STATUS, 'Some of the Inventories were not created',
+                  [bulk_result_model])
+    @api.marshal_list_with(bulk_result_model, code=status.HTTP_201_CREATED)
+    # @token_required
+    def post(self):
+        """
+        Creates many Inventories
+        The records are validated and inserted in a single transaction. The status of
+        every record is returned in the order they were posted.
+        """
+        app.logger.debug("Request to create Inventory records in bulk")
+        records = api.payload
+        if not isinstance(records, list):
+            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: expected a list of records")
+        if len(records) > keys.BULK_MAX_RECORDS:
+            api.abort(status.HTTP_400_BAD_REQUEST,
+                "Invalid data: at most {} records per request".format(keys.BULK_MAX_RECORDS))
+        results = Inventory.bulk_create(records)
+        created = len([res for res in results if res[keys.KEY_STATUS] == keys.STATUS_CREATED])
+        app.logger.debug("%s of %s Inventories created.", created, len(results))
+        EVENTS.publish_many(keys.EVENT_CREATE, [
+            {keys.KEY_PID: res[keys.KEY_PID], keys.KEY_CND: res[keys.KEY_CND]}
+            for res in results if res[keys.KEY_STATUS] == keys.STATUS_CREATED])
+        if created < len(results):
+            return results, status.HTTP_207_MULTI_STATUS
+        return results, status.HTTP_201_CREATED
+
+    #------------------------------------------------------------------
+    # DELETE MANY INVENTORIES
+    #------------------------------------------------------------------
+    @api.doc('delete_inventories_bulk', security='apikey')
+    @api.expect([key_model])
+    @api.response(status.HTTP_400_BAD_REQUEST, 'The data was not a list of Inventory keys')
+    @api.marshal_with(delete_result_model)
+    # @token_required
+    def delete(self):
+        """
+        Deletes many Inventories
+        The records with the given product_id and condition keys are removed with a
+        single DELETE statement
+        """
+        app.logger.debug("Request to delete Inventory records in bulk")
+        records = api.payload
+        if not isinstance(records, list):
+            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: expected a list of keys")
+        if len(records) > keys.BULK_MAX_RECORDS:
+            api.abort(status.HTTP_400_BAD_REQUEST,
+                "Invalid data: at most {} keys per request".format(keys.BULK_MAX_RECORDS))
+        try:
+            pairs = [(int(rec[keys.KEY_PID]), str(rec[keys.KEY_CND])) for rec in records]
+        except (KeyError, TypeError, ValueError):
+            api.abort(status.HTTP_400_BAD_REQUEST,
+                "Invalid data: every key needs a {} and a {}".format(keys.KEY_PID, keys.KEY_CND))
+        deleted = Inventory.delete_by_keys(pairs)
+        app.logger.debug("%s inventories deleted.", deleted)
+        if deleted:
+            EVENTS.publish_many(keys.EVENT_DELETE, [{keys.KEY_PID: pid, keys.KEY_CND: cnd}
+                                                    for pid, cnd in sorted(set(pairs))])
+        return {keys.KEY_DELETED: deleted}, status.HTTP_200_OK
+
+####################################################################################################
+#  PATH: /inventory/restock
+####################################################################################################
+@api.route('/inventory/restock')
+class InventoryRestock(Resource):
+    """
+    PUT     /inventory/restock - Restock many Inventories
+    """
+    #------------------------------------------------------------------
+    # RESTOCK MANY (EXISTING) INVENTORIES
+    #------------------------------------------------------------------
+    @api.doc('restock_inventories', security='apikey')
+    @api.expect([restock_item_model])
+    @api.response(status.HTTP_400_BAD_REQUEST, 'The data was not a list of restock items')
+    @api.response(status.HTTP_207_MULTI_STATUS, 'Some of the items were not applied',
+                  [restock_result_model])
+    @api.marshal_list_with(restock_result_model)
+    # @token_required
+    def put(self):
+        """
+        Restock many Inventories' Quantities
+        Every item follows the rules of a single restock. The valid items are applied
+        in one transaction and the status of every item is returned in order.
+        """
+        app.logger.debug("Request to restock Inventory records in bulk")
+        records = api.payload
+        if not isinstance(records, list):
+            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: expected a list of items")
+        if len(records) > keys.BULK_MAX_RECORDS:
+            api.abort(status.HTTP_400_BAD_REQUEST,
+                "Invalid data: at most {} items per request".format(keys.BULK_MAX_RECORDS))
+        items, invalid = [], {}
+        for index, record in enumerate(records):
+            error = check_amount(record)
+            if not error:
+                try:
+                    items.append((int(record[keys.KEY_PID]), str(record[keys.KEY_CND]),
+                                  int(record[keys.KEY_AMT])))
+                    continue
+                except (KeyError, TypeError, ValueError):
+                    error = "Invalid data: every item needs a {} and a {}"\
+                            .format(keys.KEY_PID, keys.KEY_CND)
+            invalid[index] = {keys.KEY_PID: None, keys.KEY_CND: None, keys.KEY_QTY: None,
+                              keys.KEY_STATUS: keys.STATUS_INVALID, keys.KEY_MESSAGE: error}
+        applied = iter(Inventory.bulk_restock(items))
+        results = []
+        for index in range(len(records)):
+            result = invalid[index] if index in invalid else next(applied)
+            result[keys.KEY_INDEX] = index
+            results.append(result)
+        restocked = len([res for res in results if res[keys.KEY_STATUS] == keys.STATUS_RESTOCKED])
+        app.logger.debug("%s of %s items restocked.", restocked, len(results))
+        EVENTS.publish_many(keys.EVENT_RESTOCK, [
+            {key: res[key] for key in (keys.KEY_PID, keys.KEY_CND, keys.KEY_QTY)}
+            for res in results if res[keys.KEY_STATUS] == keys.STATUS_RESTOCKED])
+        if restocked < len(results):
+            return results, status.HTTP_207_MULTI_STATUS
+        return results, status.HTTP_200_OK
+
+####################################################################################################
+#  PATH: /inventory/low-stock
+####################################################################################################
+@api.route('/inventory/low-stock')
+class InventoryLowStock(Resource):
+    """
+    GET     /inventory/low-stock - Return the Inventories to restock
+    """
+    #------------------------------------------------------------------
+    # LIST THE INVENTORIES TO RESTOCK
+    #------------------------------------------------------------------
+    @api.doc('list_low_stock_inventories')
+    @api.expect(low_stock_args, validate=True)
+    @api.response(status.HTTP_400_BAD_REQUEST, 'The filter or paging parameters were not valid')
+    @api.response(status.HTTP_200_OK, 'Success', [inventory_model])
+    @api.response(status.HTTP_304_NOT_MODIFIED, 'The page matches the If-None-Match ETag')
+    @api.doc(params={keys.KEY_MASK_HEADER: FIELDS_MASK,
+                     keys.KEY_IF_NONE_MATCH_HEADER: IF_NONE_MATCH})
+    def get(self):
+        """
+        Returns the inventory records with quantity <= restock_level
+        Only the records to restock are read, through a partial index. The collection
+        is returned a page at a time, like GET /inventory, and the index reading it is
+        reported in the "X-Query-Index" header
+        """
+        app.logger.debug("A GET request for LOW STOCK inventories")
+        params = low_stock_args.parse_args()
+        query = Inventory.find_below_restock_level(params[keys.KEY_CND])
+        plan = Inventory.explain(page_statement(query, params),
+                                 tuple(params[keys.KEY_CND] or ()))
+        index = plan.index if plan.index and not plan.sort else None
+        headers = {keys.KEY_QUERY_INDEX_HEADER: index or "none"}
+        return page_response(InventoryLowStock, query, params, headers)
+
+####################################################################################################
+#  PATH: /inventory/export
+####################################################################################################
+@api.route('/inventory/export')
+class InventoryExport(Resource):
+    """
+    GET     /inventory/export - Stream all Inventories as newline-delimited JSON
+    """
+    #------------------------------------------------------------------
+    # EXPORT ALL INVENTORIES
+    #------------------------------------------------------------------
+    @api.doc('export_inventories')
+    @api.produces([keys.KEY_CONTENT_TYPE_NDJSON])
+    @api.response(status.HTTP_200_OK, 'One Inventory per line', inventory_model)
+    def get(self):
+        """
+        Exports all of the inventory records
+        The records are streamed one JSON object per line as they are read from the DB
+        """
+        app.logger.debug("A GET request to EXPORT all inventories")
+
+        lines = encoder.encode_lines(Inventory.stream_all())
+        return Response(stream_with_context(lines), mimetype=keys.KEY_CONTENT_TYPE_NDJSON)
+
+####################################################################################################
+#  PATH: /inventory/events
+####################################################################################################
+@api.route('/inventory/events')
+class InventoryEvents(Resource):
+    """
+    GET     /inventory/events - Stream the Inventory changes as Server-Sent Events
+    """
+    #------------------------------------------------------------------
+    # INVENTORY CHANGE FEED
+    #------------------------------------------------------------------
+    @api.doc('stream_inventory_events', params={keys.KEY_LAST_EVENT_ID_HEADER: LAST_EVENT_ID})
+    @api.expect(events_args, validate=True)
+    @api.produces([keys.KEY_CONTENT_TYPE_SSE])
+    @api.response(status.HTTP_503_SERVICE_UNAVAILABLE, 'SSE_MAX_STREAMS streams are open')
+    def get(self):
+        """
+        Streams the changes made to the inventory as Server-Sent Events
+        Each event is named after the change and carries the record (or its key)
+        as JSON. A client sending the Last-Event-ID it saw gets the events it missed
+        first; a "reset" event means they are gone and the collection must be reloaded.
+        The stream ends after a while, EventSource clients reconnect on their own.
+        Each open stream holds a worker thread: past SSE_MAX_STREAMS the new ones are
+        refused with a 503, and the clients retry later
+        """
+        args = events_args.parse_args()
+        last_id = request.headers.get(keys.KEY_LAST_EVENT_ID_HEADER,
+                                      args[keys.KEY_LAST_EVENT_ID])
+        app.logger.debug("A GET request for the events after %s", last_id)
+        close = EVENTS.open_stream(app.config.get(keys.KEY_SSE_MAX_STREAMS,
+                                                  keys.SSE_MAX_STREAMS_DEFAULT))
+        if not close:
+            app.logger.warning("Event stream refused: %s streams are open", EVENTS.streams)
+            return {'message': 'Too many event streams are open, retry later'}, \
+                status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': '1'}
+        stream = event_stream(last_id,
+                              app.config.get(keys.KEY_SSE_SECONDS, keys.SSE_SECONDS_DEFAULT),
+                              app.config.get(keys.KEY_SSE_KEEPALIVE, keys.SSE_KEEPALIVE_DEFAULT),
+                              close)
+        # The stream only reads the event buffer: no request context is kept alive
+        response = Response(stream, mimetype=keys.KEY_CONTENT_TYPE_SSE,
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # Also when the client went away before the stream started
+        response.call_on_close(close)
+        return response
+
+####################################################################################################
+#  PATH: /inventory/summary
+####################################################################################################
+@api.route('/inventory/summary')
+class InventoryTotals(Resource):
+    """
+    GET     /inventory/summary - Return the Inventory totals by condition and availability
+    """
+    #------------------------------------------------------------------
+    # INVENTORY TOTALS
+    #------------------------------------------------------------------
+    @api.doc('get_inventory_summary')
+    @api.marshal_list_with(summary_model)
+    def get(self):
+        """
+        Returns the number of Inventories and their total quantity by condition and
+        availability. The totals are kept up to date by every write, the inventory
+        table is not read
+        """
+        app.logger.debug("A GET request for the inventory summary")
+        totals = [summary.serialize() for summary in InventorySummary.totals()]
+        return totals, status.HTTP_200_OK
+
+####################################################################################################
+#  PATH: /inventory/cache
+####################################################################################################
+@api.route('/inventory/cache')
+class InventoryCache(Resource):
+    """
+    GET     /inventory/cache - Return the record cache statistics
+    """
+    #------------------------------------------------------------------
+    # RECORD CACHE STATISTICS
+    #------------------------------------------------------------------
+    @api.doc('get_cache_stats')
+    @api.marshal_with(cache_stats_model)
+    def get(self):
+        """
+        Returns the record cache statistics of this worker
+        Used to size the cache (RECORD_CACHE_SIZE, RECORD_CACHE_TTL)
+        """
+        return CACHE.stats(), status.HTTP_200_OK
+
+####################################################################################################
+#  PATH: /inventory/pool
+####################################################################################################
+@api.route('/inventory/pool')
+class InventoryPool(Resource):
+    """
+    GET     /inventory/pool - Return the database connection pool statistics
+    """
+    #------------------------------------------------------------------
+    # CONNECTION POOL STATISTICS
+    #------------------------------------------------------------------
+    @api.doc('get_pool_stats')
+    @api.marshal_with(pool_stats_model)
+    def get(self):
+        """
+        Returns the connection pool statistics of this worker
+        Used to size the pool (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)
+        """
+        return POOL_STATS.stats(DB.engine.pool), status.HTTP_200_OK
+
 ####################################################################################################
 #  PATH: /inventory/{product_id}/condition/{condition}
 ####################################################################################################
@@ -235,44 +954,63 @@ class InventoryResource(Resource):
     #------------------------------------------------------------------
     @api.doc('get_inventory')
     @api.response(status.HTTP_404_NOT_FOUND, 'Inventory not found')
-    @api.marshal_with(inventory_model)
+    @api.response(status.HTTP_200_OK, 'Success', inventory_model)
+    @api.response(status.HTTP_304_NOT_MODIFIED, 'The record matches the If-None-Match ETag')
+    @api.doc(params={keys.KEY_MASK_HEADER: FIELDS_MASK,
+                     keys.KEY_IF_NONE_MATCH_HEADER: IF_NONE_MATCH})
     def get(self, product_id, condition):
         """
         Retrieve a single Inventory
 
-        This endpoint will return a Inventory based on it's id
+        This endpoint will return a Inventory based on it's id, with its "ETag"
         """
-        app.logger.info("A GET request for inventories with product_id {} and condition {}"\
-                        .format(product_id, condition))
-        inventory = Inventory.find_by_product_id_condition(product_id, condition)
+        app.logger.debug("A GET request for inventories with product_id %s and condition %s",
+                         product_id, condition)
+        inventory = Inventory.find_cached(product_id, condition)
         if not inventory:
             api.abort(status.HTTP_404_NOT_FOUND,
                 "Inventory ({}, {}) NOT FOUND".format(product_id, condition))
-        app.logger.info("Return inventory with product_id {} and condition {}"\
-                        .format(product_id, condition))
-        return inventory.serialize(), status.HTTP_200_OK
+        headers = {}
+        response = not_modified(inventory.etag(), headers)
+        if response:
+            return response
+        app.logger.debug("Return inventory with product_id %s and condition %s",
+                         product_id, condition)
+        mask = request.headers.get(keys.KEY_MASK_HEADER)
+        if mask:
+            return marshal(inventory.serialize(), inventory_model, mask=mask), \
+                status.HTTP_200_OK, headers
+        return json_response(encoder.encode_record(inventory), status.HTTP_200_OK, headers)
 
     #------------------------------------------------------------------
     # UPDATE AN (EXISTING) INVENTORY
     #------------------------------------------------------------------
-    @api.doc('update_inventory', security='apikey')
+    @api.doc('update_inventory', security='apikey',
+             params={keys.KEY_IF_MATCH_HEADER: IF_MATCH})
     @api.response(status.HTTP_404_NOT_FOUND, 'Inventory not found')
     @api.response(status.HTTP_400_BAD_REQUEST, 'The posted Inventory data was not valid')
+    @api.response(status.HTTP_409_CONFLICT, 'The Inventory was changed by another request')
+    @api.response(status.HTTP_412_PRECONDITION_FAILED, 'The Inventory no longer matches If-Match')
     @api.expect(inventory_model)
     @api.marshal_with(inventory_model)
     # @token_required
     def put(self, product_id, condition):
         """
         Update an Inventory
-        This endpoint will update a Inventory based the body that is posted
+        This endpoint will update a Inventory based the body that is posted.
+        Send the "ETag" of the Inventory in "If-Match" so the update is only
+        applied while nobody else changed it (412 otherwise)
         """
-        app.logger.info("Request to update inventory with key ({}, {})"\
-                        .format(product_id, condition))
+        app.logger.debug("Request to update inventory with key (%s, %s)", product_id, condition)
         try:
             inventory = Inventory.find_by_product_id_condition(product_id, condition)
             if not inventory:
                 api.abort(status.HTTP_404_NOT_FOUND,
                         "Inventory with ({}, {})".format(product_id, condition))
+            if request.if_match and not request.if_match.contains(inventory.row().etag()):
+                api.abort(status.HTTP_412_PRECONDITION_FAILED,
+                        "Inventory with ({}, {}) does not match {}".format(product_id,
+                        condition, keys.KEY_IF_MATCH_HEADER))
 
             resp_old = inventory.serialize()
             resp_new = api.payload
@@ -281,11 +1019,17 @@ class InventoryResource(Resource):
                     resp_old[key] = resp_new[key]
             inventory.deserialize(resp_old)
             inventory.validate_data()
+            # Fails if the record was written since it was read above
             inventory.update()
-            app.logger.info("Inventory ({}, {}) updated.".format(product_id, condition))
-            return inventory.serialize(), status.HTTP_200_OK
+            app.logger.debug("Inventory (%s, %s) updated.", product_id, condition)
+            EVENTS.publish(keys.EVENT_UPDATE, inventory.serialize())
+            headers = {keys.KEY_ETAG_HEADER: quote_etag(inventory.row().etag())}
+            return inventory.serialize(), status.HTTP_200_OK, headers
         except DataValidationError as err:
             api.abort(status.HTTP_400_BAD_REQUEST, err)
+        except VersionConflictError as err:
+            api.abort(status.HTTP_412_PRECONDITION_FAILED if request.if_match
+                      else status.HTTP_409_CONFLICT, err)
 
     #------------------------------------------------------------------
     # DELETE AN INVENTORY
@@ -299,13 +1043,13 @@ class InventoryResource(Resource):
 
         This endpoint will delete a Inventory based the id specified in the path
         """
-        app.logger.info("Request to delete inventory with key ({}, {})"\
-                        .format(product_id, condition))
+        app.logger.debug("Request to delete inventory with key (%s, %s)", product_id, condition)
         inventory = Inventory.find_by_product_id_condition(product_id, condition)
         if inventory:
             inventory.delete()
-        app.logger.info("Inventory with product_id {} and condition {} deleted"
-                        .format(product_id, condition))
+            EVENTS.publish(keys.EVENT_DELETE, {keys.KEY_PID: product_id, keys.KEY_CND: condition})
+        app.logger.debug("Inventory with product_id %s and condition %s deleted",
+                         product_id, condition)
         return '', status.HTTP_204_NO_CONTENT
 
 ####################################################################################################
@@ -330,34 +1074,27 @@ class InventoryResourceRestock(Resource):
         """
         Restock an Inventory's Quantity
         """
-        app.logger.info("Request to update inventory with key ({}, {})"\
-                        .format(product_id, condition))
-        # Check if the record exists
-        inventory = Inventory.find_by_product_id_condition(product_id, condition)
+        app.logger.debug("Request to update inventory with key (%s, %s)", product_id, condition)
+        # Checking for a valid keys.KEY_AMT
+        error = check_amount(api.payload)
+        if error:
+            # An unknown record is reported ahead of an invalid body
+            if not Inventory.find_by_product_id_condition(product_id, condition):
+                api.abort(status.HTTP_404_NOT_FOUND,
+                    "Inventory with ({}, {})".format(product_id, condition))
+            api.abort(status.HTTP_400_BAD_REQUEST, error)
+
+        # Increment the quantity in the DB with a single UPDATE
+        try:
+            inventory = Inventory.restock(product_id, condition, int(api.payload[keys.KEY_AMT]))
+        except DataValidationError as err:
+            api.abort(status.HTTP_400_BAD_REQUEST, err)
         if not inventory:
             api.abort(status.HTTP_404_NOT_FOUND,
                 "Inventory with ({}, {})".format(product_id, condition))
-
-        # Checking for keys.KEY_AMT keyword
-        json = request.get_json()
-        json = api.payload
-        if "amount" not in json.keys():
-            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: Amount missing")
-
-        # Checking for amount >= 0
-        amount = json[keys.KEY_AMT]
-        regex = "^\-?\d+$"
-        if not re.search(regex, str(amount)):
-            api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: Amount must be an integer")
-        else:
-            if int(amount) <= 0:
-                api.abort(status.HTTP_400_BAD_REQUEST, "Invalid data: Amount <= 0")
-
-        inventory.quantity += int(amount)
-        inventory.validate_data()
-        inventory.update()
-        app.logger.info("Inventory ({}, {}) restocked.".format(product_id, condition))
-        return inventory.serialize(), status.HTTP_200_OK
+        app.logger.debug("Inventory (%s, %s) restocked.", product_id, condition)
+        EVENTS.publish(keys.EVENT_RESTOCK, record_event(inventory))
+        return inventory, status.HTTP_200_OK
 
 ####################################################################################################
 #  PATH: /inventory/{product_id}/condition/{condition}/activate
@@ -373,14 +1110,14 @@ class InventoryResourceActivate(Resource):
     #------------------------------------------------------------------
     @api.doc('update_inventory', security='apikey')
     @api.response(status.HTTP_404_NOT_FOUND, 'Inventory not found')
+    @api.response(status.HTTP_409_CONFLICT, 'The Inventory was changed by another request')
     @api.marshal_with(inventory_model)
     # @token_required
     def put(self, product_id, condition):
         """
         Restock an Inventory's Quantity
         """
-        app.logger.info("Request to update inventory with key ({}, {})"\
-                        .format(product_id, condition))
+        app.logger.debug("Request to update inventory with key (%s, %s)", product_id, condition)
         # Check if the record exists
         inventory = Inventory.find_by_product_id_condition(product_id, condition)
         if not inventory:
@@ -389,8 +1126,12 @@ class InventoryResourceActivate(Resource):
 
         inventory.available = 1
         inventory.validate_data()
-        inventory.update()
-        app.logger.info("Inventory ({}, {}) restocked.".format(product_id, condition))
+        try:
+            inventory.update()
+        except VersionConflictError as err:
+            api.abort(status.HTTP_409_CONFLICT, err)
+        app.logger.debug("Inventory (%s, %s) restocked.", product_id, condition)
+        EVENTS.publish(keys.EVENT_ACTIVATE, inventory.serialize())
         return inventory.serialize(), status.HTTP_200_OK
 
 ####################################################################################################
@@ -407,14 +1148,14 @@ class InventoryResourceDeactivate(Resource):
     #------------------------------------------------------------------
     @api.doc('update_inventory', security='apikey')
     @api.response(status.HTTP_404_NOT_FOUND, 'Inventory not found')
+    @api.response(status.HTTP_409_CONFLICT, 'The Inventory was changed by another request')
     @api.marshal_with(inventory_model)
     # @token_required
     def put(self, product_id, condition):
         """
         Restock an Inventory's Quantity
         """
-        app.logger.info("Request to update inventory with key ({}, {})"\
-                        .format(product_id, condition))
+        app.logger.debug("Request to update inventory with key (%s, %s)", product_id, condition)
         # Check if the record exists
         inventory = Inventory.find_by_product_id_condition(product_id, condition)
         if not inventory:
@@ -423,6 +1164,10 @@ class InventoryResourceDeactivate(Resource):
 
         inventory.available = 0
         inventory.validate_data()
-        inventory.update()
-        app.logger.info("Inventory ({}, {}) restocked.".format(product_id, condition))
+        try:
+            inventory.update()
+        except VersionConflictError as err:
+            api.abort(status.HTTP_409_CONFLICT, err)
+        app.logger.debug("Inventory (%s, %s) restocked.", product_id, condition)
+        EVENTS.publish(keys.EVENT_DEACTIVATE, inventory.serialize())
         return inventory.serialize(), status.HTTP_200_OK
@@ -34,10 +34,14 @@ class InventoryErrTest(TestCase):
     @classmethod
     def tearDownClass(cls):
         """ Run once after all tests """
-        DB.session.close()
+        with app.app_context():
+            DB.session.close()
 
     def setUp(self):
         """ Runs before each test """
+        # Each test runs in its own app context, like a request
+        self.context = app.app_context()
+        self.context.push()
         DB.drop_all()  # clean up the last tests
         DB.create_all()  # create new tables
         self.app = app.test_client()
@@ -45,6 +49,7 @@ class InventoryErrTest(TestCase):
     def tearDown(self):
         DB.session.remove()
         DB.drop_all()
+        self.context.pop()
 
 ######################################################################
 #  T E S T   C A S E S
@@ -0,0 +1,78 @@
+"""
+Test cases for the Record Cache
+
+"""
+import time
+import unittest
+from service.cache import RecordCache
+
+################################################################################
+#  Record Cache test cases
+################################################################################
+class RecordCacheTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Record Cache Tests
+    ################################################################################################
+    """
+
+    def test_get_put(self):
+        """ Cache and look up a record """
+        cache = RecordCache(max_size=2, ttl=60)
+        self.assertIsNone(cache.get((1, "new")))
+        cache.put((1, "new"), {"quantity": 1})
+        self.assertEqual(cache.get((1, "new")), {"quantity": 1})
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_lru_eviction(self):
+        """ Evict the least recently used record """
+        cache = RecordCache(max_size=2, ttl=60)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        cache.get(1)
+        cache.put(3, "c")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "a")
+        self.assertEqual(cache.get(3), "c")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.configure(1, 60)
+        self.assertEqual(cache.stats()["size"], 1)
+
+    def test_ttl(self):
+        """ Expire records after the time-to-live """
+        cache = RecordCache(max_size=2, ttl=0.01)
+        cache.put(1, "a")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidate(self):
+        """ Invalidate records """
+        cache = RecordCache(max_size=10, ttl=60)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        cache.invalidate(1, 3)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), "b")
+        cache.clear()
+        self.assertIsNone(cache.get(2))
+
+    def test_stale_put(self):
+        """ Drop values read before an invalidation """
+        cache = RecordCache(max_size=10, ttl=60)
+        generation = cache.generation()
+        cache.invalidate(1)
+        cache.put(1, "stale", generation)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, "fresh", cache.generation())
+        self.assertEqual(cache.get(1), "fresh")
+
+    def test_disabled(self):
+        """ Cache nothing when the size is 0 """
+        cache = RecordCache()
+        cache.put(1, "a")
+        self.assertIsNone(cache.get(1))
@@ -0,0 +1,48 @@
+"""
+Test cases for the fast JSON encoder
+
+"""
+import json
+import unittest
+from flask_restplus import marshal
+from service import encoder
+from service.model import Inventory
+from service.routes import inventory_model
+
+################################################################################
+#  Encoder test cases
+################################################################################
+class EncoderTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Encoder Tests
+    ################################################################################################
+    """
+
+    def _inventory(self, **kwargs):
+        data = {"product_id": 1, "condition": "new", "quantity": 10,
+                "restock_level": 5, "available": 1}
+        data.update(kwargs)
+        inventory = Inventory()
+        for key, value in data.items():
+            setattr(inventory, key, value)
+        return inventory
+
+    def test_encode_record(self):
+        """ Encode a record the same way as marshalling """
+        inventory = self._inventory(condition='open "box"é', quantity=None)
+        expected = marshal(inventory.serialize(), inventory_model)
+        body = encoder.encode_record(inventory)
+        self.assertEqual(json.loads(body.decode("ascii")), expected)
+        self.assertEqual(list(json.loads(body.decode("ascii"))), list(encoder.FIELDS))
+        self.assertEqual(encoder.encode_dict(inventory.serialize()), body)
+
+    def test_encode_records(self):
+        """ Encode a list of records as an array and as lines """
+        inventories = [self._inventory(product_id=i) for i in range(3)]
+        expected = [marshal(inv.serialize(), inventory_model) for inv in inventories]
+        self.assertEqual(json.loads(encoder.encode_records(inventories).decode("ascii")), expected)
+        self.assertEqual(encoder.encode_records([]), b"[]")
+        lines = [json.loads(line.decode("ascii")) for line in encoder.encode_lines(inventories)]
+        self.assertEqual(lines, expected)
+        self.assertEqual(encoder.as_dict(inventories[0]), inventories[0].serialize())
@@ -0,0 +1,134 @@
+"""
+Test cases for the Change Feed
+
+"""
+import os
+import logging
+import threading
+import unittest
+from service import app, keys
+from service.model import DB, Inventory
+from service.events import EventBus, EventStore
+
+DATABASE_URI = os.getenv(keys.KEY_DB_URI, keys.DATABASE_URI_LOCAL)
+
+################################################################################
+#  Change Feed test cases
+################################################################################
+class EventBusTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Change Feed Tests
+    ################################################################################################
+    """
+
+    def test_publish(self):
+        """ Resume after an event id """
+        bus = EventBus(max_size=10)
+        start = bus.parse(bus.last_id())
+        self.assertEqual(start, 0)
+        self.assertEqual(bus.since(start), [])
+        bus.publish(keys.EVENT_CREATE, {keys.KEY_PID: 1})
+        bus.publish_many(keys.EVENT_DELETE, [{keys.KEY_PID: 2}, {keys.KEY_PID: 3}])
+        events = bus.since(start)
+        self.assertEqual([event.name for event in events],
+                         [keys.EVENT_CREATE, keys.EVENT_DELETE, keys.EVENT_DELETE])
+        self.assertEqual(bus.since(bus.parse(events[0].id)), events[1:])
+        self.assertEqual(events[0].message(), 'id: {}\nevent: create\ndata: {{"product_id":1}}\n\n'
+                         .format(events[0].id))
+        self.assertEqual(bus.published, 3)
+
+    def test_parse(self):
+        """ Reject the event ids the feed can not resume from """
+        bus = EventBus()
+        self.assertIsNone(bus.parse(None))
+        self.assertIsNone(bus.parse("bad"))
+        self.assertIsNone(bus.parse("1-0"))
+        self.assertIsNone(bus.parse("5"))
+        self.assertIsNone(bus.parse("-1"))
+
+    def test_evicted(self):
+        """ Report the events dropped from the buffer """
+        bus = EventBus(max_size=2)
+        bus.publish_many(keys.EVENT_CREATE, [1, 2, 3])
+        self.assertIsNone(bus.since(0))
+        self.assertEqual([event.data for event in bus.since(1)], [2, 3])
+        bus.configure(1)
+        self.assertIsNone(bus.since(1))
+        self.assertEqual(bus.reset_event().name, keys.EVENT_RESET)
+
+    def test_streams(self):
+        """ Count the open streams up to a maximum """
+        bus = EventBus()
+        close = bus.open_stream(2)
+        self.assertTrue(bus.open_stream(2))
+        self.assertIsNone(bus.open_stream(2))
+        close()
+        close()
+        self.assertEqual(bus.streams, 1)
+        self.assertTrue(bus.open_stream(2))
+
+    def test_wait(self):
+        """ Wake up the streams waiting for an event """
+        bus = EventBus()
+        timer = threading.Timer(0.05, bus.publish, (keys.EVENT_UPDATE, {}))
+        timer.start()
+        events = bus.since(0, timeout=5)
+        timer.join()
+        self.assertEqual([event.name for event in events], [keys.EVENT_UPDATE])
+        self.assertEqual(bus.since(1, timeout=0.01), [])
+
+################################################################################
+#  Shared Change Feed test cases
+################################################################################
+class EventStoreTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Shared Change Feed Tests
+    ################################################################################################
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ These run once before Test suite """
+        app.debug = False
+        app.logger.setLevel(logging.CRITICAL)
+        app.config[keys.KEY_SQL_ALC] = DATABASE_URI
+        Inventory.init_db(app)
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        DB.drop_all()
+        DB.create_all()
+
+    def tearDown(self):
+        DB.session.remove()
+        self.context.pop()
+
+    def test_workers(self):
+        """ Resume the events of a worker on another one """
+        first = EventBus(max_size=10, store=EventStore(app, 10), poll_seconds=0.01)
+        second = EventBus(max_size=10, store=EventStore(app, 10), poll_seconds=0.01)
+        first.publish(keys.EVENT_CREATE, {keys.KEY_PID: 1})
+        last_id = first.last_id()
+        first.publish_many(keys.EVENT_DELETE, [{keys.KEY_PID: 2}, {keys.KEY_PID: 3}])
+        seq = second.parse(last_id)
+        self.assertIsNotNone(seq)
+        self.assertEqual([event.data[keys.KEY_PID] for event in second.since(seq)], [2, 3])
+        # The waiting streams read the events of the other worker
+        second.publish(keys.EVENT_UPDATE, {keys.KEY_PID: 4})
+        events = first.since(int(last_id) + 2, timeout=1)
+        self.assertEqual([(event.id, event.name) for event in events],
+                         [(second.last_id(), keys.EVENT_UPDATE)])
+
+    def test_pruned(self):
+        """ Reset the clients behind the events kept in the table """
+        store = EventStore(app, 2)
+        store.PRUNE_EVERY = 1
+        first = EventBus(max_size=2, store=store)
+        first.publish_many(keys.EVENT_CREATE, [1, 2, 3])
+        first.publish(keys.EVENT_CREATE, 4)
+        second = EventBus(max_size=2, store=EventStore(app, 2))
+        self.assertIsNone(second.parse("1"))
+        self.assertEqual([event.data for event in second.since(second.parse("2"))], [3, 4])
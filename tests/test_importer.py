@@ -0,0 +1,125 @@
+"""
+Test cases for the CSV importer
+
+"""
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+from flask_sqlalchemy import sqlalchemy
+from service import app, keys, routes
+from service.importer import CsvImporter
+from service.model import Inventory, InventorySummary, DB, CACHE
+
+DATABASE_URI = os.getenv(keys.KEY_DB_URI, keys.DATABASE_URI_LOCAL)
+
+ROWS = [
+    "product_id,condition,quantity,restock_level,available",
+    "1,new,10,5,1",
+    "2,used,20,5,0",
+    "1,new,11,5,1",  # the key of line 2
+    "3,broken,1,1,1",  # invalid
+    "4,open box,4,5,1",
+    '"5","new","5","5","1"',
+]
+
+################################################################################
+#  CSV importer test cases
+################################################################################
+class ImporterTest(unittest.TestCase):
+    """
+    ################################################################################################
+    CSV Importer Tests
+    ################################################################################################
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ These run once before Test suite """
+        app.debug = False
+        app.logger.setLevel(logging.CRITICAL)
+        app.config[keys.KEY_SQL_ALC] = DATABASE_URI
+        Inventory.init_db(app)
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        DB.drop_all()
+        DB.create_all()
+        CACHE.clear()
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "inventory.csv")
+        with open(self.path, "w") as out:
+            out.write("\n".join(ROWS) + "\n")
+
+    def tearDown(self):
+        DB.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.folder)
+
+    def summary(self):
+        """ The totals of the summary as (condition, available, records, quantity) """
+        return [tuple(total.serialize().values()) for total in InventorySummary.totals()]
+
+    def test_import(self):
+        """ Import a file in chunks """
+        state = CsvImporter(self.path, chunk_size=2).run()
+        self.assertEqual((state["line"], state["loaded"], state["skipped"], state["invalid"]),
+                         (7, 4, 1, 1))
+        self.assertEqual(Inventory.find_by_product_id_condition(1, "new").quantity, 10)
+        self.assertEqual(Inventory.find_by_product_id_condition(5, "new").quantity, 5)
+        self.assertEqual(self.summary(), [("new", 1, 2, 15), ("open box", 1, 1, 4),
+                                          ("used", 0, 1, 20)])
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+        # Loading the file again skips every record
+        state = CsvImporter(self.path).run()
+        self.assertEqual((state["loaded"], state["skipped"]), (0, 5))
+        self.assertEqual(self.summary()[0], ("new", 1, 2, 15))
+
+    def test_resume(self):
+        """ Resume a failed import after its last committed chunk """
+        load = Inventory.bulk_load
+        calls = []
+
+        def failing(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise sqlalchemy.exc.OperationalError("COPY", {}, Exception("lost"))
+            return load(rows)
+        importer = CsvImporter(self.path, chunk_size=2)
+        with mock.patch.object(Inventory, "bulk_load", side_effect=failing):
+            self.assertRaises(sqlalchemy.exc.OperationalError, importer.run)
+        self.assertEqual(len(Inventory.find_all()), 2)
+        checkpoint = importer.checkpoint.load(self.path)
+        self.assertEqual((checkpoint["line"], checkpoint["loaded"]), (3, 2))
+
+        progress = []
+        state = importer.run(progress=progress.append)
+        self.assertEqual((state["loaded"], state["skipped"], state["invalid"]), (4, 1, 1))
+        self.assertEqual([item["line"] for item in progress], [5, 7])
+        self.assertEqual(len(Inventory.find_all()), 4)
+        self.assertIsNone(importer.checkpoint.load(self.path))
+
+    def test_bad_header(self):
+        """ Refuse a file without the record columns """
+        with open(self.path, "w") as out:
+            out.write("product_id,condition\n1,new\n")
+        self.assertRaises(ValueError, CsvImporter(self.path).run)
+
+    def test_bad_chunk_size(self):
+        """ Refuse chunks of less than one row """
+        self.assertRaises(ValueError, CsvImporter, self.path, chunk_size=0)
+        result = app.test_cli_runner().invoke(routes.inventory_import,
+                                              [self.path, "--chunk-size", "0"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(len(Inventory.find_all()), 0)
+
+    def test_command(self):
+        """ Import a file with flask inventory-import """
+        runner = app.test_cli_runner()
+        result = runner.invoke(routes.inventory_import, [self.path, "--chunk-size", "4"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("4 loaded, 1 skipped, 1 invalid", result.output)
+        self.assertEqual(len(Inventory.find_all()), 4)
@@ -0,0 +1,67 @@
+"""
+Test cases for the Logging pipeline
+
+"""
+import json
+import logging
+import threading
+import unittest
+from service.logs import Fields, LogPipeline, RequestLog
+
+class ListHandler(logging.Handler):
+    """ Keeps the formatted records, with the thread that formatted them """
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append((self.format(record), threading.current_thread().name))
+
+################################################################################
+#  Logging pipeline test cases
+################################################################################
+class LogsTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Logging Pipeline Tests
+    ################################################################################################
+    """
+
+    def setUp(self):
+        self.handler = ListHandler()
+        self.logger = logging.getLogger("test.logs")
+        self.logger.handlers = [self.handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def test_pipeline(self):
+        """ Write the records from the background thread """
+        pipeline = LogPipeline()
+        other = logging.getLogger("test.logs.other")
+        pipeline.start(self.logger, other)
+        self.logger.info("Created %s", 1)
+        other.info("Updated %s", 2)
+        self.logger.debug("Skipped %s", 3)
+        pipeline.stop()
+        self.assertEqual([line for line, _ in self.handler.lines], ["Created 1", "Updated 2"])
+        self.assertNotIn("MainThread", [thread for _, thread in self.handler.lines])
+
+    def test_request_log(self):
+        """ Sample the successful requests """
+        request_log = RequestLog(self.logger, sample_rate=0, slow_seconds=1)
+        request_log.log(200, 0.01, method="GET", path="/api/inventory")
+        request_log.log(404, 0.01, method="GET", path="/api/inventory/1/condition/new")
+        request_log.log(200, 2, method="GET", path="/api/inventory")
+        lines = [line for line, _ in self.handler.lines]
+        self.assertEqual(len(lines), 2)
+        fields = json.loads(lines[0][len("request "):])
+        self.assertEqual(fields, {"method": "GET", "path": "/api/inventory/1/condition/new",
+                                  "status": 404, "ms": 10.0, "sample": 1.0})
+        request_log.configure(1.0, 1)
+        request_log.log(201, 0.01, method="POST")
+        self.assertEqual(len(self.handler.lines), 3)
+
+    def test_fields(self):
+        """ Serialize the fields when the record is written """
+        self.assertEqual(str(Fields(path="/", error=None)), '{"path":"/","error":null}')
@@ -0,0 +1,53 @@
+"""
+Test cases for the Metrics
+
+"""
+import unittest
+import sqlalchemy
+from service.metrics import Counter, Histogram, Metrics
+
+################################################################################
+#  Metrics test cases
+################################################################################
+class MetricsTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Metrics Tests
+    ################################################################################################
+    """
+
+    def test_histogram(self):
+        """ Render cumulative buckets """
+        histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(("/a",), 0.05)
+        histogram.observe(("/a",), 0.5)
+        histogram.observe(("/a",), 5)
+        self.assertEqual(histogram.render(), [
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/a",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a",le="1.0"} 2',
+            'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+            'latency_seconds_sum{route="/a"} 5.55',
+            'latency_seconds_count{route="/a"} 3'])
+
+    def test_counter(self):
+        """ Count up and down, escaping the label values """
+        gauge = Counter("in_flight", "In flight", ("route",), kind="gauge")
+        gauge.inc(('/"a"',))
+        gauge.inc(('/"a"',))
+        gauge.inc(('/"a"',), -1)
+        self.assertEqual(gauge.render()[1:], ["# TYPE in_flight gauge", 'in_flight{route="/\\"a\\""} 1'])
+
+    def test_queries(self):
+        """ Time the statements of an engine by operation """
+        metrics = Metrics()
+        engine = sqlalchemy.create_engine("sqlite://")
+        metrics.attach(engine)
+        metrics.attach(engine)  # listens only once
+        engine.execute("SELECT 1")
+        self.assertRaises(sqlalchemy.exc.OperationalError, engine.execute, "DELETE FROM nothing")
+        text = metrics.render()
+        self.assertIn('inventory_db_query_duration_seconds_count{operation="select"} 1', text)
+        self.assertIn('inventory_db_query_errors_total{operation="delete"} 1', text)
+        self.assertEqual(Metrics.operation("\n  WITH deleted AS (...)"), "with")
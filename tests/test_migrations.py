@@ -0,0 +1,84 @@
+"""
+Test cases for the schema migrations
+
+"""
+import os
+import unittest
+from flask_sqlalchemy import sqlalchemy
+from service import app, keys, migrations
+from service.model import Inventory, DB
+
+DATABASE_URI = os.getenv(keys.KEY_DB_URI, keys.DATABASE_URI_LOCAL)
+
+################################################################################
+#  Migrations test cases
+################################################################################
+class MigrationsTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Schema Migrations Tests
+    ################################################################################################
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ These run once before Test suite """
+        app.debug = False
+        app.config[keys.KEY_SQL_ALC] = DATABASE_URI
+        Inventory.init_db(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        """ These run once after Test suite """
+        with app.app_context():
+            DB.session.close()
+
+    def setUp(self):
+        # Each test runs in its own app context, like a request
+        self.context = app.app_context()
+        self.context.push()
+        DB.session.remove()
+        DB.drop_all()
+        migrations.SCHEMA_VERSION.drop(DB.engine, checkfirst=True)
+
+    def tearDown(self):
+        DB.session.remove()
+        migrations.SCHEMA_VERSION.drop(DB.engine, checkfirst=True)
+        DB.create_all()
+        self.context.pop()
+
+    def index_names(self):
+        """ Returns the names of the indexes of the inventory table """
+        return {index["name"] for index in sqlalchemy.inspect(DB.engine).get_indexes("inventory")}
+
+    def test_upgrade_legacy_table(self):
+        """ Upgrade a table created before the secondary indexes """
+        DB.engine.execute("CREATE TABLE inventory (product_id INTEGER NOT NULL, "
+                          "condition VARCHAR(100) NOT NULL, quantity INTEGER, "
+                          "restock_level INTEGER, available INTEGER, "
+                          "PRIMARY KEY (product_id, condition))")
+        DB.engine.execute("INSERT INTO inventory VALUES (1, 'new', 2, 3, 1)")
+        self.assertEqual(migrations.current_version(DB.engine), 0)
+        version = migrations.upgrade(DB.engine)
+        self.assertEqual(version, migrations.MIGRATIONS[-1][0])
+        self.assertEqual(migrations.current_version(DB.engine), version)
+        self.assertIn("ix_inventory_available_quantity_product", self.index_names())
+        self.assertNotIn("ix_inventory_available_quantity", self.index_names())
+        self.assertIn("ix_inventory_low_stock_condition", self.index_names())
+        self.assertEqual(DB.engine.execute("SELECT count(*) FROM inventory").scalar(), 1)
+        # Upgrading again is a no-op
+        self.assertEqual(migrations.upgrade(DB.engine), version)
+
+    def test_upgrade_fresh_database(self):
+        """ Upgrade a database created from the current models """
+        DB.create_all()
+        version = migrations.upgrade(DB.engine)
+        self.assertEqual(version, migrations.MIGRATIONS[-1][0])
+        for index in Inventory.__table__.indexes:
+            self.assertIn(index.name, self.index_names())
+
+    def test_upgrade_target(self):
+        """ Upgrade up to a given version only """
+        DB.create_all()
+        self.assertEqual(migrations.upgrade(DB.engine, target=0), 0)
+        self.assertEqual(migrations.current_version(DB.engine), 0)
@@ -6,8 +6,11 @@ import os
 import sys
 import logging
 import unittest
+from unittest import mock
+from flask import has_app_context
 from service import app, model, keys
-from service.model import Inventory, DB, DataValidationError, DBError
+from service.model import Inventory, InventoryFilter, InventoryRow, InventorySummary, DB, \
+    CACHE, PLANS, VALIDATOR, DataValidationError, DBError, VersionConflictError
 from .inventory_factory import InventoryFactory
 
 DATABASE_URI = os.getenv(keys.KEY_DB_URI, keys.DATABASE_URI_LOCAL)
@@ -33,14 +36,20 @@ class InventoryTest(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """ These run once after Test suite """
-        DB.session.close()
+        with app.app_context():
+            DB.session.close()
 
     def setUp(self):
+        # Each test runs in its own app context, like a request
+        self.context = app.app_context()
+        self.context.push()
         DB.drop_all()  # clean up the last tests
         DB.create_all()  # make our sqlalchemy tables
+        CACHE.clear()
 
     def tearDown(self):
         DB.session.remove()
+        self.context.pop()
 
     ################################################################################################
     ## Utility
@@ -59,6 +68,15 @@ class InventoryTest(unittest.TestCase):
             self.db_err(uri)
         app.config[keys.KEY_SQL_ALC] = DATABASE_URI
 
+    def test_init_db_context(self):
+        """Initialize the DB without leaving an app context behind"""
+        Inventory.init_db(app)
+        self.context.pop()
+        try:
+            self.assertFalse(has_app_context())
+        finally:
+            self.context.push()
+
     def db_err(self, uri):
         app.config[keys.KEY_SQL_ALC] = uri
         self.assertRaises(DBError, Inventory.init_db, app)
@@ -113,8 +131,11 @@ class InventoryTest(unittest.TestCase):
         }
         inventory = Inventory()
         inventory.deserialize(data)
-        if err==1:
+        if int(err)==1:
             self.assertRaises(DataValidationError, inventory.validate_data)
+        else:
+            # The valid strings of digits are coerced, the invalid values kept as sent
+            pid, qty, lvl, avl = int(pid), int(qty), int(lvl), int(avl)
         self.assertNotEqual(inventory, None)
         self.assertEqual(inventory.product_id, pid)
         self.assertEqual(inventory.condition, cnd)
@@ -155,6 +176,41 @@ class InventoryTest(unittest.TestCase):
         except DataValidationError as err:
             print(err)
 
+    def test_validate_batch(self):
+        """ Validate many records in one pass """
+        records = [
+            {keys.KEY_PID: "7", keys.KEY_CND: "used", keys.KEY_QTY: "2",
+             keys.KEY_LVL: 3, keys.KEY_AVL: True},
+            {keys.KEY_PID: 8, keys.KEY_CND: "broken", keys.KEY_QTY: 51,
+             keys.KEY_LVL: "\u00b2", keys.KEY_AVL: 1},
+            {keys.KEY_PID: 9, keys.KEY_CND: "new"},
+            "not a record",
+        ]
+        rows, errors = VALIDATOR.validate_batch(records)
+        self.assertEqual(rows, [(0, {keys.KEY_PID: 7, keys.KEY_CND: "used", keys.KEY_QTY: 2,
+                                     keys.KEY_LVL: 3, keys.KEY_AVL: 1})])
+        self.assertEqual(errors[1], "Error in data: ['Condition', 'Quantity', 'Restock Level']")
+        self.assertEqual(errors[2], "Invalid Inventory record: missing quantity")
+        self.assertIn("bad or no data", errors[3])
+        self.assertEqual(VALIDATOR.validate(records[0]), rows[0][1])
+        self.assertRaises(DataValidationError, VALIDATOR.validate, records[1])
+
+    def test_validate_once(self):
+        """ Coerce and validate a deserialized record in one pass """
+        data = {keys.KEY_PID: "7", keys.KEY_CND: "broken", keys.KEY_QTY: "2",
+                keys.KEY_LVL: 3, keys.KEY_AVL: True}
+        with mock.patch.object(VALIDATOR, "coerce", wraps=VALIDATOR.coerce) as coerce:
+            inventory = Inventory().deserialize(data)
+            self.assertEqual((inventory.product_id, inventory.condition, inventory.quantity,
+                              inventory.available), (7, "broken", 2, 1))
+            self.assertTrue(inventory.validate_data_quantity())
+            self.assertFalse(inventory.validate_data_condition())
+            self.assertRaises(DataValidationError, inventory.validate_data)
+            self.assertEqual(coerce.call_count, 1)
+            inventory.condition = "new"
+            self.assertTrue(inventory.validate_data())
+            self.assertEqual(coerce.call_count, 2)
+
     def read_test_data(self):
         """
         Read data for test cases into test_data
@@ -192,6 +248,29 @@ class InventoryTest(unittest.TestCase):
             self.assertEqual(inventory.restock_level, int(lvl))
             self.assertEqual(inventory.available, int(avl))
 
+    def test_bulk_create(self):
+        """ Create many inventories in one transaction """
+        Inventory(product_id=1, condition="new", quantity=1, restock_level=10,
+                  available=1).create()
+        records = [
+            {keys.KEY_PID: 1, keys.KEY_CND: "used", keys.KEY_QTY: "2",
+             keys.KEY_LVL: 3, keys.KEY_AVL: 1},
+            {keys.KEY_PID: 1, keys.KEY_CND: "new", keys.KEY_QTY: 2,
+             keys.KEY_LVL: 3, keys.KEY_AVL: 1},
+            {keys.KEY_PID: 2, keys.KEY_CND: "new", keys.KEY_QTY: -2,
+             keys.KEY_LVL: 3, keys.KEY_AVL: 1},
+            {keys.KEY_PID: 2, keys.KEY_CND: "new"},
+        ]
+        results = Inventory.bulk_create(records)
+        self.assertEqual([res[keys.KEY_STATUS] for res in results],
+                         [keys.STATUS_CREATED, keys.STATUS_CONFLICT,
+                          keys.STATUS_INVALID, keys.STATUS_INVALID])
+        inventory = Inventory.find_by_product_id_condition(1, "used")
+        self.assertEqual(inventory.quantity, 2)
+        self.assertEqual(len(Inventory.find_all()), 2)
+        self.assertEqual(Inventory.find_existing_keys([(1, "new"), (1, "open box"), (3, "new")]),
+                         {(1, "new")})
+
     ################################################################################################
     def test_update(self):
         """Update an Inventory"""
@@ -205,6 +284,18 @@ class InventoryTest(unittest.TestCase):
         self.assertEqual(len(inventories), 1)
         self.assertEqual(inventories[0].product_id, 667)
 
+    def test_restock(self):
+        """Restock an Inventory in the database"""
+        Inventory(product_id=888, condition="new", quantity=10,
+                  restock_level=10, available=1).create()
+        inventory = Inventory.restock(888, "new", 5)
+        self.assertEqual(inventory[keys.KEY_QTY], 15)
+        self.assertEqual(inventory[keys.KEY_AVL], 1)
+        self.assertEqual(Inventory.find_by_product_id_condition(888, "new").quantity, 15)
+        self.assertRaises(DataValidationError, Inventory.restock, 888, "new", keys.QTY_HIGH)
+        self.assertEqual(Inventory.find_by_product_id_condition(888, "new").quantity, 15)
+        self.assertIsNone(Inventory.restock(888, "used", 5))
+
     ################################################################################################
     def test_delete(self):
         """Delete an Inventory"""
@@ -216,6 +307,25 @@ class InventoryTest(unittest.TestCase):
         inventory.delete()
         self.assertEqual(len(Inventory.find_all()), 0)
 
+    def test_delete_by_filter(self):
+        """Delete the Inventories matching a filter"""
+        for pid in range(1, 4):
+            for cnd in keys.CONDITIONS:
+                Inventory(product_id=pid, condition=cnd, quantity=pid,
+                          restock_level=10, available=1).create()
+        self.assertEqual(Inventory.delete_by_filter(InventoryFilter(condition="new")), 3)
+        self.assertEqual(Inventory.delete_by_filter(InventoryFilter(quantity=3)), 2)
+        self.assertEqual(len(Inventory.find_all()), 4)
+
+    def test_delete_by_keys(self):
+        """Delete a list of Inventories"""
+        for pid in range(1, 4):
+            Inventory(product_id=pid, condition="new", quantity=1,
+                      restock_level=10, available=1).create()
+        deleted = Inventory.delete_by_keys([(1, "new"), (3, "new"), (3, "used"), (1, "new")])
+        self.assertEqual(deleted, 2)
+        self.assertEqual([inv.product_id for inv in Inventory.find_all()], [2])
+
     ################################################################################################
     def test_find_by_product_id_condition(self):
         """Find an Inventory by product_id and condition"""
@@ -235,6 +345,74 @@ class InventoryTest(unittest.TestCase):
         self.assertEqual(result.restock_level, 10)
         self.assertEqual(result.available, 0)
 
+    def test_find_cached(self):
+        """Find an Inventory through the record cache"""
+        self.assertIsNone(Inventory.find_cached(555, "new"))
+        inventory = Inventory(product_id=555, condition="new", quantity=1,
+                              restock_level=10, available=1)
+        inventory.create()
+        misses = CACHE.stats()["misses"]
+        self.assertEqual(Inventory.find_cached(555, "new").quantity, 1)
+        self.assertEqual(Inventory.find_cached(555, "new").quantity, 1)
+        self.assertEqual(CACHE.stats()["misses"], misses + 1)
+        inventory.quantity = 2
+        inventory.update()
+        self.assertEqual(Inventory.find_cached(555, "new").quantity, 2)
+        Inventory.restock(555, "new", 3)
+        self.assertEqual(Inventory.find_cached(555, "new").quantity, 5)
+        inventory = Inventory.find_by_product_id_condition(555, "new")
+        inventory.product_id = 556
+        inventory.update()
+        self.assertIsNone(Inventory.find_cached(555, "new"))
+        self.assertEqual(Inventory.find_cached(556, "new").quantity, 5)
+        inventory.delete()
+        self.assertIsNone(Inventory.find_cached(556, "new"))
+
+    def test_version(self):
+        """Increment the version of an Inventory on every write"""
+        inventory = Inventory(product_id=557, condition="new", quantity=1,
+                              restock_level=10, available=1)
+        inventory.create()
+        self.assertEqual(inventory.version, 1)
+        etag = inventory.row().etag()
+        self.assertEqual(Inventory.find_row(557, "new").etag(), etag)
+        inventory.update()
+        self.assertEqual(inventory.version, 1)
+        inventory.available = 0
+        inventory.update()
+        self.assertEqual(inventory.version, 2)
+        Inventory.restock(557, "new", 1)
+        Inventory.bulk_restock([(557, "new", 1)])
+        row = Inventory.find_row(557, "new")
+        self.assertEqual((row.version, row.quantity), (4, 3))
+        self.assertNotEqual(row.etag(), etag)
+        page = Inventory.page_etag([row])
+        self.assertEqual(Inventory.page_etag([row]), page)
+        self.assertNotEqual(Inventory.page_etag([row], "cursor"), page)
+        self.assertNotEqual(Inventory.page_etag([]), page)
+
+    def test_update_conflict(self):
+        """Reject the update of an Inventory changed since it was read"""
+        inventory = Inventory(product_id=558, condition="new", quantity=1,
+                              restock_level=10, available=1)
+        inventory.create()
+        self.assertEqual(inventory.quantity, 1)
+        # Another request writes the record in the meantime
+        table = Inventory.__table__
+        DB.engine.execute(table.update().where(table.c.product_id == 558)
+                          .values(quantity=9, version=table.c.version + 1))
+        inventory.quantity = 2
+        self.assertRaises(VersionConflictError, inventory.update)
+        self.assertEqual(Inventory.find_row(558, "new").quantity, 9)
+        inventory = Inventory.find_by_product_id_condition(558, "new")
+        inventory.quantity = 2
+        inventory.update()
+        self.assertEqual(Inventory.find_row(558, "new").quantity, 2)
+        # Deleting does not depend on the version
+        DB.engine.execute(table.update().values(version=table.c.version + 1))
+        inventory.delete()
+        self.assertIsNone(Inventory.find_row(558, "new"))
+
     def test_find_by_product_id(self):
         inventory = Inventory(product_id=444, condition="used", quantity=1,
                                 restock_level=10, available=1)
@@ -283,6 +461,178 @@ class InventoryTest(unittest.TestCase):
         inventories = Inventory.find_by_quantity(2)
         self.assertEqual(len(list(inventories)), 2)
 
+    def test_paginate(self):
+        """Page through Inventory records"""
+        for pid in [3, 1, 2]:
+            for cnd in keys.CONDITIONS:
+                Inventory(product_id=pid, condition=cnd, quantity=1,
+                          restock_level=10, available=1).create()
+        records, cursor = Inventory.paginate(Inventory.query, 4)
+        self.assertEqual(len(records), 4)
+        self.assertEqual([inv.product_id for inv in records], [1, 1, 1, 2])
+        self.assertIsNotNone(cursor)
+        records, cursor = Inventory.paginate(Inventory.query, 4, cursor)
+        self.assertEqual([inv.product_id for inv in records], [2, 2, 3, 3])
+        records, cursor = Inventory.paginate(Inventory.query, 4, cursor)
+        self.assertEqual(len(records), 1)
+        self.assertIsNone(cursor)
+        records, cursor = Inventory.paginate(Inventory.find_by_product_id(2), 10)
+        self.assertEqual(len(records), 3)
+        self.assertIsNone(cursor)
+
+    def test_select_rows(self):
+        """Read Inventory records as read-only rows"""
+        for pid in [3, 1, 2]:
+            Inventory(product_id=pid, condition="new", quantity=pid,
+                      restock_level=10, available=1).create()
+        DB.session.expunge_all()
+        rows = Inventory.fetch_rows(Inventory.select_rows(Inventory.quantity >= 2))
+        self.assertEqual(sorted(row.product_id for row in rows), [2, 3])
+        self.assertTrue(all(isinstance(row, InventoryRow) for row in rows))
+        self.assertEqual(len(DB.session.identity_map), 0)
+        row = Inventory.find_row(1, "new")
+        inventory = Inventory.find_by_product_id_condition(1, "new")
+        self.assertEqual(row.serialize(), inventory.serialize())
+        self.assertIsNone(Inventory.find_row(1, "used"))
+        records, cursor = Inventory.paginate(InventoryFilter(condition="new").select(), 2)
+        self.assertEqual([row.product_id for row in records], [1, 2])
+        records, cursor = Inventory.paginate(Inventory.select_rows(), 2, cursor)
+        self.assertEqual([row.product_id for row in records], [3])
+        self.assertIsNone(cursor)
+
+    def test_summary_rebuild(self):
+        """Keep the same totals as a rebuild after every write"""
+        def check():
+            totals = [summary.serialize() for summary in InventorySummary.totals()]
+            InventorySummary.rebuild()
+            self.assertEqual(totals, [summary.serialize()
+                                      for summary in InventorySummary.totals()])
+
+        inventory = Inventory(product_id=1, condition="new", quantity=5,
+                              restock_level=10, available=1)
+        inventory.create()
+        Inventory(product_id=2, condition="used", quantity=2, restock_level=1,
+                  available=0).create()
+        check()
+        inventory = Inventory.find_by_product_id_condition(1, "new")
+        inventory.delete()
+        inventory = Inventory(product_id=1, condition="open box", quantity=5,
+                              restock_level=10, available=1)
+        inventory.create()
+        check()
+        inventory.condition = "used"
+        inventory.available = 0
+        inventory.update()
+        check()
+        Inventory.find_by_product_id_condition(2, "used").delete()
+        check()
+        Inventory.delete_by_filter(InventoryFilter(condition="used"))
+        check()
+        self.assertEqual(InventorySummary.totals(), [])
+
+    def test_summary(self):
+        """Maintain the Inventory totals on every write"""
+        def totals():
+            return {(summary.condition, summary.available): (summary.records, summary.quantity)
+                    for summary in InventorySummary.totals()}
+
+        inventory = Inventory(product_id=1, condition="new", quantity=5,
+                              restock_level=10, available=1)
+        inventory.create()
+        Inventory.bulk_create([{keys.KEY_PID: pid, keys.KEY_CND: "used", keys.KEY_QTY: pid,
+                                keys.KEY_LVL: 1, keys.KEY_AVL: 0} for pid in range(1, 4)])
+        self.assertEqual(totals(), {("new", 1): (1, 5), ("used", 0): (3, 6)})
+        inventory.available = 0
+        inventory.quantity = 7
+        inventory.update()
+        self.assertEqual(totals(), {("new", 0): (1, 7), ("used", 0): (3, 6)})
+        Inventory.restock(1, "new", 3)
+        Inventory.bulk_restock([(1, "used", 2), (2, "used", 2)])
+        self.assertEqual(totals(), {("new", 0): (1, 10), ("used", 0): (3, 10)})
+        inventory.delete()
+        Inventory.delete_by_keys([(1, "used")])
+        self.assertEqual(totals(), {("used", 0): (2, 7)})
+        Inventory.delete_by_filter(InventoryFilter(quantity_max=3))
+        self.assertEqual(totals(), {("used", 0): (1, 4)})
+        # Rebuilding gives the same totals
+        self.assertEqual(InventorySummary.rebuild(), 1)
+        self.assertEqual(totals(), {("used", 0): (1, 4)})
+        DB.session.execute(InventorySummary.__table__.delete())
+        DB.session.commit()
+        self.assertEqual(totals(), {})
+        InventorySummary.rebuild()
+        self.assertEqual(totals(), {("used", 0): (1, 4)})
+
+    def test_find_below_restock_level(self):
+        """Find the Inventory records to restock"""
+        for pid in range(1, 4):
+            for cnd in keys.CONDITIONS:
+                Inventory(product_id=pid, condition=cnd, quantity=pid * 5,
+                          restock_level=10, available=1).create()
+        rows = Inventory.fetch_rows(Inventory.find_below_restock_level())
+        self.assertEqual(sorted({row.product_id for row in rows}), [1, 2])
+        self.assertEqual(len(rows), 6)
+        rows = Inventory.fetch_rows(Inventory.find_below_restock_level("used"))
+        self.assertEqual(sorted(row.product_id for row in rows), [1, 2])
+        records, cursor = Inventory.paginate(
+            Inventory.find_below_restock_level(["new", "used"]), 3)
+        self.assertEqual([(row.product_id, row.condition) for row in records],
+                         [(1, "new"), (1, "used"), (2, "new")])
+        records, cursor = Inventory.paginate(
+            Inventory.find_below_restock_level(["new", "used"]), 3, cursor)
+        self.assertEqual([(row.product_id, row.condition) for row in records], [(2, "used")])
+        self.assertIsNone(cursor)
+
+    def test_stream_all(self):
+        """Stream all Inventory records in key order"""
+        for pid in [5, 4, 6]:
+            Inventory(product_id=pid, condition="new", quantity=1,
+                      restock_level=10, available=1).create()
+        records = list(Inventory.stream_all(batch_size=2))
+        self.assertEqual([inv.product_id for inv in records], [4, 5, 6])
+
+    def test_filter(self):
+        """Find Inventory records by a combination of filters"""
+        for pid in range(1, 5):
+            for cnd in keys.CONDITIONS:
+                Inventory(product_id=pid, condition=cnd, quantity=pid*10,
+                          restock_level=10, available=pid % 2).create()
+        query = InventoryFilter(product_id=[1, 2, 3], condition="new").query()
+        self.assertEqual(len(query.all()), 3)
+        query = InventoryFilter(condition=["new", "used"], available=1).query()
+        self.assertEqual(len(query.all()), 4)
+        query = InventoryFilter(quantity=20, quantity_max=30).query()
+        self.assertEqual(len(query.all()), 6)
+        self.assertEqual(len(InventoryFilter().query().all()), 12)
+
+    def test_filter_index(self):
+        """Report the index serving a page of a combination of filters"""
+        def index(query):
+            return query.index(Inventory.page_query(query.select(), 10))
+        self.assertEqual(index(InventoryFilter()), "inventory_pkey")
+        self.assertEqual(index(InventoryFilter(condition="new")), "ix_inventory_condition_product")
+        # The rows matching a search on (available, quantity) are sorted by product_id
+        self.assertIsNone(index(InventoryFilter(quantity_max=2, available=1)))
+        # One plan for the lists of product ids of any length, one per condition
+        PLANS.clear()
+        for pids in ([1, 2], [1, 2, 3], list(range(50))):
+            index(InventoryFilter(product_id=pids, condition="new"))
+        index(InventoryFilter(product_id=[1, 2], condition="used"))
+        self.assertEqual(PLANS.stats()["size"], 2)
+        plan = Inventory.explain(Inventory.page_query(
+            InventoryFilter(condition="new").select(), 10, Inventory.encode_cursor(5, "new")))
+        self.assertEqual(plan.index, "ix_inventory_condition_product")
+        self.assertTrue(plan.search)
+        self.assertFalse(plan.sort)
+
+    def test_decode_cursor(self):
+        """Decode valid and invalid cursors"""
+        cursor = Inventory.encode_cursor(42, "open box")
+        self.assertEqual(Inventory.decode_cursor(cursor), (42, "open box"))
+        self.assertRaises(DataValidationError, Inventory.decode_cursor, "@@@")
+        bad = Inventory.encode_cursor("42", 7)
+        self.assertRaises(DataValidationError, Inventory.decode_cursor, bad)
+
 ################################################################################################
 #   M A I N
 ################################################################################################
@@ -0,0 +1,66 @@
+"""
+Test cases for the Connection Pool statistics
+
+"""
+import sqlite3
+import unittest
+import sqlalchemy
+from service.pool import POOL_STATS, PoolStats, TimedQueuePool
+
+################################################################################
+#  Connection Pool test cases
+################################################################################
+class PoolStatsTest(unittest.TestCase):
+    """
+    ################################################################################################
+    Connection Pool Tests
+    ################################################################################################
+    """
+
+    def setUp(self):
+        POOL_STATS.reset()
+        self.engine = sqlalchemy.create_engine(
+            "sqlite://", creator=lambda: sqlite3.connect(":memory:"),
+            poolclass=TimedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.01)
+        POOL_STATS.attach(self.engine)
+        POOL_STATS.attach(self.engine)  # listens only once
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_checkouts(self):
+        """ Count the connections in use and the overflow """
+        first = self.engine.connect()
+        second = self.engine.connect()
+        stats = POOL_STATS.stats(self.engine.pool)
+        self.assertEqual(stats["pool"], "TimedQueuePool")
+        self.assertEqual(stats["checked_out"], 2)
+        self.assertEqual(stats["overflow"], 1)
+        self.assertEqual(stats["connects"], 2)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["waits"], 2)
+        second.close()
+        first.close()
+        stats = POOL_STATS.stats(self.engine.pool)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checked_in"], 1)
+
+    def test_timeout(self):
+        """ Count the checkouts that gave up waiting """
+        connections = [self.engine.connect(), self.engine.connect()]
+        self.assertRaises(sqlalchemy.exc.TimeoutError, self.engine.connect)
+        stats = POOL_STATS.stats(self.engine.pool)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["waits"], 3)
+        self.assertGreaterEqual(stats["wait_seconds_max"], 0.01)
+        for connection in connections:
+            connection.close()
+
+    def test_other_pools(self):
+        """ Count the connections in use of a pool without a size """
+        stats = PoolStats()
+        engine = sqlalchemy.create_engine("sqlite://")
+        stats.attach(engine)
+        with engine.connect():
+            self.assertEqual(stats.stats(engine.pool)["checked_out"], 1)
+        self.assertEqual(stats.stats(engine.pool)["checked_out"], 0)
@@ -3,13 +3,17 @@ Inventory API Service Test Suite
 Test cases can be run with the following:
 """
 import os
+import re
 import sys
+import json
 import logging
+import threading
 from unittest import TestCase
 from flask_api import status
 
 from service import app, routes, keys
-from service.model import Inventory, DB
+from service.model import Inventory, DB, CACHE
+from service.events import EVENTS
 from .inventory_factory import InventoryFactory
 
 DATABASE_URI = os.getenv(keys.KEY_DB_URI, keys.DATABASE_URI_LOCAL)
@@ -34,19 +38,26 @@ class InventoryAPITest(TestCase):
     @classmethod
     def tearDownClass(cls):
         """ Run once after all tests """
-        DB.session.close()
+        with app.app_context():
+            DB.session.close()
 
     def setUp(self):
         """ Runs before each test """
+        # Each test runs in its own app context, like a request
+        self.context = app.app_context()
+        self.context.push()
         self.app = app.test_client()
         self.headers = {
             'X-Api-Key': app.config[keys.KEY_API]
         }
         DB.drop_all()  # clean up the last tests
         DB.create_all()  # create new tables
+        CACHE.clear()
+        EVENTS.clear()
 
     def tearDown(self):
         DB.session.remove()
+        self.context.pop()
 
 ######################################################################
 #  T E S T   C A S E S
@@ -140,6 +151,39 @@ class InventoryAPITest(TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
 
+    def test_create_inventory_bulk(self):
+        """ Create many inventories in one request """
+        existing = self._create_inventories(1)[0]
+        records = [InventoryFactory().serialize() for _ in range(5)]
+        resp = self.app.post("/api/inventory/bulk", json=records,
+                             content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        results = resp.get_json()
+        self.assertEqual([res[keys.KEY_STATUS] for res in results], [keys.STATUS_CREATED]*5)
+        resp = self.app.get("/api/inventory")
+        self.assertEqual(len(resp.get_json()), 6)
+
+        invalid = InventoryFactory().serialize()
+        invalid[keys.KEY_CND] = "broken"
+        fresh = InventoryFactory().serialize()
+        records = [existing.serialize(), invalid, fresh, fresh]
+        resp = self.app.post("/api/inventory/bulk", json=records,
+                             content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        results = resp.get_json()
+        self.assertEqual([res[keys.KEY_STATUS] for res in results],
+                         [keys.STATUS_CONFLICT, keys.STATUS_INVALID,
+                          keys.STATUS_CREATED, keys.STATUS_CONFLICT])
+        self.assertEqual(results[2][keys.KEY_PID], fresh[keys.KEY_PID])
+        resp = self.app.get("/api/inventory")
+        self.assertEqual(len(resp.get_json()), 7)
+
+    def test_create_inventory_bulk_bad_req(self):
+        """ Create many inventories WITHOUT a list """
+        resp = self.app.post("/api/inventory/bulk", json=InventoryFactory().serialize(),
+                             content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_errors(self):
         """ Testing Create Error: [DataValidationError] """
         data = {
@@ -169,6 +213,162 @@ class InventoryAPITest(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertEqual(len(resp.get_json()), 0)
 
+    def test_list_inventory_paginated(self):
+        """Page through the entire inventory list"""
+        N = 7
+        self._create_inventories(N)
+        seen = []
+        url = "/api/inventory?limit=3"
+        pages = 0
+        while url:
+            resp = self.app.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            data = resp.get_json()
+            self.assertTrue(len(data) <= 3)
+            seen.extend((inv[keys.KEY_PID], inv[keys.KEY_CND]) for inv in data)
+            pages += 1
+            url = None
+            link = resp.headers.get("Link")
+            if link:
+                url = link[link.index("<")+1:link.index(">")]
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), N)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_list_inventory_bad_paging(self):
+        """Get the inventory list with invalid paging parameters"""
+        resp = self.app.get("/api/inventory?limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get("/api/inventory?limit={}".format(keys.PAGE_SIZE_MAX+1))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get("/api/inventory?cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_low_stock(self):
+        """List the inventories to restock"""
+        for pid in range(1, 5):
+            Inventory(product_id=pid, condition="new", quantity=pid,
+                      restock_level=2, available=1).create()
+        Inventory(product_id=1, condition="used", quantity=0,
+                  restock_level=0, available=1).create()
+        resp = self.app.get("/api/inventory/low-stock", query_string={keys.KEY_LIMIT: 2})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers[keys.KEY_QUERY_INDEX_HEADER], "ix_inventory_low_stock")
+        data = resp.get_json()
+        self.assertEqual([(inv[keys.KEY_PID], inv[keys.KEY_CND]) for inv in data],
+                         [(1, "new"), (1, "used")])
+        link = resp.headers["Link"]
+        next_url = link[link.index("<") + 1:link.index(">")]
+        resp = self.app.get(next_url)
+        self.assertEqual([inv[keys.KEY_PID] for inv in resp.get_json()], [2])
+        self.assertNotIn("Link", resp.headers)
+        resp = self.app.get("/api/inventory/low-stock", query_string={keys.KEY_CND: "new"})
+        self.assertEqual([inv[keys.KEY_PID] for inv in resp.get_json()], [1, 2])
+        self.assertEqual(resp.headers[keys.KEY_QUERY_INDEX_HEADER],
+                         "ix_inventory_low_stock_condition")
+        resp = self.app.get("/api/inventory/low-stock", query_string={keys.KEY_CND: "used"})
+        self.assertEqual(len(resp.get_json()), 1)
+        resp = self.app.get("/api/inventory/low-stock", query_string={keys.KEY_CURSOR: "bad"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_inventory_events(self):
+        """Stream the inventory changes"""
+        app.config[keys.KEY_SSE_SECONDS] = 0
+        resp = self.app.get("/api/inventory/events")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, keys.KEY_CONTENT_TYPE_SSE)
+        body = resp.get_data(as_text=True)
+        self.assertNotIn("event:", body)
+        last_id = re.search(r"^id: (\S+)$", body, re.M).group(1)
+        inventory = self._create_inventories(1)[0]
+        resp = self.app.get("/api/inventory/events",
+                            headers={keys.KEY_LAST_EVENT_ID_HEADER: last_id})
+        body = resp.get_data(as_text=True)
+        self.assertIn("event: {}\n".format(keys.EVENT_CREATE), body)
+        data = json.loads(re.search(r"^data: (.+)$", body, re.M).group(1))
+        self.assertEqual(data[keys.KEY_PID], inventory.product_id)
+        resp = self.app.get("/api/inventory/events", query_string={keys.KEY_LAST_EVENT_ID: "bad"})
+        self.assertIn("event: {}\n".format(keys.EVENT_RESET), resp.get_data(as_text=True))
+
+    def test_stream_inventory_events_limit(self):
+        """Refuse the event streams past SSE_MAX_STREAMS"""
+        app.config[keys.KEY_SSE_SECONDS] = 0
+        app.config[keys.KEY_SSE_MAX_STREAMS] = 1
+        try:
+            close = EVENTS.open_stream(1)
+            resp = self.app.get("/api/inventory/events")
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertIn("Retry-After", resp.headers)
+            close()
+            resp = self.app.get("/api/inventory/events")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(EVENTS.streams, 1)
+            resp.get_data()
+            self.assertEqual(EVENTS.streams, 0)
+        finally:
+            app.config[keys.KEY_SSE_MAX_STREAMS] = keys.SSE_MAX_STREAMS_DEFAULT
+
+    def test_get_pool_stats(self):
+        """Get the connection pool statistics"""
+        self._create_inventories(1)
+        resp = self.app.get("/api/inventory/pool")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertGreater(data["checkouts"], 0)
+        self.assertGreaterEqual(data["checked_out"], 0)
+
+    def test_metrics(self):
+        """Get the request and database metrics"""
+        self._create_inventories(1)
+        self.app.get("/api/inventory/0/condition/new")
+        resp = self.app.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "text/plain")
+        text = resp.get_data(as_text=True)
+        self.assertIn('inventory_http_request_duration_seconds_count{method="POST",'
+                      'route="/api/inventory",status="201"}', text)
+        self.assertIn('route="/api/inventory/<int:product_id>/condition/<string:condition>",'
+                      'status="404"', text)
+        self.assertIn('inventory_http_requests_in_flight{method="GET",route="/metrics"} 1', text)
+        self.assertIn('inventory_db_query_duration_seconds_count{operation="insert"}', text)
+
+    def test_request_log(self):
+        """Log one structured line per failed request"""
+        with self.assertLogs("service.requests", logging.INFO) as logs:
+            self.app.get("/api/inventory/0/condition/new")
+        fields = json.loads(logs.records[0].getMessage()[len("request "):])
+        self.assertEqual(fields["status"], status.HTTP_404_NOT_FOUND)
+        self.assertEqual(fields["route"],
+                         "/api/inventory/<int:product_id>/condition/<string:condition>")
+
+    def test_get_inventory_summary(self):
+        """Get the inventory totals by condition and availability"""
+        inventories = self._create_inventories(5)
+        resp = self.app.get("/api/inventory/summary")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(sum(total[keys.KEY_RECORDS] for total in data), 5)
+        self.assertEqual(sum(total[keys.KEY_QTY] for total in data),
+                         sum(inv.quantity for inv in inventories))
+        resp = self.app.delete("/api/inventory/{}/condition/{}".format(
+            inventories[0].product_id, inventories[0].condition))
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        data = self.app.get("/api/inventory/summary").get_json()
+        self.assertEqual(sum(total[keys.KEY_RECORDS] for total in data), 4)
+
+    def test_export_inventory(self):
+        """Export the entire inventory as NDJSON"""
+        N = 5
+        inventories = self._create_inventories(N)
+        resp = self.app.get("/api/inventory/export")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, keys.KEY_CONTENT_TYPE_NDJSON)
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), N)
+        exported = [json.loads(line) for line in lines]
+        expected = sorted((inv.product_id, inv.condition) for inv in inventories)
+        self.assertEqual([(inv[keys.KEY_PID], inv[keys.KEY_CND]) for inv in exported], expected)
+
     def test_get_inventory_by_product_id(self):
         """Get inventory details by [product_id]"""
         N = 10
@@ -257,6 +457,46 @@ class InventoryAPITest(TestCase):
             count_1 = len(resp.get_json())
             self.assertEqual(count_1, n_1)
 
+    def test_get_inventory_by_filters(self):
+        """Get inventory details by a combination of filters"""
+        inventories = self._create_inventories(10)
+        pids = [inv.product_id for inv in inventories[:6]]
+        expected = [inv for inv in inventories[:6] if inv.available == 1 and
+                    inv.quantity >= 10 and inv.quantity <= 40]
+        resp = self.app.get("/api/inventory?product_id={}&available=1&quantity=10&quantity_max=40"
+                            .format(",".join(str(pid) for pid in pids)))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(sorted(inv[keys.KEY_PID] for inv in data),
+                         sorted(inv.product_id for inv in expected))
+        self.assertIn(keys.KEY_QUERY_INDEX_HEADER, resp.headers)
+
+        resp = self.app.get("/api/inventory?condition=new,used")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.get_json()),
+                         len([inv for inv in inventories if inv.condition != "open box"]))
+
+        resp = self.app.get("/api/inventory?available=2")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_inventory_require_index(self):
+        """Serve the filters from an index when one is required"""
+        self._create_inventories(2)
+        app.config[keys.KEY_QUERY_REQUIRE_INDEX] = True
+        try:
+            # The page would sort the records matching the search on (available, quantity)
+            resp = self.app.get("/api/inventory?quantity_max=10&available=1")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            resp = self.app.get("/api/inventory")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.headers.get(keys.KEY_QUERY_INDEX_HEADER), "inventory_pkey")
+            resp = self.app.get("/api/inventory?condition=new")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.headers.get(keys.KEY_QUERY_INDEX_HEADER),
+                             "ix_inventory_condition_product")
+        finally:
+            app.config[keys.KEY_QUERY_REQUIRE_INDEX] = False
+
     def test_get_inventory_by_pid_condition(self):
         """Get inventory details by [product_id, condition]"""
         test_inventory = self._create_inventories(1)[0]
@@ -275,6 +515,105 @@ class InventoryAPITest(TestCase):
                             content_type=keys.KEY_CONTENT_TYPE_JSON)
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_get_inventory_cached(self):
+        """Get inventory details through the record cache"""
+        test_inventory = self._create_inventories(1)[0]
+        url = "/api/inventory/{}/condition/{}".format(test_inventory.product_id,
+                                                      test_inventory.condition)
+        before = self.app.get("/api/inventory/cache").get_json()
+        for _ in range(3):
+            resp = self.app.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.put(url, json={keys.KEY_QTY: 7}, content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.get(url)
+        self.assertEqual(resp.get_json()[keys.KEY_QTY], 7)
+        resp = self.app.get("/api/inventory/cache")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        stats = resp.get_json()
+        self.assertEqual(stats["hits"] - before["hits"], 2)
+        self.assertEqual(stats["misses"] - before["misses"], 2)
+
+    def test_get_inventory_etag(self):
+        """Get inventory details conditionally with If-None-Match"""
+        test_inventory = self._create_inventories(1)[0]
+        url = "/api/inventory/{}/condition/{}".format(test_inventory.product_id,
+                                                      test_inventory.condition)
+        resp = self.app.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        etag = resp.headers[keys.KEY_ETAG_HEADER]
+        resp = self.app.get(url, headers={keys.KEY_IF_NONE_MATCH_HEADER: etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.data, b"")
+        self.assertEqual(resp.headers[keys.KEY_ETAG_HEADER], etag)
+        resp = self.app.get(url, headers={keys.KEY_IF_NONE_MATCH_HEADER: etag,
+                                          keys.KEY_MASK_HEADER: keys.KEY_QTY})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers[keys.KEY_ETAG_HEADER], etag)
+        quantity = (test_inventory.quantity + 1) % keys.QTY_HIGH
+        resp = self.app.put(url, json={keys.KEY_QTY: quantity},
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.get(url, headers={keys.KEY_IF_NONE_MATCH_HEADER: etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers[keys.KEY_ETAG_HEADER], etag)
+
+    def test_update_inventory_if_match(self):
+        """Update an inventory only while it matches If-Match"""
+        test_inventory = self._create_inventories(1)[0]
+        url = "/api/inventory/{}/condition/{}".format(test_inventory.product_id,
+                                                      test_inventory.condition)
+        etag = self.app.get(url).headers[keys.KEY_ETAG_HEADER]
+        quantity = (test_inventory.quantity + 1) % keys.QTY_HIGH
+        resp = self.app.put(url, json={keys.KEY_QTY: quantity},
+                            headers={keys.KEY_IF_MATCH_HEADER: '"outdated"'},
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put(url, json={keys.KEY_QTY: quantity},
+                            headers={keys.KEY_IF_MATCH_HEADER: etag},
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()[keys.KEY_QTY], quantity)
+        new_etag = resp.headers[keys.KEY_ETAG_HEADER]
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(self.app.get(url).headers[keys.KEY_ETAG_HEADER], new_etag)
+        # The second editor of the same version loses
+        resp = self.app.put(url, json={keys.KEY_QTY: test_inventory.quantity},
+                            headers={keys.KEY_IF_MATCH_HEADER: etag},
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(url).get_json()[keys.KEY_QTY], quantity)
+
+    def test_list_inventory_etag(self):
+        """List inventories conditionally with If-None-Match"""
+        test_inventory = self._create_inventories(3)[0]
+        resp = self.app.get("/api/inventory")
+        etag = resp.headers[keys.KEY_ETAG_HEADER]
+        resp = self.app.get("/api/inventory", headers={keys.KEY_IF_NONE_MATCH_HEADER: etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.data, b"")
+        quantity = (test_inventory.quantity + 1) % keys.QTY_HIGH
+        resp = self.app.put("/api/inventory/{}/condition/{}".format(
+            test_inventory.product_id, test_inventory.condition),
+                            json={keys.KEY_QTY: quantity}, content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.get("/api/inventory", headers={keys.KEY_IF_NONE_MATCH_HEADER: etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.get_json()), 3)
+
+    def test_get_inventory_fields_mask(self):
+        """Get inventory details with a fields mask"""
+        test_inventory = self._create_inventories(1)[0]
+        mask = {keys.KEY_MASK_HEADER: "{},{}".format(keys.KEY_PID, keys.KEY_QTY)}
+        expected = {keys.KEY_PID: test_inventory.product_id, keys.KEY_QTY: test_inventory.quantity}
+        resp = self.app.get("/api/inventory/{}/condition/{}".format(test_inventory.product_id,
+                            test_inventory.condition), headers=mask)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), expected)
+        resp = self.app.get("/api/inventory", headers=mask)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), [expected])
+
     ##################################################################
     # Testing DELETE
     def test_delete_inventory(self):
@@ -286,6 +625,43 @@ class InventoryAPITest(TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_delete_inventory_by_filter(self):
+        """Delete the inventories matching a filter"""
+        inventories = self._create_inventories(10)
+        used = len([inv for inv in inventories if inv.condition == "used"])
+        resp = self.app.delete("/api/inventory?condition=used")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()[keys.KEY_DELETED], used)
+        resp = self.app.get("/api/inventory")
+        self.assertEqual(len(resp.get_json()), 10 - used)
+        resp = self.app.get("/api/inventory?condition=used")
+        self.assertEqual(len(resp.get_json()), 0)
+
+        resp = self.app.delete("/api/inventory")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.delete("/api/inventory?available=3")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_inventory_bulk(self):
+        """Delete a list of inventories"""
+        inventories = self._create_inventories(5)
+        body = [{keys.KEY_PID: inv.product_id, keys.KEY_CND: inv.condition}
+                for inv in inventories[:3]]
+        body.append({keys.KEY_PID: 99999, keys.KEY_CND: "new"})
+        resp = self.app.delete("/api/inventory/bulk", json=body,
+                               content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()[keys.KEY_DELETED], 3)
+        resp = self.app.get("/api/inventory")
+        self.assertEqual(len(resp.get_json()), 2)
+
+        resp = self.app.delete("/api/inventory/bulk", json=[{keys.KEY_PID: 1}],
+                               content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.delete("/api/inventory/bulk", json={keys.KEY_PID: 1},
+                               content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     ##################################################################
     # Testing PUT
     def test_update_inventory(self):
@@ -390,6 +766,88 @@ class InventoryAPITest(TestCase):
             else:
                 self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
+    def test_concurrent_requests(self):
+        """Serve concurrent requests, each with its own session"""
+        Inventory(product_id=1, condition="new", quantity=1, restock_level=1, available=1).create()
+        url = "/api/inventory/1/condition/new/restock"
+        idents = set()
+        errors = []
+
+        def worker():
+            idents.add(threading.get_ident())
+            client = app.test_client()
+            for _ in range(5):
+                resp = client.put(url, json={keys.KEY_AMT: 1},
+                                  content_type=keys.KEY_CONTENT_TYPE_JSON)
+                if resp.status_code != status.HTTP_200_OK:
+                    errors.append(resp.status_code)
+                resp = client.get("/api/inventory/1/condition/new")
+                if resp.status_code != status.HTTP_200_OK:
+                    errors.append(resp.status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        CACHE.clear()
+        resp = self.app.get("/api/inventory/1/condition/new")
+        self.assertEqual(resp.get_json()[keys.KEY_QTY], 41)
+        # The session of every request was removed when it ended
+        self.assertFalse(idents & set(DB.session.registry.registry))
+
+    def test_update_inventory_restock_bound(self):
+        """Restock an inventory's Quantity above the maximum"""
+        test_inventory = InventoryFactory()
+        test_inventory.quantity = keys.QTY_HIGH - 1
+        resp = self.app.post(
+            "/api/inventory", json=test_inventory.serialize(), content_type=keys.KEY_CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        url = "/api/inventory/{}/condition/{}/restock".format(test_inventory.product_id,
+                                                               test_inventory.condition)
+        resp = self.app.put(url, json={keys.KEY_AMT: 1}, content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()[keys.KEY_QTY], keys.QTY_HIGH)
+        resp = self.app.put(url, json={keys.KEY_AMT: 1}, content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_restock_inventory_bulk(self):
+        """Restock many inventories in one request"""
+        inventories = self._create_inventories(2)
+        for inv in inventories:
+            resp = self.app.put(
+                "/api/inventory/{}/condition/{}".format(inv.product_id, inv.condition),
+                json={keys.KEY_QTY: 10}, content_type=keys.KEY_CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        first, second = [{keys.KEY_PID: inv.product_id, keys.KEY_CND: inv.condition}
+                         for inv in inventories]
+        body = [dict(first, amount=5), dict(second, amount=1), dict(first, amount=2)]
+        resp = self.app.put("/api/inventory/restock", json=body,
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([res[keys.KEY_QTY] for res in resp.get_json()], [15, 11, 17])
+
+        body = [dict(first, amount=keys.QTY_HIGH), dict(second, amount=0),
+                {keys.KEY_PID: 99999, keys.KEY_CND: "new", keys.KEY_AMT: 1},
+                {keys.KEY_AMT: 1}, dict(second, amount=3)]
+        resp = self.app.put("/api/inventory/restock", json=body,
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        results = resp.get_json()
+        self.assertEqual([res[keys.KEY_STATUS] for res in results],
+                         [keys.STATUS_INVALID, keys.STATUS_INVALID, keys.STATUS_NOT_FOUND,
+                          keys.STATUS_INVALID, keys.STATUS_RESTOCKED])
+        self.assertEqual([res[keys.KEY_INDEX] for res in results], list(range(5)))
+        resp = self.app.get("/api/inventory/{}/condition/{}".format(
+            second[keys.KEY_PID], second[keys.KEY_CND]))
+        self.assertEqual(resp.get_json()[keys.KEY_QTY], 14)
+
+        resp = self.app.put("/api/inventory/restock", json=first,
+                            content_type=keys.KEY_CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_updates_not_found(self):
         """Testing Updates NOT found"""
         pid = 9999